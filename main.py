@@ -1,5 +1,10 @@
 # main.py
 
+import time
+
+# Момент запуска процесса - для отчета о времени старта (включая импорты ниже)
+_STARTED_AT = time.perf_counter()
+
 import json
 import os
 import sys
@@ -13,17 +18,29 @@ from rag_system.config import (
     KNOWLEDGE_BASE_JSON_PATH,
     MAIN_RETRIEVER_MODEL,
     SECONDARY_RETRIEVER_MODEL,
-    DATA_DIR
+    WARMUP_MODELS,
+    ensure_directories
 )
 from rag_system.core.managers import EmbeddingModelManager, KnowledgeBaseManager
+from rag_system.core.metrics import configure_logging, metrics
+from rag_system.core.startup import StartupProfiler
+
+# Время импорта модулей системы (без torch/sentence_transformers: они импортируются при загрузке модели)
+_IMPORT_SECONDS = time.perf_counter() - _STARTED_AT
 
 def main():
+    # Уровень подробности логов задается LOG_LEVEL в config.py (DEBUG - включая каждый найденный документ)
+    configure_logging()
+    ensure_directories()
+    profiler = StartupProfiler(_STARTED_AT)
+    profiler.record('импорт модулей', _IMPORT_SECONDS)
+
     # --- 1. Инициализация системы ретривера (выполняется ОДИН РАЗ при запуске приложения) ---
     print("--- Инициализация системы ретривера ---")
 
     print(f"Попытка загрузить данные из '{KNOWLEDGE_BASE_JSON_PATH}'...")
     try:
-        with open(KNOWLEDGE_BASE_JSON_PATH, 'r', encoding='utf-8') as f:
+        with profiler.phase('загрузка экспорта'), open(KNOWLEDGE_BASE_JSON_PATH, 'r', encoding='utf-8') as f:
             # Предполагаем, что JSON-файл содержит ключ "documents", как и наш фиктивный
             loaded_data = json.load(f)
             if "documents" in loaded_data:
@@ -48,50 +65,54 @@ def main():
     # 1.3. Создаем менеджер баз знаний (который использует менеджер моделей)
     knowledge_base_manager = KnowledgeBaseManager(embedding_model_manager)
 
-    # 1.4. Получаем ретриверы для каждой модели и индексируем данные
-    # Это действие также загружает/создает индексы FAISS и сохраняет их
-
-    # Для MAIN_RETRIEVER_MODEL
-    main_retriever = knowledge_base_manager.get_retriever(MAIN_RETRIEVER_MODEL)
-    if main_retriever.index is None or len(main_retriever.documents_meta) == 0:
-        print(f"\nИндекс для '{MAIN_RETRIEVER_MODEL}' пуст или не удалось загрузить. Добавляем документы...")
-        # !!! ИСПРАВЛЕНИЕ ЗДЕСЬ: Используем уже загруженные knowledge_base_data !!!
-        main_retriever.add_documents_to_index(knowledge_base_data)
-    else:
-        print(f"\nИндекс для '{MAIN_RETRIEVER_MODEL}' уже содержит документы, пропускаем добавление.")
-
-    # Для SECONDARY_RETRIEVER_MODEL
-    secondary_retriever = knowledge_base_manager.get_retriever(SECONDARY_RETRIEVER_MODEL)
-    if secondary_retriever.index is None or len(secondary_retriever.documents_meta) == 0:
-        print(f"\nИндекс для '{SECONDARY_RETRIEVER_MODEL}' пуст или не удалось загрузить. Добавляем документы...")
-        # !!! ИСПРАВЛЕНИЕ ЗДЕСЬ: Используем уже загруженные knowledge_base_data !!!
-        secondary_retriever.add_documents_to_index(knowledge_base_data)
-    else:
-        print(f"\nИндекс для '{SECONDARY_RETRIEVER_MODEL}' уже содержит документы, пропускаем добавление.")
+    # 1.4. Получаем ретриверы для каждой модели и синхронизируем индексы с экспортом
+    # Это действие также загружает/создает индексы FAISS и сохраняет их.
+    # Синхронизация идемпотентна: пересчитываются только новые/измененные товары, удаленные - убираются из индекса.
+    # Модели загружаются лениво: если экспорт не изменился, синхронизация не требует загрузки весов модели.
+    for model_name in (MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL):
+        with profiler.phase(f"открытие индекса {model_name}"):
+            retriever = knowledge_base_manager.get_retriever(model_name)
+        print(f"\nСинхронизация индекса для '{model_name}' с экспортом...")
+        with profiler.phase(f"синхронизация {model_name}"):
+            print(f"Результат синхронизации: {retriever.sync_documents(knowledge_base_data)}")
+
+    with profiler.phase('лексический индекс'):
+        # Записи товаров, удаленных из экспорта, больше не нужны ни одной модели
+        knowledge_base_manager.prune_meta_store()
+
+        # Лексический индекс (BM25 + артикулы) для гибридного поиска; перестраивается только при изменении экспорта
+        knowledge_base_manager.sync_lexical_index(knowledge_base_data)
+
+    # Прогрев моделей из WARMUP_MODELS; остальные загрузятся при первом запросе к ним
+    for model_name, seconds in knowledge_base_manager.warm_up(WARMUP_MODELS).items():
+        profiler.record(f"прогрев {model_name}", seconds)
 
     print("\n--- Система ретривера готова к работе! ---")
+    print(f"Время запуска:\n{profiler.report()}")
+    load_times = embedding_model_manager.get_load_times()
+    if load_times:
+        print(f"В том числе загрузка моделей: {', '.join(f'{name}: {seconds:.2f} с' for name, seconds in load_times.items())}")
 
     # --- 2. Пример интерактивного использования (имитация запросов пользователя) ---
     print("\nВведите запросы для поиска тренировок. Введите 'exit' для выхода.")
     while True:
         user_query = input("\nВаш запрос (русский): ")
         if user_query.lower() == 'exit':
+            print(f"Статистика кэша эмбеддингов: {embedding_model_manager.get_cache_stats()}")
+            print(f"Метрики (включая решения маршрутизатора): {metrics.snapshot()['counters']}")
+            embedding_model_manager.save_caches()
             break
 
         # --- Здесь мы имитируем получение контекста пользователя из БД ---
         user_goal = "набор массы"
         print(f" (Имитация: Цель пользователя - '{user_goal}')")
 
-        # --- Выбор ретривера для текущего запроса ---
-        if "yoga" in user_query.lower() or "english" in user_query.lower() or "flexibility" in user_query.lower():
-            current_retriever = secondary_retriever
-            print(f" Используем ретривер на базе модели: {SECONDARY_RETRIEVER_MODEL}")
-        else:
-            current_retriever = main_retriever
-            print(f" Используем ретривер на базе модели: {MAIN_RETRIEVER_MODEL}")
-
         # --- Выполнение Retrieval (Поиск релевантных документов) ---
-        retrieved_documents = current_retriever.retrieve(user_query, top_k=3)
+        # Модель выбирает маршрутизатор (письменность запроса + классификатор по журналу запросов),
+        # поэтому запрос кодируется одной моделью, а не каждой
+        retrieved_documents, route = knowledge_base_manager.retrieve_routed(user_query, top_k=3)
+        print(f" Используем ретривер на базе модели: {', '.join(route.model_names)} "
+              f"(причина: {route.reason}, уверенность: {route.confidence:.2f})")
 
         print("\n--- Найденные релевантные тренировки (для контекста LLM) ---")
         if retrieved_documents:
@@ -0,0 +1,63 @@
+# rag_system/benchmarks/index_recall.py
+#
+# Отчет recall@k / латентность для типов индексов FAISS относительно точного поиска (Flat)
+# на эмбеддингах реальной модели и экспорта. Помогает выбрать тип индекса и nprobe/ef_search в INDEX_CONFIGS.
+#
+# Пример: python -m rag_system.benchmarks.index_recall --index-types hnsw ivf_flat ivf_pq --nprobe 8 32
+
+import argparse
+import random
+
+from rag_system.config import KNOWLEDGE_BASE_JSON_PATH, MAIN_RETRIEVER_MODEL, INDEX_CONFIGS
+from rag_system.core.documents import extract_text
+from rag_system.core.index_factory import INDEX_TYPES, compare_with_flat, format_report
+from rag_system.core.ingest import iter_documents
+from rag_system.core.managers import EmbeddingModelManager
+from rag_system.core.metrics import configure_logging
+
+def build_index_configs(model_name: str, index_types: list[str], nprobe_values: list[int] | None,
+                        ef_search_values: list[int] | None) -> dict[str, dict]:
+    """
+    Конфигурации для сравнения: параметры модели из INDEX_CONFIGS с заменой типа индекса,
+    и по отдельной конфигурации на каждое значение nprobe (IVF) / ef_search (HNSW).
+    """
+    base = {key: value for key, value in INDEX_CONFIGS.get(model_name, {}).items() if key != 'type'}
+    configs = {}
+    for index_type in index_types:
+        if index_type.startswith(('ivf', 'opq')) and nprobe_values:
+            configs.update({f'{index_type}_nprobe{n}': dict(base, type=index_type, nprobe=n) for n in nprobe_values})
+        elif index_type == 'hnsw' and ef_search_values:
+            configs.update({f'hnsw_ef{ef}': dict(base, type=index_type, ef_search=ef) for ef in ef_search_values})
+        else:
+            configs[index_type] = dict(base, type=index_type)
+    return configs
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k и латентность типов индексов относительно точного поиска (Flat).")
+    parser.add_argument('--model', default=MAIN_RETRIEVER_MODEL)
+    parser.add_argument('--index-types', nargs='+', default=['hnsw', 'ivf_flat'], choices=INDEX_TYPES)
+    parser.add_argument('--nprobe', nargs='+', type=int, help="Значения nprobe для IVF-индексов")
+    parser.add_argument('--ef-search', nargs='+', type=int, help="Значения ef_search для HNSW")
+    parser.add_argument('--source', default=KNOWLEDGE_BASE_JSON_PATH, help="Экспорт базы знаний (.json/.jsonl)")
+    parser.add_argument('--num-queries', type=int, default=200, help="Количество запросов (названия случайных товаров)")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    configure_logging()
+
+    documents = [doc for doc in iter_documents(args.source) if extract_text(doc)]
+    texts = [extract_text(doc) for doc in documents]
+    names = [str(doc['name']) for doc in documents if doc.get('name')]
+    queries = random.Random(args.seed).sample(names, min(args.num_queries, len(names)))
+    if not texts or not queries:
+        print("Нет документов или запросов для отчета.")
+        return
+
+    # Кэш эмбеддингов не нужен: каждый текст кодируется один раз
+    model = EmbeddingModelManager().load_model(args.model, use_cache=False, lazy=False)
+    report = compare_with_flat(model.encode(texts), model.encode(queries),
+                               build_index_configs(args.model, args.index_types, args.nprobe, args.ef_search), args.top_k)
+    print(format_report(report))
+
+if __name__ == '__main__':
+    main()
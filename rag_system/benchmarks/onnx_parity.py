@@ -0,0 +1,123 @@
+# rag_system/benchmarks/onnx_parity.py
+#
+# Проверка паритета и латентности ONNX бэкенда против SentenceTransformer (PyTorch):
+#  - косинусное сходство эмбеддингов одних и тех же текстов;
+#  - пересечение top_k при поиске по Flat индексу текстов экспорта, построенному в памяти PyTorch моделью
+#    (индексы и хранилища на диске не читаются и не изменяются);
+#  - латентность одиночного запроса и пропускная способность батча.
+# Завершается с кодом 1, если паритет ниже порогов, поэтому подходит для запуска в CI перед переключением бэкенда.
+#
+# Пример: python -m rag_system.benchmarks.onnx_parity --models paraphrase-MiniLM-L6-v2 --min-cosine 0.98
+
+import argparse
+import json
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from rag_system.config import KNOWLEDGE_BASE_JSON_PATH, MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL, ONNX_QUANTIZE
+from rag_system.core.documents import extract_text
+from rag_system.core.ingest import iter_documents
+from rag_system.models.embeddings import IEmbeddingModel, SentenceTransformerEmbeddingModel
+from rag_system.models.onnx_embeddings import OnnxEmbeddingModel
+
+def _latency(model, queries: list[str], batch_size: int) -> dict:
+    single_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query])
+        single_ms.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        model.encode(queries[i:i + batch_size])
+    batch_seconds = time.perf_counter() - start
+    return {
+        'single_p50_ms': float(np.percentile(single_ms, 50)),
+        'single_p95_ms': float(np.percentile(single_ms, 95)),
+        'batch_texts_per_second': len(queries) / batch_seconds if batch_seconds else None
+    }
+
+def compare_embeddings(reference: IEmbeddingModel, candidate: IEmbeddingModel, corpus: list[str],
+                       queries: list[str], top_k: int) -> dict:
+    """
+    Сравнивает эмбеддинги запросов двух моделей и их top_k по корпусу.
+    Корпус индексируется эмбеддингами reference-модели в IndexFlatIP в памяти, как точный эталон поиска.
+    :return: Словарь 'cosine_mean', 'cosine_min' и 'overlap' (None для пустого корпуса).
+    """
+    reference_embeddings = reference.encode(queries)
+    candidate_embeddings = candidate.encode(queries)
+    cosines = (reference_embeddings * candidate_embeddings).sum(axis=1) # Оба набора L2-нормализованы
+
+    overlap = None
+    if corpus:
+        index = faiss.IndexFlatIP(reference.get_dimension())
+        index.add(reference.encode(corpus))
+        k = min(top_k, index.ntotal)
+        _, reference_ids = index.search(reference_embeddings, k)
+        _, candidate_ids = index.search(candidate_embeddings, k)
+        overlap = float(np.mean([len(set(r) & set(c)) / k for r, c in zip(reference_ids, candidate_ids)]))
+    return {'cosine_mean': float(cosines.mean()), 'cosine_min': float(cosines.min()), 'overlap': overlap}
+
+def check_model(model_name: str, corpus: list[str], queries: list[str], top_k: int, quantize: bool, batch_size: int) -> dict:
+    reference = SentenceTransformerEmbeddingModel(model_name)
+    candidate = OnnxEmbeddingModel(model_name, quantize=quantize)
+    if reference.get_dimension() == 0 or candidate.get_dimension() == 0:
+        raise RuntimeError(f"Не удалось загрузить модели для '{model_name}'.")
+
+    parity = compare_embeddings(reference, candidate, corpus, queries, top_k)
+    return {
+        'model': model_name,
+        'backend': 'onnx-int8' if quantize else 'onnx-fp32',
+        'texts': len(queries),
+        'corpus': len(corpus),
+        'cosine_mean': parity['cosine_mean'],
+        'cosine_min': parity['cosine_min'],
+        f'top{top_k}_overlap': parity['overlap'],
+        'latency_sentence_transformers': _latency(reference, queries, batch_size),
+        'latency_onnx': _latency(candidate, queries, batch_size)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Паритет и латентность ONNX бэкенда против SentenceTransformer.")
+    parser.add_argument('--models', nargs='+', default=[MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL])
+    parser.add_argument('--source', default=KNOWLEDGE_BASE_JSON_PATH, help="Экспорт, из которого берутся тексты-запросы")
+    parser.add_argument('--limit', type=int, default=200, help="Количество текстов для проверки")
+    parser.add_argument('--corpus-limit', type=int, default=2000, help="Количество документов в индексе для сравнения top_k")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--fp32', action='store_true', help="Проверять ONNX без квантизации")
+    parser.add_argument('--min-cosine', type=float, default=0.98, help="Минимально допустимое среднее косинусное сходство")
+    parser.add_argument('--min-overlap', type=float, default=0.9, help="Минимально допустимое среднее пересечение top_k")
+    parser.add_argument('--output', help="Путь к JSON-файлу с результатами")
+    args = parser.parse_args()
+
+    # Запросы: названия товаров и их описания (разная длина текста); корпус - тексты документов
+    queries, corpus = [], []
+    for doc in iter_documents(args.source):
+        if len(queries) < args.limit:
+            queries.extend(text for text in (doc.get('name'), extract_text(doc)) if text)
+        if len(corpus) < args.corpus_limit and extract_text(doc):
+            corpus.append(extract_text(doc))
+        if len(queries) >= args.limit and len(corpus) >= args.corpus_limit:
+            break
+    queries = queries[:args.limit]
+
+    quantize = ONNX_QUANTIZE and not args.fp32
+    report = [check_model(model_name, corpus, queries, args.top_k, quantize, args.batch_size) for model_name in args.models]
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = [row['model'] for row in report
+              if row['cosine_mean'] < args.min_cosine
+              or (row[f'top{args.top_k}_overlap'] is not None and row[f'top{args.top_k}_overlap'] < args.min_overlap)]
+    if failed:
+        print(f"Паритет ниже порогов для моделей: {', '.join(failed)}")
+        sys.exit(1)
+    print("Паритет ONNX бэкенда в пределах порогов.")
+
+if __name__ == '__main__':
+    main()
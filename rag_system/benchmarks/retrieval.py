@@ -0,0 +1,302 @@
+# rag_system/benchmarks/retrieval.py
+#
+# Воспроизводимый бенчмарк поиска по экспорту базы знаний:
+#  - время кодирования документов и построения индекса каждого типа;
+#  - латентность запроса (p50/p95/p99) отдельно для поиска FAISS и для полного пути "кодирование + поиск";
+#  - пропускная способность (QPS) при нескольких уровнях параллелизма;
+#  - recall@k относительно точного поиска (Flat);
+#  - RSS процесса после построения индексов.
+# Параметры индексов берутся из INDEX_CONFIGS модели (с заменой типа). С --through-retriever запросы идут
+# через LocalKnowledgeBaseRetriever (кодирование, поиск, метаданные, фильтры --filters) на индексе во временном каталоге.
+# Результаты сохраняются в JSON вместе с окружением (версии библиотек, CPU, параметры запуска).
+# С --baseline сравнивает результаты с предыдущим запуском и завершается с кодом 1 при регрессии.
+#
+# Пример: python -m rag_system.benchmarks.retrieval --index-types flat hnsw ivf_flat --output bench.json
+#         python -m rag_system.benchmarks.retrieval --queries queries.jsonl --baseline bench.json
+#         python -m rag_system.benchmarks.retrieval --through-retriever --filters '{"price_max": 10000}'
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from rag_system.config import KNOWLEDGE_BASE_JSON_PATH, MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL, LEXICAL_SKU_FIELD, INDEX_CONFIGS
+from rag_system.core.attributes import AttributeStore
+from rag_system.core.documents import extract_text
+from rag_system.core.index_factory import INDEX_TYPES, build_index, exact_search, recall_at_k, latency_percentiles, resolve_index_params
+from rag_system.core.ingest import iter_documents
+from rag_system.core.managers import EmbeddingModelManager
+from rag_system.core.meta_store import DocumentMetaStore
+from rag_system.core.retriever import LocalKnowledgeBaseRetriever
+from rag_system.benchmarks.worker_memory import read_memory_kb
+
+# Поля JSONL-файла с запросами, из которых берется текст запроса (первое непустое)
+QUERY_FIELDS = ('query', 'title', 'text', 'body')
+
+def load_queries(path: str, limit: int) -> list[str]:
+    """Читает запросы из JSONL-файла (по одному JSON-объекту на строку)."""
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = record if isinstance(record, str) else next((record[k] for k in QUERY_FIELDS if record.get(k)), None)
+            if text:
+                queries.append(str(text))
+            if len(queries) >= limit:
+                break
+    return queries
+
+def generate_queries(documents: list[dict], limit: int, seed: int) -> list[str]:
+    """
+    Генерирует набор запросов из самих документов: названия, артикулы и фрагменты описаний.
+    Выборка детерминирована при одинаковом seed и одинаковом экспорте.
+    """
+    rng = random.Random(seed)
+    queries = []
+    for doc in documents:
+        if doc.get('name'):
+            queries.append(str(doc['name']))
+        if doc.get(LEXICAL_SKU_FIELD):
+            queries.append(str(doc[LEXICAL_SKU_FIELD]))
+        words = (extract_text(doc) or '').split()
+        if len(words) > 3:
+            start = rng.randrange(0, max(1, len(words) - 8))
+            queries.append(' '.join(words[start:start + 8]))
+    rng.shuffle(queries)
+    return queries[:limit]
+
+def model_index_config(model_name: str, index_type: str) -> dict:
+    """Конфигурация индекса модели из INDEX_CONFIGS с заменой типа индекса."""
+    return dict(INDEX_CONFIGS.get(model_name, {}), type=index_type)
+
+def _measure_throughput(handle, queries: list[str], concurrency: int) -> float:
+    """QPS обработчика одного запроса handle(query) при заданном числе параллельных клиентов."""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(handle, queries))
+        elapsed = time.perf_counter() - start
+    return len(queries) / elapsed if elapsed else 0.0
+
+def benchmark_model(model, texts: list[str], queries: list[str], index_types: list[str],
+                    top_k: int, concurrency_levels: list[int]) -> list[dict]:
+    """
+    Прогоняет бенчмарк для одной модели по всем типам индексов.
+    :return: Строки отчета (по одной на тип индекса).
+    """
+    start = time.perf_counter()
+    base_embeddings = np.ascontiguousarray(model.encode(texts), dtype='float32')
+    encode_documents_seconds = time.perf_counter() - start
+    query_embeddings = np.ascontiguousarray(model.encode(queries), dtype='float32')
+    exact_ids = exact_search(base_embeddings, query_embeddings, top_k)
+
+    encode_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query])
+        encode_ms.append((time.perf_counter() - start) * 1000)
+
+    report = []
+    for index_type in index_types:
+        index_config = model_index_config(model.get_name(), index_type)
+        start = time.perf_counter()
+        index = build_index(base_embeddings.shape[1], index_config, base_embeddings)
+        index.add(base_embeddings)
+        build_seconds = time.perf_counter() - start
+
+        search_ms = []
+        found_ids = np.empty_like(exact_ids)
+        for row in range(len(query_embeddings)):
+            start = time.perf_counter()
+            _, ids = index.search(query_embeddings[row:row + 1], top_k)
+            search_ms.append((time.perf_counter() - start) * 1000)
+            found_ids[row] = ids[0]
+        end_to_end_ms = [e + s for e, s in zip(encode_ms, search_ms)]
+
+        report.append({
+            'model': model.get_name(),
+            'index_type': index_type,
+            'mode': 'index',
+            'index_params': resolve_index_params(index_config),
+            'documents': len(texts),
+            'queries': len(queries),
+            f'recall@{top_k}': recall_at_k(found_ids, exact_ids),
+            'encode_documents_seconds': encode_documents_seconds,
+            'build_seconds': build_seconds,
+            'index_bytes': len(faiss.serialize_index(index)),
+            'search_latency': latency_percentiles(search_ms),
+            'end_to_end_latency': latency_percentiles(end_to_end_ms),
+            'qps': {str(c): _measure_throughput(lambda query: index.search(model.encode([query]), top_k), queries, c)
+                    for c in concurrency_levels},
+            **read_memory_kb()
+        })
+    return report
+
+def benchmark_retriever(model, documents: list[dict], queries: list[str], index_types: list[str], top_k: int,
+                        concurrency_levels: list[int], filters: dict | None = None) -> list[dict]:
+    """
+    Прогоняет бенчмарк через LocalKnowledgeBaseRetriever: индекс, хранилища метаданных и атрибутов
+    строятся во временном каталоге (рабочие индексы не затрагиваются).
+    :return: Строки отчета (по одной на тип индекса) с латентностью и QPS полного пути retrieve.
+    """
+    report = []
+    for index_type in index_types:
+        index_config = model_index_config(model.get_name(), index_type)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store_dir = os.path.join(tmp_dir, 'documents')
+            retriever = LocalKnowledgeBaseRetriever(model, index_config, meta_store=DocumentMetaStore(store_dir),
+                                                    use_mmap=False, attribute_store=AttributeStore(store_dir), index_dir=tmp_dir)
+            start = time.perf_counter()
+            retriever.sync_documents(documents)
+            build_seconds = time.perf_counter() - start
+
+            retrieve_ms = []
+            for query in queries:
+                start = time.perf_counter()
+                retriever.retrieve(query, top_k, filters)
+                retrieve_ms.append((time.perf_counter() - start) * 1000)
+
+            report.append({
+                'model': model.get_name(),
+                'index_type': index_type,
+                'mode': 'retriever',
+                'index_params': resolve_index_params(index_config),
+                'filters': filters,
+                'documents': retriever.document_count,
+                'queries': len(queries),
+                'build_seconds': build_seconds,
+                'end_to_end_latency': latency_percentiles(retrieve_ms),
+                'qps': {str(c): _measure_throughput(lambda query: retriever.retrieve(query, top_k, filters), queries, c)
+                        for c in concurrency_levels},
+                **read_memory_kb()
+            })
+    return report
+
+def environment_info(args: argparse.Namespace) -> dict:
+    """Окружение запуска: нужно, чтобы сравнивать только сопоставимые результаты."""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'faiss': getattr(faiss, '__version__', None),
+        'numpy': np.__version__,
+        'faiss_omp_threads': faiss.omp_get_max_threads(),
+        'args': vars(args)
+    }
+
+def compare_with_baseline(results: list[dict], baseline: list[dict], top_k: int,
+                          max_regression: float, max_recall_drop: float) -> list[str]:
+    """
+    Сравнивает результаты с предыдущим запуском.
+    :param max_regression: Допустимый относительный рост p95 латентности и падение QPS (0.2 = 20%).
+    :param max_recall_drop: Допустимое абсолютное падение recall@k.
+    :return: Список описаний регрессий (пустой, если регрессий нет).
+    """
+    # Строки сопоставляются по модели, типу индекса и режиму (в старых отчетах режим не записан - это 'index')
+    baseline_rows = {(row['model'], row['index_type'], row.get('mode', 'index')): row for row in baseline}
+    regressions = []
+    for row in results:
+        old = baseline_rows.get((row['model'], row['index_type'], row.get('mode', 'index')))
+        if old is None:
+            continue
+        name = f"{row['model']}/{row['index_type']}/{row.get('mode', 'index')}"
+        recall_key = f'recall@{top_k}'
+        if recall_key in old and recall_key in row and old[recall_key] - row[recall_key] > max_recall_drop:
+            regressions.append(f"{name}: {recall_key} {old[recall_key]:.4f} -> {row[recall_key]:.4f}")
+        for section in ('search_latency', 'end_to_end_latency'):
+            if section not in old or section not in row:
+                continue
+            old_p95, new_p95 = old[section]['p95_ms'], row[section]['p95_ms']
+            if old_p95 and new_p95 > old_p95 * (1 + max_regression):
+                regressions.append(f"{name}: {section} p95 {old_p95:.3f} -> {new_p95:.3f} мс")
+        for concurrency, new_qps in row['qps'].items():
+            old_qps = old.get('qps', {}).get(concurrency)
+            if old_qps and new_qps < old_qps * (1 - max_regression):
+                regressions.append(f"{name}: QPS при {concurrency} клиентах {old_qps:.1f} -> {new_qps:.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк латентности, пропускной способности и recall поиска.")
+    parser.add_argument('--models', nargs='+', default=[MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL])
+    parser.add_argument('--index-types', nargs='+', default=['flat', 'hnsw', 'ivf_flat'], choices=INDEX_TYPES)
+    parser.add_argument('--source', default=KNOWLEDGE_BASE_JSON_PATH, help="Экспорт базы знаний (.json/.jsonl)")
+    parser.add_argument('--queries', help="JSONL-файл с запросами (поля query/title/text/body); по умолчанию запросы генерируются из экспорта")
+    parser.add_argument('--max-documents', type=int, default=None, help="Ограничить число индексируемых документов")
+    parser.add_argument('--num-queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 8], help="Уровни параллелизма для замера QPS")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='retrieval_benchmark.json', help="Путь к JSON-файлу с результатами")
+    parser.add_argument('--baseline', help="JSON предыдущего запуска для проверки регрессий")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Допустимая относительная регрессия латентности/QPS")
+    parser.add_argument('--max-recall-drop', type=float, default=0.01, help="Допустимое абсолютное падение recall@k")
+    parser.add_argument('--through-retriever', action='store_true', help="Измерять полный путь LocalKnowledgeBaseRetriever.retrieve")
+    parser.add_argument('--filters', type=json.loads, default=None, help="Фильтры для --through-retriever (JSON-объект)")
+    args = parser.parse_args()
+
+    # Базовый запуск читается до записи результатов: --output и --baseline могут указывать на один файл
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    documents = []
+    for doc in iter_documents(args.source):
+        if extract_text(doc):
+            documents.append(doc)
+        if args.max_documents and len(documents) >= args.max_documents:
+            break
+    texts = [extract_text(doc) for doc in documents]
+    queries = load_queries(args.queries, args.num_queries) if args.queries else generate_queries(documents, args.num_queries, args.seed)
+    if not texts or not queries:
+        print("Нет документов или запросов для бенчмарка.")
+        sys.exit(1)
+    print(f"Документов: {len(texts)}, запросов: {len(queries)}.")
+
+    # Кэш эмбеддингов отключен: бенчмарк должен измерять реальное кодирование;
+    # модель загружается сразу, чтобы время загрузки весов не попало во время кодирования документов
+    embedding_manager = EmbeddingModelManager()
+    results = []
+    for model_name in args.models:
+        model = embedding_manager.load_model(model_name, use_cache=False, lazy=False)
+        if args.through_retriever:
+            rows = benchmark_retriever(model, documents, queries, args.index_types, args.top_k, args.concurrency, args.filters)
+        else:
+            rows = benchmark_model(model, texts, queries, args.index_types, args.top_k, args.concurrency)
+        for row in rows:
+            recall = row.get(f'recall@{args.top_k}')
+            print(f"{row['model']}/{row['index_type']}/{row['mode']}: "
+                  f"{f'recall@{args.top_k}={recall:.4f}, ' if recall is not None else ''}"
+                  f"p95={row['end_to_end_latency']['p95_ms']:.2f} мс, build={row['build_seconds']:.2f} с, "
+                  f"QPS={', '.join(f'{c}:{q:.1f}' for c, q in row['qps'].items())}")
+        results.extend(rows)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}.")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.top_k, args.max_regression, args.max_recall_drop)
+        if regressions:
+            print("Обнаружены регрессии относительно базового запуска:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Регрессий относительно базового запуска нет.")
+
+if __name__ == '__main__':
+    main()
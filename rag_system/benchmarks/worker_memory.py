@@ -0,0 +1,130 @@
+# rag_system/benchmarks/worker_memory.py
+#
+# Бенчмарк готовности воркеров: время холодного старта и память (RSS/PSS) на воркер
+# при обычной загрузке индексов FAISS в память и при отображении через mmap.
+#
+# Пример: python -m rag_system.benchmarks.worker_memory --workers 4 --start-method spawn
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+import numpy as np
+
+from rag_system.config import MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL
+from rag_system.core.index_factory import get_model_index_dir, read_index
+
+# Индексы, загруженные в родительском процессе (для сценария fork после загрузки)
+_preloaded_indexes: list = []
+
+def read_memory_kb() -> dict:
+    """RSS и PSS текущего процесса в КБ (PSS учитывает разделяемые страницы пропорционально; только Linux)."""
+    memory = {'rss_kb': None, 'pss_kb': None}
+    for path, key, field in (('/proc/self/status', 'rss_kb', 'VmRSS:'), ('/proc/self/smaps_rollup', 'pss_kb', 'Pss:')):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        memory[key] = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return memory
+
+def load_indexes(model_names: list[str], use_mmap: bool) -> tuple[list, float]:
+    start = time.perf_counter()
+    indexes = []
+    for model_name in model_names:
+        index, _ = read_index(os.path.join(get_model_index_dir(model_name), 'faiss_index.bin'), use_mmap)
+        indexes.append(index)
+    return indexes, time.perf_counter() - start
+
+def _touch_indexes(indexes: list, n_queries: int) -> float:
+    """Прогоняет случайные запросы, чтобы все страницы индекса были реально прочитаны."""
+    rng = np.random.default_rng(os.getpid())
+    start = time.perf_counter()
+    for index in indexes:
+        queries = rng.standard_normal((n_queries, index.d)).astype('float32')
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        index.search(queries, 10)
+    return time.perf_counter() - start
+
+def _worker(model_names, use_mmap, n_queries, barrier, results):
+    load_seconds = None
+    indexes = _preloaded_indexes
+    if not indexes:
+        indexes, load_seconds = load_indexes(model_names, use_mmap)
+    search_seconds = _touch_indexes(indexes, n_queries)
+    barrier.wait() # Все воркеры живы и загрузили индексы - PSS отражает реальное разделение страниц
+    results.put({'pid': os.getpid(), 'load_seconds': load_seconds, 'search_seconds': search_seconds, **read_memory_kb()})
+    barrier.wait() # Не завершаемся, пока остальные воркеры не сняли замеры
+
+def run(model_names: list[str], use_mmap: bool, workers: int, start_method: str, n_queries: int) -> dict:
+    """
+    Запускает воркеры и собирает их замеры.
+    При start_method='fork' индексы загружаются в родителе до запуска воркеров (как gunicorn --preload),
+    при 'spawn' каждый воркер загружает индексы сам.
+    """
+    global _preloaded_indexes
+    context = multiprocessing.get_context(start_method)
+    parent_load_seconds = None
+    _preloaded_indexes = []
+    if start_method == 'fork':
+        _preloaded_indexes, parent_load_seconds = load_indexes(model_names, use_mmap)
+
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(model_names, use_mmap, n_queries, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    worker_results = []
+    while len(worker_results) < workers:
+        try:
+            worker_results.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(process.exitcode not in (None, 0) for process in processes):
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError("Один из воркеров завершился с ошибкой, замеры прерваны.")
+    for process in processes:
+        process.join()
+    _preloaded_indexes = []
+
+    def total(key):
+        values = [result[key] for result in worker_results if result[key] is not None]
+        return sum(values) if values else None
+
+    load_times = [result['load_seconds'] for result in worker_results if result['load_seconds'] is not None]
+    return {
+        'mode': 'mmap' if use_mmap else 'heap',
+        'start_method': start_method,
+        'workers': workers,
+        'cold_start_seconds': parent_load_seconds if parent_load_seconds is not None else max(load_times),
+        'total_rss_mb': total('rss_kb') / 1024 if total('rss_kb') is not None else None,
+        'total_pss_mb': total('pss_kb') / 1024 if total('pss_kb') is not None else None,
+        'per_worker': worker_results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS на воркер и холодный старт: обычная загрузка индексов FAISS против mmap.")
+    parser.add_argument('--models', nargs='+', default=[MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--start-method', choices=['fork', 'spawn'], default='spawn')
+    parser.add_argument('--queries', type=int, default=100, help="Количество случайных запросов на индекс в каждом воркере")
+    parser.add_argument('--output', help="Путь к JSON-файлу с результатами")
+    args = parser.parse_args()
+
+    report = [run(args.models, use_mmap, args.workers, args.start_method, args.queries) for use_mmap in (False, True)]
+    for row in report:
+        print(f"{row['mode']:>5} ({row['start_method']}, {row['workers']} воркеров): холодный старт {row['cold_start_seconds']:.4f} с, "
+              f"RSS суммарно {row['total_rss_mb']} МБ, PSS суммарно {row['total_pss_mb']} МБ")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в '{args.output}'")
+
+if __name__ == '__main__':
+    main()
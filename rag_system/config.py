@@ -14,11 +14,184 @@ SECONDARY_RETRIEVER_MODEL = 'paraphrase-MiniLM-L6-v2'
 # Базовая директория для хранения FAISS индексов
 BASE_INDEX_DIR = 'faiss_indexes'
 
+# Открывать индексы FAISS через mmap только для чтения: страницы индекса разделяются между
+# воркерами (в том числе запущенными независимо), а холодный старт не зависит от размера индекса.
+# При изменении индекса (add/sync) он автоматически перечитывается в память.
+FAISS_INDEX_MMAP = False
+
+# Общее для всех моделей бинарное хранилище метаданных документов (см. rag_system/core/meta_store.py)
+DOCUMENT_STORE_DIR = os.path.join(BASE_INDEX_DIR, 'documents')
+
+# --- Гибридный лексический + векторный поиск (см. rag_system/core/lexical.py и hybrid.py) ---
+
+# Инвертированный индекс BM25, общий для всех моделей
+LEXICAL_INDEX_DIR = os.path.join(BASE_INDEX_DIR, 'lexical')
+
+# Поля экспорта, по которым строится BM25, и поле артикула для точного поиска
+LEXICAL_FIELDS = ['name', 'Артикул', 'desc_short', 'desc']
+LEXICAL_SKU_FIELD = 'Артикул'
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Количество кандидатов из каждого источника для reciprocal-rank fusion и константа RRF
+HYBRID_CANDIDATES = 50
+RRF_K = 60
+
+# --- Маршрутизация запросов между моделями (см. rag_system/core/router.py) ---
+
+# Письменности, которые понимает каждая модель (англоязычная модель не подходит для кириллицы)
+ROUTER_MODEL_SCRIPTS = {
+    MAIN_RETRIEVER_MODEL: ('cyrillic', 'latin'),
+    SECONDARY_RETRIEVER_MODEL: ('latin',),
+}
+
+# Модель для преобладающей письменности, пока классификатор не обучен на журнале запросов.
+# Латиница в русском каталоге - это обычно бренды и модели внутри русских запросов, поэтому
+# без обученного классификатора она тоже идет в многоязычную модель
+ROUTER_SCRIPT_DEFAULTS = {
+    'cyrillic': MAIN_RETRIEVER_MODEL,
+    'latin': MAIN_RETRIEVER_MODEL,
+}
+
+# Модель для запросов без букв (артикулы, числа)
+ROUTER_DEFAULT_MODEL = MAIN_RETRIEVER_MODEL
+
+# Обученный классификатор (python -m rag_system.core.router --log query_log.jsonl)
+ROUTER_MODEL_PATH = os.path.join(BASE_INDEX_DIR, 'router.json')
+
+# Диапазон длин символьных n-грамм классификатора
+ROUTER_NGRAM_RANGE = (1, 3)
+
+# Ниже этой уверенности классификатора запрос при ROUTER_FANOUT отправляется во все подходящие модели
+ROUTER_CONFIDENCE_THRESHOLD = 0.6
+ROUTER_FANOUT = False
+
+# --- Типы индексов FAISS по моделям (см. rag_system/core/index_factory.py) ---
+# Поддерживаемые типы: 'flat' (точный поиск), 'hnsw', 'ivf_flat', 'ivf_pq', 'opq_ivf_pq'.
+# Дополнительные параметры: nlist, nprobe, hnsw_m, ef_construction, ef_search, pq_m, pq_nbits, train_sample_size.
+# Для каталога в сотни товаров достаточно 'flat'; для миллионов SKU, например:
+#   {'type': 'ivf_pq', 'nlist': 4096, 'nprobe': 32, 'pq_m': 48}
+#   {'type': 'hnsw', 'hnsw_m': 32, 'ef_search': 128}
+# HNSW не поддерживает удаление: изменение или удаление товаров при синхронизации перестраивает весь индекс.
+# Сравнить recall@k и латентность типов индексов: python -m rag_system.benchmarks.index_recall
+INDEX_CONFIGS = {
+    MAIN_RETRIEVER_MODEL: {'type': 'flat'},
+    SECONDARY_RETRIEVER_MODEL: {'type': 'flat'},
+}
+
+# --- Фильтрация по атрибутам (цена, тип товара; см. rag_system/core/attributes.py) ---
+
+# Если фильтру удовлетворяет не больше стольких документов, их векторы сравниваются с запросом напрямую
+# (точный поиск по подмножеству дешевле обхода индекса с селектором)
+FILTER_EXACT_MAX_CANDIDATES = 1024
+# Сколько последних различных фильтров хранят готовый отбор меток (и селектор FAISS в каждом ретривере);
+# запись занимает 8 байт на подходящий документ (метка int64) плюс хэш-множество тех же меток в селекторе FAISS;
+# кэш сбрасывается при изменении атрибутов или индекса
+FILTER_CACHE_SIZE = 32
+
 # Путь к файлу с исходной базой знаний (JSON)
 KNOWLEDGE_BASE_JSON_PATH = 'rag_system/data/export_2025-05-27_15 01 35.json'
 
+# --- Бэкенд моделей эмбеддингов (см. rag_system/models/onnx_embeddings.py) ---
+
+# 'sentence_transformers' (PyTorch, fp32) или 'onnx' (onnxruntime на CPU, опционально int8)
+EMBEDDING_BACKEND = 'sentence_transformers'
+
+# Директория с экспортированными ONNX моделями (экспорт выполняется автоматически при первой загрузке)
+ONNX_MODELS_DIR = 'onnx_models'
+
+# Использовать int8 динамическую квантизацию весов
+ONNX_QUANTIZE = True
+
+# Количество потоков onnxruntime на один вызов encode (при параллельном кодировании несколькими моделями - ядра / число моделей)
+ONNX_INTRA_OP_THREADS = max(1, (os.cpu_count() or 1) // 2)
+
+# Размер батча при кодировании
+ONNX_BATCH_SIZE = 32
+
+# --- Микро-батчинг запросов (см. rag_system/core/batching.py) ---
+
+# Максимальное число запросов, объединяемых в один батч (один encode + один index.search)
+MICRO_BATCH_MAX_SIZE = 32
+
+# Максимальное время ожидания (в миллисекундах) накопления батча после первого запроса
+MICRO_BATCH_MAX_WAIT_MS = 5
+
+# --- Кэш эмбеддингов запросов (см. rag_system/models/cached_embeddings.py) ---
+
+# Включает кэширование эмбеддингов запросов в EmbeddingModelManager.load_model
+EMBEDDING_CACHE_ENABLED = True
+
+# Максимальное количество эмбеддингов в кэше на одну модель (LRU)
+EMBEDDING_CACHE_MAX_ENTRIES = 10000
+
+# Время жизни записи кэша в секундах (None - без ограничения)
+EMBEDDING_CACHE_TTL_SECONDS = None
+
+# Директория для сохранения кэша между перезапусками (None - кэш только в памяти)
+EMBEDDING_CACHE_DIR = 'embedding_cache'
+
+# Батчи больше этого размера (индексация документов) кодируются мимо кэша
+EMBEDDING_CACHE_MAX_BATCH_SIZE = 64
+
+# --- Асинхронный сервис поиска (см. KnowledgeBaseManager.aretrieve и rag_system/core/http_server.py) ---
+
+# Количество потоков для открытия ретриверов в aretrieve (кодирование и поиск выполняют микро-батчеры моделей)
+ASYNC_EXECUTOR_WORKERS = 4
+
+# Максимальное количество запросов в обработке и в очереди; сверх этого запросы отклоняются (backpressure)
+ASYNC_MAX_PENDING_REQUESTS = 64
+
+# Таймаут одного запроса в секундах
+ASYNC_REQUEST_TIMEOUT_SECONDS = 5.0
+
+# Адрес локального HTTP/JSON эндпоинта
+HTTP_HOST = '127.0.0.1'
+HTTP_PORT = 8080
+
+# Максимальный top_k HTTP-запроса (большие значения обрезаются до него)
+HTTP_MAX_TOP_K = 50
+
+# --- Потоковая индексация больших экспортов (см. rag_system/core/ingest.py) ---
+
+# Количество документов в одном чанке кодирования
+INGEST_CHUNK_SIZE = 512
+
+# Сохранять индексы и прогресс каждые N документов
+# (IVF/PQ индекс копит обучающую выборку до train_sample_size через чекпоинты; до обучения прогресс не продвигается)
+INGEST_CHECKPOINT_EVERY = 20000
+
+# Количество процессов кодирования (по реплике каждой модели в процессе; 0 - кодировать в текущем процессе)
+INGEST_WORKERS = 0
+
+# --- Логирование и метрики (см. rag_system/core/metrics.py) ---
+
+# Уровень логирования ('DEBUG' - включая каждый найденный документ, 'INFO', 'WARNING', ...)
+LOG_LEVEL = 'INFO'
+
+# Сбор метрик (таймеры этапов, счетчики, гистограммы); при False инструментация - no-op
+METRICS_ENABLED = True
+
+# Верхние границы бакетов гистограмм длительности этапов, в секундах
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+# --- Запуск и прогрев (см. KnowledgeBaseManager.warm_up) ---
+
+# Загружать модели эмбеддингов при первом использовании (кодирование запроса или новых документов),
+# а не при создании ретривера: неиспользуемая модель не замедляет запуск и не занимает память
+LAZY_MODEL_LOADING = True
+
+# Модели, прогреваемые при запуске (пробный батч encode + search), чтобы первый реальный запрос не был медленным
+WARMUP_MODELS = [MAIN_RETRIEVER_MODEL]
+
+# Размер пробного батча прогрева
+WARMUP_BATCH_SIZE = 8
+
 # Директория для данных
 DATA_DIR = 'rag_system/data'
 
-# Убедимся, что директория для данных существует
-os.makedirs(DATA_DIR, exist_ok=True)
\ No newline at end of file
+def ensure_directories():
+    """Создает директории данных. Вызывается точками входа, а не при импорте конфигурации."""
+    os.makedirs(DATA_DIR, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,200 @@
+# core/attributes.py
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rag_system.config import FILTER_CACHE_SIZE
+from rag_system.core.documents import DOCUMENT_TYPES, parse_price, type_code
+from rag_system.core.meta_store import load_npy, save_npy_atomic
+
+# Колоночные атрибуты документа: метка FAISS (ID товара), цена (NaN - нет цены) и код типа (-1 - неизвестен).
+# Цена хранится в float64, как и границы фильтров: во float32 цены вроде 9999.99 не совпадали бы с границей
+ATTRIBUTE_DTYPE = np.dtype([('label', '<i8'), ('price', '<f8'), ('type', 'i1')])
+
+# Допустимые ключи фильтров retrieve(..., filters=...)
+FILTER_KEYS = ('price_min', 'price_max', 'type')
+
+def validate_filters(filters: dict | None) -> dict | None:
+    """
+    Проверяет фильтры поиска.
+    :param filters: {'price_min': число, 'price_max': число, 'type': строка или список строк из DOCUMENT_TYPES}.
+    :return: Фильтры с типом в виде списка, либо None, если фильтров нет.
+    :raises ValueError: Если фильтры не словарь, при неизвестном ключе, нечисловой цене или неизвестном типе товара.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError(f"Фильтры должны быть словарем, получено: {type(filters).__name__}.")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Неизвестные фильтры: {', '.join(sorted(unknown))}. Допустимые: {', '.join(FILTER_KEYS)}.")
+    validated = {}
+    for key in ('price_min', 'price_max'):
+        if filters.get(key) is not None:
+            price = parse_price(filters[key])
+            if price is None:
+                raise ValueError(f"Фильтр {key} должен быть числом, получено: {filters[key]!r}.")
+            validated[key] = price
+    if filters.get('type') is not None:
+        types = [filters['type']] if isinstance(filters['type'], str) else filters['type']
+        if not isinstance(types, (list, tuple)) or not all(isinstance(value, str) for value in types):
+            raise ValueError(f"Фильтр type должен быть строкой или списком строк, получено: {filters['type']!r}.")
+        if not types:
+            raise ValueError("Фильтр type не может быть пустым списком.")
+        types = list(types)
+        invalid = [value for value in types if value not in DOCUMENT_TYPES]
+        if invalid:
+            raise ValueError(f"Неизвестный тип товара: {', '.join(map(str, invalid))}. Допустимые: {', '.join(DOCUMENT_TYPES)}.")
+        validated['type'] = types
+    return validated or None
+
+def filters_key(filters: dict | None) -> tuple | None:
+    """Хешируемый ключ нормализованных фильтров (для группировки запросов с одинаковыми фильтрами); None - без фильтров."""
+    filters = validate_filters(filters)
+    if filters is None:
+        return None
+    return tuple(sorted((key, tuple(value) if isinstance(value, list) else value) for key, value in filters.items()))
+
+def contains_labels(sorted_labels: np.ndarray, labels) -> np.ndarray:
+    """Маска меток labels, входящих в отсортированный массив sorted_labels (O(len(labels) * log), без сортировки отбора)."""
+    labels = np.asarray(labels, dtype='int64')
+    if not len(sorted_labels):
+        return np.zeros(len(labels), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_labels, labels), len(sorted_labels) - 1)
+    return sorted_labels[positions] == labels
+
+class AttributeStore:
+    """
+    Колоночное (NumPy) хранилище атрибутов для фильтрации, общее для всех моделей, как и DocumentMetaStore.
+    attributes.npy - структурный массив ATTRIBUTE_DTYPE, отсортированный по метке; открывается через mmap.
+    После каждой записи лениво строятся вспомогательные индексы: порядок документов по цене (диапазон цен - два
+    searchsorted) и отсортированные метки каждого типа. Отбор стоит O(подходящих документов), а не O(каталога);
+    последние FILTER_CACHE_SIZE отборов кэшируются по нормализованным фильтрам.
+    """
+    FILE = 'attributes.npy'
+
+    def __init__(self, store_dir: str, cache_size: int = FILTER_CACHE_SIZE):
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, self.FILE)
+        self.cache_size = cache_size
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        self._columns = load_npy(self.path) if os.path.exists(self.path) else np.empty(0, dtype=ATTRIBUTE_DTYPE)
+        if self._columns.dtype != ATTRIBUTE_DTYPE:
+            # Файл предыдущего формата (цена float32): цены будут уточнены при следующей синхронизации
+            self._columns = self._columns.astype(ATTRIBUTE_DTYPE)
+        # Номер версии колонок: меняется при каждой записи (по нему ретриверы сбрасывают свои кэши фильтров)
+        self.version = 0
+        self._lookup = None # (порядок документов с ценой по возрастанию цены, отсортированные цены, {код типа: метки})
+        self._selections: OrderedDict[tuple, np.ndarray] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def labels(self) -> np.ndarray:
+        """Отсортированный массив меток всех документов с атрибутами."""
+        return self._columns['label']
+
+    def upsert(self, records: dict[int, dict]) -> int:
+        """
+        Добавляет или обновляет атрибуты по записям метаданных (build_record). Неизменные строки не переписываются.
+        :param records: Словарь {метка: запись с ключами 'price' и 'type'}.
+        :return: Количество добавленных или измененных строк.
+        """
+        if not records:
+            return 0
+        rows = np.empty(len(records), dtype=ATTRIBUTE_DTYPE)
+        rows['label'] = np.fromiter(records.keys(), dtype='int64', count=len(records))
+        rows['price'] = [np.nan if record.get('price') is None else record['price'] for record in records.values()]
+        rows['type'] = [type_code(record.get('type')) for record in records.values()]
+
+        with self._write_lock:
+            columns = self._columns
+            changed = np.ones(len(rows), dtype=bool)
+            if len(columns):
+                positions = np.minimum(np.searchsorted(columns['label'], rows['label']), len(columns) - 1)
+                existing = columns[positions]
+                same_price = (existing['price'] == rows['price']) | (np.isnan(existing['price']) & np.isnan(rows['price']))
+                changed = ~((existing['label'] == rows['label']) & same_price & (existing['type'] == rows['type']))
+            if not changed.any():
+                return 0
+            new_rows = rows[changed]
+            merged = np.concatenate([columns[~np.isin(columns['label'], new_rows['label'])], new_rows])
+            self._replace(merged[np.argsort(merged['label'], kind='stable')])
+            return len(new_rows)
+
+    def remove(self, labels) -> int:
+        """Удаляет атрибуты документов с указанными метками. :return: Количество удаленных строк."""
+        labels = np.asarray(list(labels), dtype='int64')
+        if not len(labels):
+            return 0
+        with self._write_lock:
+            drop = np.isin(self._columns['label'], labels)
+            if not drop.any():
+                return 0
+            self._replace(self._columns[~drop])
+            return int(drop.sum())
+
+    def _replace(self, columns: np.ndarray):
+        save_npy_atomic(self.path, columns)
+        columns = load_npy(self.path)
+        with self._cache_lock:
+            self._columns = columns
+            self._lookup = None
+            self._selections.clear()
+            self.version += 1
+
+    @staticmethod
+    def _build_lookup(columns: np.ndarray) -> tuple[np.ndarray, np.ndarray, dict[int, np.ndarray]]:
+        prices = columns['price']
+        # NaN (нет цены) сортируется в конец и отбрасывается: такие документы не проходят ценовые фильтры
+        order = np.argsort(prices, kind='stable')[:int(np.count_nonzero(~np.isnan(prices)))]
+        by_type = {code: columns['label'][columns['type'] == code] for code in range(len(DOCUMENT_TYPES))}
+        return order, prices[order], by_type
+
+    def select(self, filters: dict | None) -> np.ndarray | None:
+        """
+        Метки документов, удовлетворяющих фильтрам (см. validate_filters).
+        Документ без цены не проходит ни один ценовой фильтр.
+        :return: Отсортированный массив меток (только для чтения, общий для одинаковых фильтров)
+                 или None, если фильтров нет (подходят все документы).
+        """
+        key = filters_key(filters)
+        if key is None:
+            return None
+        with self._cache_lock:
+            cached = self._selections.get(key)
+            if cached is not None:
+                self._selections.move_to_end(key)
+                return cached
+            columns, lookup, version = self._columns, self._lookup, self.version
+        if lookup is None:
+            lookup = self._build_lookup(columns)
+
+        filters = dict(key)
+        order, sorted_prices, by_type = lookup
+        codes = sorted({type_code(value) for value in filters['type']}) if 'type' in filters else None
+        if 'price_min' in filters or 'price_max' in filters:
+            start = np.searchsorted(sorted_prices, filters['price_min'], 'left') if 'price_min' in filters else 0
+            end = np.searchsorted(sorted_prices, filters['price_max'], 'right') if 'price_max' in filters else len(sorted_prices)
+            positions = order[start:end]
+            if codes is not None:
+                positions = positions[np.isin(columns['type'][positions], codes)]
+            labels = np.sort(columns['label'][positions])
+        else:
+            labels = by_type[codes[0]] if len(codes) == 1 else np.sort(np.concatenate([by_type[code] for code in codes]))
+        labels = np.ascontiguousarray(labels, dtype='int64')
+        labels.flags.writeable = False
+
+        with self._cache_lock:
+            # Запись атрибутов во время отбора: результат относится к старой версии и не кэшируется
+            if version == self.version:
+                self._lookup = lookup
+                self._selections[key] = labels
+                while len(self._selections) > self.cache_size:
+                    self._selections.popitem(last=False)
+        return labels
@@ -0,0 +1,119 @@
+# core/batching.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from rag_system.core.attributes import filters_key
+from rag_system.core.hybrid import HybridRetriever
+from rag_system.core.retriever import LocalKnowledgeBaseRetriever
+from rag_system.config import MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS
+
+_STOP = object() # Маркер остановки фонового потока
+
+class MicroBatchingRetriever:
+    """
+    Фронт-энд над LocalKnowledgeBaseRetriever или HybridRetriever, который собирает параллельные запросы
+    в батчи (до max_batch_size запросов или max_wait_ms миллисекунд) и выполняет их
+    одним вызовом retrieve_batch. Каждый вызывающий получает свой список результатов.
+    Запросы с разными фильтрами по атрибутам выполняются отдельными retrieve_batch внутри одного батча.
+    """
+    def __init__(self, retriever: LocalKnowledgeBaseRetriever | HybridRetriever,
+                 max_batch_size: int = MICRO_BATCH_MAX_SIZE,
+                 max_wait_ms: float = MICRO_BATCH_MAX_WAIT_MS):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size должен быть не меньше 1.")
+        self.retriever = retriever
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        # Проверка _closed и постановка в очередь выполняются под одной блокировкой,
+        # иначе запрос может попасть в очередь после маркера остановки и никогда не завершиться
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name=f"micro-batcher-{retriever.model_name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, query_text: str, top_k: int = 3, filters: dict | None = None) -> Future:
+        """
+        Ставит запрос в очередь на пакетную обработку.
+        :param filters: Фильтры по атрибутам (см. attributes.validate_filters).
+        :return: Future, результатом которого будет список документов ('id', 'text', 'score').
+        :raises ValueError: При некорректных фильтрах (проверяются сразу, а не в фоновом потоке).
+        """
+        key = filters_key(filters)
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatchingRetriever остановлен.")
+            self._queue.put((query_text, top_k, key, future))
+        return future
+
+    def retrieve(self, query_text: str, top_k: int = 3, filters: dict | None = None) -> list[dict]:
+        """Блокирующий поиск с тем же интерфейсом, что и LocalKnowledgeBaseRetriever.retrieve."""
+        return self.submit(query_text, top_k, filters).result()
+
+    def close(self):
+        """
+        Останавливает фоновый поток, предварительно обработав уже поставленные запросы.
+        Запросы, которые остались необработанными, завершаются ошибкой RuntimeError.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._worker.join()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[-1].set_running_or_notify_cancel():
+                item[-1].set_exception(RuntimeError("MicroBatchingRetriever остановлен."))
+
+    def _collect_batch(self, first_item) -> tuple[list, bool]:
+        """Дособирает батч к первому запросу, пока не истечет окно ожидания или не наберется max_batch_size."""
+        batch = [first_item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stop = self._collect_batch(item)
+            self._process_batch(batch)
+            if stop:
+                return
+
+    def _process_batch(self, batch: list):
+        # Запросы группируются по фильтрам; на группу - один поиск с максимальным top_k, затем каждый вызывающий получает свой срез
+        groups: dict[tuple | None, list] = {}
+        for query, top_k, key, future in batch:
+            if future.set_running_or_notify_cancel():
+                groups.setdefault(key, []).append((query, top_k, future))
+        for key, group in groups.items():
+            max_top_k = max(top_k for _, top_k, _ in group)
+            try:
+                results = self.retriever.retrieve_batch([query for query, _, _ in group], max_top_k,
+                                                        dict(key) if key is not None else None)
+            except Exception as e:
+                for _, _, future in group:
+                    future.set_exception(e)
+                continue
+            for (_, top_k, future), documents in zip(group, results):
+                future.set_result(documents[:top_k])
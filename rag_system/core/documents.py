@@ -0,0 +1,87 @@
+# core/documents.py
+
+import hashlib
+import math
+
+# Ключи с текстом документа в порядке приоритета (первый непустой используется для эмбеддинга)
+TEXT_KEYS_PRIORITY = ['desc', 'desc_short', 'description', 'paragraph_text', 'name']
+
+# Ключи с идентификатором товара в экспорте
+ID_KEYS = ['ID', 'id']
+
+# Ключи атрибутов товара, по которым возможна фильтрация при поиске (см. core/attributes.py)
+PRICE_KEY = 'price'
+TYPE_KEY = 'Тип'
+
+# Типы товаров экспорта; код типа в колоночном хранилище - позиция в этом списке (-1 - неизвестный тип)
+DOCUMENT_TYPES = ('simple', 'variable', 'variation')
+
+# Метки FAISS - знаковые 64-битные целые; хэши приводятся к этому диапазону
+_INT63_MASK = (1 << 63) - 1
+
+def extract_text(doc: dict) -> str | None:
+    """Возвращает текст документа по TEXT_KEYS_PRIORITY или None, если текста нет."""
+    for key in TEXT_KEYS_PRIORITY:
+        if doc.get(key):
+            return doc[key]
+    return None
+
+def _stable_hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little') & _INT63_MASK
+
+def document_label(doc: dict) -> int | None:
+    """
+    Возвращает метку документа для FAISS (int64) по ID товара.
+    Числовые ID используются как есть, строковые - через стабильный хэш. None, если ID нет.
+    """
+    value = document_id(doc)
+    if value is None:
+        return None
+    # Только ASCII-цифры: str.isdigit() пропускает '²', на котором int() падает
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value & _INT63_MASK
+    if isinstance(value, str) and value.isascii() and value.isdecimal():
+        return int(value) & _INT63_MASK
+    return _stable_hash(str(value))
+
+def document_id(doc: dict):
+    """Исходный ID товара из экспорта (как есть - число или строка) или None, если ID нет."""
+    for key in ID_KEYS:
+        value = doc.get(key)
+        if value is not None and value != '':
+            return value
+    return None
+
+def content_hash(text: str) -> int:
+    """Хэш содержимого, по которому синхронизация определяет, нужно ли пересчитывать эмбеддинг."""
+    return _stable_hash(text)
+
+def parse_price(value) -> float | None:
+    """Цена из экспорта ('23500', '1 299,50', 23500 или '') в float; None, если цены нет или она некорректна."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        price = float(value)
+    else:
+        try:
+            price = float(str(value).replace('\xa0', '').replace(' ', '').replace(',', '.'))
+        except ValueError:
+            return None
+    return price if math.isfinite(price) else None
+
+def type_code(value) -> int:
+    """Код типа товара (позиция в DOCUMENT_TYPES) или -1 для неизвестного/пустого типа."""
+    try:
+        return DOCUMENT_TYPES.index(value)
+    except ValueError:
+        return -1
+
+def build_record(doc: dict, label: int, text: str) -> dict:
+    """
+    Запись метаданных документа для DocumentMetaStore (то, что возвращается в результатах поиска).
+    'id' - исходный ID товара (для строковых ID метка FAISS - их хэш, и показывать ее нельзя);
+    у документов без ID это автоматически назначенная метка.
+    Атрибуты для фильтрации (цена, тип) также попадают в колоночное AttributeStore.
+    """
+    product_id = document_id(doc)
+    return {'id': product_id if product_id is not None else label, 'desc': text, 'price': parse_price(doc.get(PRICE_KEY)), 'type': doc.get(TYPE_KEY) or None}
@@ -0,0 +1,177 @@
+# core/http_server.py
+#
+# Минимальный локальный HTTP/JSON эндпоинт поверх KnowledgeBaseManager.aretrieve (только стандартная библиотека).
+#   POST /retrieve  {"query": "...", "model": "...", "top_k": 3} -> {"model": "...", "models": [...], "documents": [...]}
+#                   (без "model" модель выбирает маршрутизатор запросов KnowledgeBaseManager; в ответе -
+#                   фактически выбранная модель; допустимы только модели из ROUTER_MODEL_SCRIPTS/INDEX_CONFIGS,
+#                   top_k обрезается до HTTP_MAX_TOP_K)
+#                   необязательный "filters": {"price_min": 0, "price_max": 10000, "type": ["simple"]}
+#   GET  /health                                              -> {"status": "ok"}
+#   GET  /metrics                                             -> метрики в текстовом формате Prometheus
+#
+# Пример: python -m rag_system.core.http_server --port 8080
+
+import argparse
+import asyncio
+import json
+import logging
+
+from rag_system.config import HTTP_HOST, HTTP_PORT, HTTP_MAX_TOP_K, ROUTER_MODEL_SCRIPTS, INDEX_CONFIGS
+from rag_system.core.managers import EmbeddingModelManager, KnowledgeBaseManager, ServiceOverloadedError
+from rag_system.core.metrics import MetricsRegistry, metrics, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер тела запроса в байтах
+MAX_BODY_BYTES = 64 * 1024
+
+# Модели, доступные клиентам: произвольное имя создало бы новый ретривер, каталог индекса и, возможно, загрузку модели
+SERVED_MODELS = tuple(dict.fromkeys([*ROUTER_MODEL_SCRIPTS, *INDEX_CONFIGS]))
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+class _PayloadTooLargeError(ValueError):
+    pass
+
+class RetrievalHttpServer:
+    def __init__(self, knowledge_base_manager: KnowledgeBaseManager, default_model: str | None = None,
+                 metrics_registry: MetricsRegistry = metrics, served_models: tuple[str, ...] = SERVED_MODELS,
+                 max_top_k: int = HTTP_MAX_TOP_K):
+        if default_model is not None and default_model not in served_models:
+            raise ValueError(f"Модель по умолчанию '{default_model}' не входит в список доступных: {', '.join(served_models)}.")
+        self.knowledge_base_manager = knowledge_base_manager
+        self.default_model = default_model
+        self.metrics_registry = metrics_registry
+        self.served_models = served_models
+        self.max_top_k = max_top_k
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = await self._dispatch(method, path, body)
+                except Exception:
+                    # Непредвиденная ошибка не должна обрывать соединение без ответа
+                    logger.exception("Ошибка при обработке запроса %s %s.", method, path)
+                    status, payload = 500, {'error': "Внутренняя ошибка сервера."}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            status = 413 if isinstance(e, _PayloadTooLargeError) else 400
+            self._write_response(writer, status, {'error': str(e)}, keep_alive=False)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise ValueError("Некорректная строка запроса.")
+        method, path, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0) or 0)
+        if length > MAX_BODY_BYTES:
+            raise _PayloadTooLargeError(f"Слишком большое тело запроса ({length} байт).")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), path.split('?', 1)[0], headers, body
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> tuple[int, dict | str]:
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/metrics':
+            return 200, self.metrics_registry.render_prometheus()
+        if path != '/retrieve':
+            return 404, {'error': f"Неизвестный путь: {path}"}
+        if method != 'POST':
+            return 405, {'error': "Используйте POST."}
+
+        try:
+            params = json.loads(body or b'{}')
+            query_text = params['query']
+            model_name = params.get('model', self.default_model)
+            top_k = params.get('top_k', 3)
+            filters = params.get('filters')
+            if not isinstance(query_text, str) or not isinstance(model_name, (str, type(None))):
+                raise ValueError
+            # Только целое число: 2.7, true или Infinity не приводятся молча к int
+            if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+                raise ValueError
+            top_k = min(top_k, self.max_top_k)
+            if not isinstance(filters, (dict, type(None))):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': "Ожидается JSON {\"query\": str, \"model\": str (необязательно), \"top_k\": int > 0, \"filters\": object (необязательно)}."}
+        if model_name is not None and model_name not in self.served_models:
+            return 400, {'error': f"Неизвестная модель '{model_name}'. Доступные: {', '.join(self.served_models)}."}
+
+        try:
+            documents, decision = await self.knowledge_base_manager.aretrieve_routed(query_text, top_k, filters=filters,
+                                                                                     model_name=model_name)
+        except ServiceOverloadedError as e:
+            return 503, {'error': str(e)}
+        except TimeoutError as e:
+            return 504, {'error': str(e)}
+        except (ValueError, RuntimeError) as e:
+            return 400 if isinstance(e, ValueError) else 500, {'error': str(e)}
+        return 200, {'model': decision.model_name, 'models': decision.model_names, 'documents': documents}
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload: dict | str, keep_alive: bool):
+        # Строка - текст метрик Prometheus, словарь - JSON
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def serve(self, host: str = HTTP_HOST, port: int = HTTP_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info("HTTP эндпоинт поиска запущен на http://%s:%d (POST /retrieve, GET /health, GET /metrics)", host, port)
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный HTTP/JSON эндпоинт поиска.")
+    parser.add_argument('--host', default=HTTP_HOST)
+    parser.add_argument('--port', type=int, default=HTTP_PORT)
+    parser.add_argument('--model', default=None, choices=SERVED_MODELS, help="Модель для запросов без поля 'model' (по умолчанию - выбор маршрутизатором)")
+    args = parser.parse_args()
+    configure_logging()
+
+    embedding_model_manager = EmbeddingModelManager()
+    knowledge_base_manager = KnowledgeBaseManager(embedding_model_manager)
+    # Модель по умолчанию (или WARMUP_MODELS) прогревается до открытия порта; остальные загрузятся при первом запросе к ним
+    knowledge_base_manager.warm_up([args.model] if args.model else None)
+    try:
+        asyncio.run(RetrievalHttpServer(knowledge_base_manager, args.model).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        knowledge_base_manager.close()
+        # Кэш эмбеддингов запросов переживает перезапуск сервиса
+        embedding_model_manager.save_caches()
+
+if __name__ == '__main__':
+    main()
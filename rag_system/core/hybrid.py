@@ -0,0 +1,72 @@
+# core/hybrid.py
+
+import numpy as np
+
+from rag_system.config import HYBRID_CANDIDATES, RRF_K
+from rag_system.core.attributes import contains_labels
+from rag_system.core.lexical import LexicalIndex
+from rag_system.core.metrics import metrics
+from rag_system.core.retriever import LocalKnowledgeBaseRetriever
+
+class HybridRetriever:
+    """
+    Гибридный поиск с тем же интерфейсом retrieve, что и у LocalKnowledgeBaseRetriever.
+    Точное совпадение артикула возвращается сразу, без вызова модели эмбеддингов;
+    остальные запросы объединяют результаты BM25 и векторного поиска через reciprocal-rank fusion.
+    """
+    def __init__(self, vector_retriever: LocalKnowledgeBaseRetriever, lexical_index: LexicalIndex,
+                 candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K):
+        self.vector_retriever = vector_retriever
+        self.lexical_index = lexical_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.model_name = vector_retriever.model_name
+
+    def retrieve(self, query_text: str, top_k: int = 3, filters: dict | None = None) -> list[dict]:
+        """
+        Выполняет гибридный поиск релевантных документов по запросу.
+        :param filters: Фильтры по атрибутам (см. LocalKnowledgeBaseRetriever.retrieve); применяются ко всем источникам.
+        :return: Список словарей ('id', 'text', 'score'); для точного артикула score = 1.0, иначе - оценка RRF.
+        """
+        return self.retrieve_batch([query_text], top_k, filters)[0]
+
+    def retrieve_batch(self, queries: list[str], top_k: int = 3, filters: dict | None = None) -> list[list[dict]]:
+        # Отбор по атрибутам выполняется один раз и используется всеми источниками
+        with metrics.timer('filter', model=self.model_name):
+            allowed = self.vector_retriever.attributes.select(filters)
+        with metrics.timer('sku_lookup', model=self.model_name):
+            results: list[list[dict] | None] = [self._sku_hits(query, top_k, allowed) for query in queries]
+        # В векторный поиск (один батч) идут только запросы без точного совпадения артикула
+        vector_rows = [i for i, result in enumerate(results) if result is None]
+        if vector_rows:
+            depth = max(top_k, self.candidates)
+            found = self.vector_retriever.search_labels([queries[i] for i in vector_rows], depth, filters, allowed)
+            for position, row in enumerate(vector_rows):
+                vector_labels = found[1][position] if found is not None else np.empty(0, dtype='int64')
+                with metrics.timer('lexical_search', model=self.model_name):
+                    lexical_hits = self.lexical_index.search(queries[row], depth, allowed)
+                results[row] = self._fuse(vector_labels[vector_labels != -1], lexical_hits, top_k)
+        return results
+
+    def _sku_hits(self, query_text: str, top_k: int, allowed: np.ndarray | None = None) -> list[dict] | None:
+        labels = self.lexical_index.lookup_sku(query_text)
+        if labels and allowed is not None:
+            labels = [label for label, ok in zip(labels, contains_labels(allowed, labels)) if ok]
+        labels = labels[:top_k]
+        if not labels:
+            return None
+        records = self.vector_retriever.documents_meta.get_many(labels)
+        return [{'id': record['id'], 'text': record['desc'], 'score': 1.0} for record in records if record is not None]
+
+    def _fuse(self, vector_labels: np.ndarray, lexical_hits: list[tuple[int, float]], top_k: int) -> list[dict]:
+        # Объединение по меткам FAISS; метаданные декодируются только для top_k итоговых документов
+        fused: dict[int, float] = {}
+        for rank, label in enumerate(vector_labels.tolist()):
+            fused[label] = fused.get(label, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        for rank, (label, _) in enumerate(lexical_hits):
+            fused[label] = fused.get(label, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        records = self.vector_retriever.documents_meta.get_many([label for label, _ in ranked])
+        return [{'id': record['id'], 'text': record['desc'], 'score': score}
+                for (_, score), record in zip(ranked, records) if record is not None]
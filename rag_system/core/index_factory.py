@@ -0,0 +1,296 @@
+# core/index_factory.py
+
+import logging
+import os
+import time
+
+import faiss
+import numpy as np
+
+from rag_system.config import BASE_INDEX_DIR
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые типы индексов и их описание в терминах faiss.index_factory
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq', 'opq_ivf_pq')
+
+# Значения по умолчанию для параметров индекса (переопределяются в INDEX_CONFIGS в config.py)
+DEFAULT_INDEX_PARAMS = {
+    'type': 'flat',
+    'nlist': 1024,             # Количество кластеров IVF
+    'nprobe': 16,              # Количество просматриваемых кластеров IVF при поиске
+    'hnsw_m': 32,              # Количество связей на узел HNSW
+    'ef_construction': 200,    # Ширина поиска HNSW при построении
+    'ef_search': 64,           # Ширина поиска HNSW при запросе
+    'pq_m': 32,                # Количество подквантователей PQ (должно делить размерность)
+    'pq_nbits': 8,             # Бит на код подквантователя PQ
+    'train_sample_size': 100000 # Размер выборки для обучения IVF/PQ
+}
+
+# Минимальное число обучающих векторов на один центроид k-means (рекомендация faiss)
+_MIN_POINTS_PER_CENTROID = 39
+
+def get_model_index_dir(model_name: str) -> str:
+    """Директория с файлами индекса для модели."""
+    # Заменяем символы, которые могут быть проблемой в именах файлов
+    safe_model_name = model_name.replace('/', '_').replace('-', '_')
+    return os.path.join(BASE_INDEX_DIR, safe_model_name)
+
+def resolve_index_params(index_config: dict | None) -> dict:
+    """Дополняет конфигурацию индекса значениями по умолчанию и проверяет тип."""
+    params = dict(DEFAULT_INDEX_PARAMS)
+    params.update(index_config or {})
+    if params['type'] not in INDEX_TYPES:
+        raise ValueError(f"Неизвестный тип индекса: {params['type']}. Допустимые типы: {', '.join(INDEX_TYPES)}.")
+    return params
+
+def _factory_string(dimension: int, params: dict, n_train: int) -> str:
+    """Строит строку faiss.index_factory, подстраивая nlist под доступный объем обучающих данных."""
+    index_type = params['type']
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'hnsw':
+        return f"HNSW{params['hnsw_m']}"
+
+    nlist = max(1, min(params['nlist'], n_train // _MIN_POINTS_PER_CENTROID))
+    if index_type == 'ivf_flat':
+        return f"IVF{nlist},Flat"
+
+    pq_m, pq_nbits = params['pq_m'], params['pq_nbits']
+    if dimension % pq_m != 0:
+        raise ValueError(f"pq_m={pq_m} должно делить размерность эмбеддингов {dimension}.")
+    if index_type == 'ivf_pq':
+        return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    return f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{pq_nbits}"
+
+def _min_train_size(params: dict) -> int:
+    """Минимальное число векторов, при котором обучение индекса данного типа имеет смысл."""
+    if params['type'] in ('ivf_pq', 'opq_ivf_pq'):
+        return 2 ** params['pq_nbits'] # k-means подквантователя PQ
+    if params['type'] == 'ivf_flat':
+        return _MIN_POINTS_PER_CENTROID
+    return 0
+
+def build_index(dimension: int, index_config: dict | None, train_embeddings: np.ndarray | None = None) -> faiss.Index:
+    """
+    Создает (и при необходимости обучает) пустой индекс FAISS с метрикой скалярного произведения.
+    :param dimension: Размерность эмбеддингов.
+    :param index_config: Конфигурация индекса (см. DEFAULT_INDEX_PARAMS).
+    :param train_embeddings: Векторы, из которых берется обучающая выборка для IVF/PQ.
+    :return: Готовый к add() индекс. Если обучающих данных недостаточно, возвращается IndexFlatIP.
+    """
+    params = resolve_index_params(index_config)
+    n_available = 0 if train_embeddings is None else len(train_embeddings)
+
+    if n_available < _min_train_size(params):
+        logger.warning("Недостаточно данных для обучения индекса '%s' (%d векторов). Используется Flat.", params['type'], n_available)
+        params = dict(params, type='flat')
+
+    description = _factory_string(dimension, params, min(n_available, params['train_sample_size']))
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+
+    if params['type'] == 'hnsw':
+        faiss.downcast_index(index).hnsw.efConstruction = params['ef_construction']
+
+    if not index.is_trained:
+        sample = train_embeddings
+        if n_available > params['train_sample_size']:
+            rng = np.random.default_rng(0)
+            sample = train_embeddings[rng.choice(n_available, params['train_sample_size'], replace=False)]
+        start = time.perf_counter()
+        index.train(np.ascontiguousarray(sample, dtype='float32'))
+        logger.info("Индекс '%s' обучен на %d векторах за %.2f с.", description, len(sample), time.perf_counter() - start)
+
+    apply_search_params(index, params)
+    return index
+
+def read_index(path: str, use_mmap: bool = False) -> tuple[faiss.Index, bool]:
+    """
+    Читает индекс FAISS с диска.
+    :param path: Путь к файлу индекса.
+    :param use_mmap: Отобразить данные индекса в память только для чтения (IO_FLAG_MMAP_IFC) вместо копирования в кучу.
+                     Страницы такого индекса разделяются между всеми процессами, открывшими тот же файл.
+    :return: (индекс, True если индекс отображен через mmap). Если mmap не поддерживается этой версией
+             FAISS или типом индекса, индекс читается обычным образом.
+    """
+    if use_mmap:
+        mmap_flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) # IO_FLAG_MMAP_IFC появился в FAISS 1.9
+        try:
+            return faiss.read_index(path, mmap_flag | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError as e:
+            logger.warning("Не удалось открыть индекс '%s' через mmap (%s). Индекс будет прочитан в память.", path, e)
+    return faiss.read_index(path), False
+
+def apply_search_params(index: faiss.Index, index_config: dict | None, **overrides):
+    """
+    Устанавливает параметры поиска (nprobe для IVF, efSearch для HNSW) на индексе,
+    в том числе обернутом в IDMap/OPQ. Неприменимые к данному индексу параметры игнорируются.
+    """
+    params = resolve_index_params(index_config)
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    parameter_space = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        parameter_space.set_index_parameter(index, 'nprobe', params['nprobe'])
+    if _extract_hnsw(index) is not None:
+        parameter_space.set_index_parameter(index, 'efSearch', params['ef_search'])
+
+def _extract_hnsw(index: faiss.Index):
+    """Возвращает вложенный IndexHNSW (с учетом оберток IDMap), либо None."""
+    index = faiss.downcast_index(index)
+    while hasattr(index, 'index') and not isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.index)
+    return index if isinstance(index, faiss.IndexHNSW) else None
+
+def _selector_search_params(index: faiss.Index, selector: faiss.IDSelector, params: dict, exhaustive: bool, keep: list):
+    """
+    SearchParameters с селектором для конкретного типа индекса (nprobe/efSearch передаются вместе с фильтром).
+    :param keep: Список, удерживающий вложенные объекты SWIG живыми на время поиска.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        search_params = faiss.SearchParametersPreTransform()
+        search_params.index_params = _selector_search_params(index.index, selector, params, exhaustive, keep)
+    elif isinstance(index, faiss.IndexIVF):
+        search_params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nlist if exhaustive else min(params['nprobe'], index.nlist))
+    elif isinstance(index, faiss.IndexHNSW):
+        search_params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(params['ef_search'], index.ntotal if exhaustive else 0))
+    else:
+        search_params = faiss.SearchParameters(sel=selector)
+    keep.append(search_params)
+    return search_params
+
+def _id_map_view(id_map_index: faiss.Index) -> np.ndarray:
+    """Метки IndexIDMap по внутренним номерам векторов (представление без копирования)."""
+    return faiss.rev_swig_ptr(id_map_index.id_map.data(), id_map_index.id_map.size())
+
+def label_selector(index: faiss.Index, labels: np.ndarray) -> faiss.IDSelector:
+    """
+    Селектор FAISS для search_with_labels. Построение стоит O(len(labels)) (для OPQ - O(размер индекса)),
+    поэтому для повторяющихся фильтров селектор строится один раз и переиспользуется, пока индекс не изменился.
+    :param index: Индекс в обертке IndexIDMap/IndexIDMap2 (метки - ID товаров).
+    :param labels: Разрешенные метки.
+    """
+    id_map_index = faiss.downcast_index(index)
+    labels = np.ascontiguousarray(labels, dtype='int64')
+    if isinstance(faiss.downcast_index(id_map_index.index), faiss.IndexPreTransform):
+        # IndexPreTransform (OPQ) не передает селектор IDMap вложенному IVF, поэтому фильтр
+        # задается внутренними номерами векторов и поиск идет по вложенному индексу напрямую
+        return faiss.IDSelectorBatch(np.flatnonzero(np.isin(_id_map_view(id_map_index), labels)).astype('int64'))
+    return faiss.IDSelectorBatch(labels)
+
+def search_with_labels(index: faiss.Index, query_embeddings: np.ndarray, top_k: int, labels: np.ndarray,
+                       index_config: dict | None = None, exhaustive: bool = False,
+                       selector: faiss.IDSelector | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Поиск только среди векторов с указанными метками: фильтр (IDSelectorBatch) применяется внутри FAISS,
+    поэтому top_k не "съедается" отфильтрованными документами, как при фильтрации после поиска.
+    :param index: Индекс в обертке IndexIDMap/IndexIDMap2 (метки - ID товаров).
+    :param labels: Разрешенные метки.
+    :param index_config: Конфигурация индекса (nprobe, ef_search).
+    :param exhaustive: Просмотреть все списки IVF / весь граф HNSW (когда приближенный поиск вернул меньше top_k).
+    :param selector: Готовый label_selector(index, labels) (None - построить для этого поиска).
+    :return: (оценки, метки), как у index.search; недостающие позиции - метка -1.
+    """
+    params = resolve_index_params(index_config)
+    id_map_index = faiss.downcast_index(index)
+    inner = faiss.downcast_index(id_map_index.index)
+    if selector is None:
+        selector = label_selector(index, labels)
+    keep = []
+    if isinstance(inner, faiss.IndexPreTransform):
+        id_map = _id_map_view(id_map_index)
+        distances, positions = inner.search(query_embeddings, top_k, params=_selector_search_params(inner, selector, params, exhaustive, keep))
+        return distances, np.where(positions >= 0, id_map[np.maximum(positions, 0)], -1)
+    return id_map_index.search(query_embeddings, top_k, params=_selector_search_params(inner, selector, params, exhaustive, keep))
+
+def exact_search_labels(index: faiss.Index, query_embeddings: np.ndarray, top_k: int,
+                        labels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Точный поиск по небольшому подмножеству меток: векторы восстанавливаются из индекса (reconstruct_batch)
+    и сравниваются с запросами скалярным произведением. Для PQ-индексов векторы восстанавливаются с потерями.
+    :raises RuntimeError: Если индекс не поддерживает восстановление векторов (IVF без direct map).
+    :return: (оценки, метки), как у index.search; недостающие позиции - метка -1.
+    """
+    labels = np.ascontiguousarray(labels, dtype='int64')
+    scores = query_embeddings @ index.reconstruct_batch(labels).T
+    k = min(top_k, len(labels))
+    distances = np.full((len(query_embeddings), top_k), -np.inf, dtype='float32')
+    found = np.full((len(query_embeddings), top_k), -1, dtype='int64')
+    if k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        distances[:, :k] = np.take_along_axis(scores, top, axis=1)
+        found[:, :k] = labels[top]
+    return distances, found
+
+def latency_percentiles(latencies_ms: list[float]) -> dict:
+    """p50/p95/p99 латентности в миллисекундах."""
+    return {
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99))
+    }
+
+def exact_search(base_embeddings: np.ndarray, query_embeddings: np.ndarray, top_k: int) -> np.ndarray:
+    """Точный поиск (IndexFlatIP) - эталон для recall@k. :return: Матрица позиций документов."""
+    exact = faiss.IndexFlatIP(base_embeddings.shape[1])
+    exact.add(np.ascontiguousarray(base_embeddings, dtype='float32'))
+    _, exact_ids = exact.search(np.ascontiguousarray(query_embeddings, dtype='float32'), top_k)
+    return exact_ids
+
+def recall_at_k(found_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Доля точных соседей, найденных приближенным поиском (строки - запросы)."""
+    hits = sum(len(set(found[found != -1]) & set(expected[expected != -1])) for found, expected in zip(found_ids, exact_ids))
+    expected_total = int((exact_ids != -1).sum())
+    return hits / expected_total if expected_total else 1.0
+
+def compare_with_flat(base_embeddings: np.ndarray, query_embeddings: np.ndarray,
+                      index_configs: dict[str, dict], top_k: int = 10) -> list[dict]:
+    """
+    Строит индексы по каждой конфигурации и сравнивает их с точным поиском (Flat).
+    :param base_embeddings: Эмбеддинги документов.
+    :param query_embeddings: Эмбеддинги запросов.
+    :param index_configs: Словарь {название: конфигурация индекса}.
+    :param top_k: Глубина поиска для recall@k.
+    :return: Список строк отчета: название, тип, recall@k, время построения, латентность запроса (p50/p95/p99) и размер индекса.
+    """
+    base_embeddings = np.ascontiguousarray(base_embeddings, dtype='float32')
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+    dimension = base_embeddings.shape[1]
+
+    exact_ids = exact_search(base_embeddings, query_embeddings, top_k)
+
+    report = []
+    for name, index_config in {'flat_baseline': {'type': 'flat'}, **index_configs}.items():
+        start = time.perf_counter()
+        index = build_index(dimension, index_config, base_embeddings)
+        index.add(base_embeddings)
+        build_seconds = time.perf_counter() - start
+
+        latencies_ms = []
+        found_ids = np.empty_like(exact_ids)
+        for row in range(len(query_embeddings)):
+            start = time.perf_counter()
+            _, ids = index.search(query_embeddings[row:row + 1], top_k)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            found_ids[row] = ids[0]
+
+        report.append({
+            'name': name,
+            'type': resolve_index_params(index_config)['type'],
+            f'recall@{top_k}': recall_at_k(found_ids, exact_ids),
+            'build_seconds': build_seconds,
+            'index_bytes': len(faiss.serialize_index(index)),
+            **latency_percentiles(latencies_ms)
+        })
+    return report
+
+def format_report(report: list[dict]) -> str:
+    """Форматирует отчет compare_with_flat в текстовую таблицу."""
+    if not report:
+        return ''
+    columns = list(report[0].keys())
+    lines = ['\t'.join(columns)]
+    for row in report:
+        lines.append('\t'.join(f"{row[c]:.4f}" if isinstance(row[c], float) else str(row[c]) for c in columns))
+    return '\n'.join(lines)
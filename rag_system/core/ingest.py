@@ -0,0 +1,324 @@
+# core/ingest.py
+#
+# Потоковая пакетная индексация больших экспортов каталога:
+#  - инкрементальное чтение JSON (массив или {"documents": [...]}) и JSONL без загрузки файла целиком;
+#  - кодирование чанков в пуле процессов (по реплике модели в каждом процессе);
+#  - периодические чекпоинты (index.add + сохранение) и продолжение с места сбоя;
+#  - построение индексов для нескольких моделей за один проход по данным;
+#  - построение лексического индекса BM25 в том же проходе.
+#
+# Пример: python -m rag_system.core.ingest --source "rag_system/data/export.json" --workers 2
+
+import argparse
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+import numpy as np
+
+from rag_system.config import (
+    KNOWLEDGE_BASE_JSON_PATH,
+    MAIN_RETRIEVER_MODEL,
+    SECONDARY_RETRIEVER_MODEL,
+    BASE_INDEX_DIR,
+    INGEST_CHUNK_SIZE,
+    INGEST_CHECKPOINT_EVERY,
+    INGEST_WORKERS
+)
+from rag_system.core.index_factory import resolve_index_params
+from rag_system.core.lexical import LexicalIndex, LexicalIndexBuilder
+from rag_system.core.managers import EmbeddingModelManager, KnowledgeBaseManager
+from rag_system.core.metrics import configure_logging
+from rag_system.core.retriever import LocalKnowledgeBaseRetriever
+
+logger = logging.getLogger(__name__)
+
+# Файл с прогрессом индексации для продолжения после сбоя
+PROGRESS_PATH = os.path.join(BASE_INDEX_DIR, 'ingest_progress.json')
+
+# Типы индексов, которым нужно обучение перед первым add
+_TRAINED_INDEX_TYPES = ('ivf_flat', 'ivf_pq', 'opq_ivf_pq')
+
+def _iter_json_array(f, read_size: int = 1 << 16) -> Iterator[dict]:
+    """Инкрементально разбирает JSON-массив объектов (или объект с ключом "documents") из текстового файла."""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(read_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+        return not eof
+
+    def skip_whitespace_and(chars: str):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in chars):
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    def decode():
+        """Разбирает JSON-значение с позиции pos, дочитывая файл, пока значение не закончится внутри буфера."""
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # Число на границе буфера может продолжаться в следующем фрагменте файла:
+                # значение принимается, только если за ним уже прочитан разделитель
+                if eof or (end < len(buffer) and buffer[end] in ' \t\r\n,:]}'):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    skip_whitespace_and('')
+    if pos < len(buffer) and buffer[pos] == '{':
+        # Объект-обертка: разбираем ключи по порядку, значения остальных ключей пропускаем
+        pos += 1
+        while True:
+            skip_whitespace_and(',')
+            if pos >= len(buffer) or buffer[pos] == '}':
+                raise ValueError("В JSON-объекте не найден массив \"documents\".")
+            key = decode()
+            if not isinstance(key, str):
+                raise ValueError("Некорректный ключ JSON-объекта.")
+            skip_whitespace_and(':')
+            if key == 'documents':
+                break
+            decode()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise ValueError("Ожидается JSON-массив документов.")
+    pos += 1
+
+    while True:
+        skip_whitespace_and(',')
+        if pos >= len(buffer):
+            raise ValueError("Неожиданный конец JSON-файла.")
+        if buffer[pos] == ']':
+            return
+        yield decode()
+
+def iter_documents(path: str) -> Iterator[dict]:
+    """Итерирует документы экспорта (.json или .jsonl), не загружая файл в память целиком."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+def _chunks(documents: Iterator[dict], chunk_size: int) -> Iterator[list[dict]]:
+    chunk = []
+    for doc in documents:
+        chunk.append(doc)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# --- Реплики моделей в процессах пула ---
+
+_worker_models: dict = {}
+
+def _init_worker(model_names: list[str]):
+    manager = EmbeddingModelManager()
+    for model_name in model_names:
+        _worker_models[model_name] = manager.load_model(model_name, use_cache=False, lazy=False)
+
+def _encode_in_worker(texts: list[str]) -> dict[str, np.ndarray]:
+    return {model_name: model.encode(texts) for model_name, model in _worker_models.items()}
+
+class IngestionPipeline:
+    """
+    Строит индексы нескольких моделей за один проход по экспорту с чекпоинтами.
+    Кодирование чанков выполняется в workers процессах (или в текущем процессе, если workers=0);
+    результаты добавляются в индексы строго по порядку, поэтому чекпоинт однозначно задает,
+    сколько документов источника уже проиндексировано.
+    """
+    def __init__(self, retrievers: list[LocalKnowledgeBaseRetriever], chunk_size: int = INGEST_CHUNK_SIZE,
+                 checkpoint_every: int = INGEST_CHECKPOINT_EVERY, workers: int = INGEST_WORKERS,
+                 progress_path: str = PROGRESS_PATH, lexical_index: LexicalIndex | None = None):
+        self.retrievers = retrievers
+        self.chunk_size = chunk_size
+        self.checkpoint_every = checkpoint_every
+        self.workers = workers
+        self.progress_path = progress_path
+        # Лексический индекс строится заново по всем документам источника и сохраняется в конце прохода
+        self.lexical_index = lexical_index
+        # Буфер эмбеддингов для индексов, которым нужно обучение: копим выборку до train_sample_size
+        self._pending: dict[str, list[tuple[list, np.ndarray]]] = {r.model_name: [] for r in retrievers}
+        # Записи хранилищ метаданных и атрибутов до ближайшего чекпоинта: запись на каждый чанк
+        # переписывала бы индекс хранилища целиком, и индексация росла бы квадратично с размером каталога
+        self._pending_records: dict[int, dict] = {}
+        # Число документов источника, которые уже есть во всех индексах: пока индекс копит обучающую
+        # выборку между чекпоинтами, прогресс сохраняется по этому значению, а не по прочитанным документам
+        self._indexed_done = 0
+
+    def _source_fingerprint(self, source_path: str) -> dict:
+        stat = os.stat(source_path)
+        return {'source': os.path.abspath(source_path), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                'models': sorted(r.model_name for r in self.retrievers)}
+
+    def _load_progress(self, fingerprint: dict) -> int:
+        if not os.path.exists(self.progress_path):
+            return 0
+        try:
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return 0
+        if progress.get('fingerprint') != fingerprint:
+            logger.warning("Файл прогресса относится к другому источнику или набору моделей. Индексация начнется с начала.")
+            return 0
+        return int(progress.get('documents_done', 0))
+
+    def _save_progress(self, fingerprint: dict, documents_done: int, finished: bool = False):
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'documents_done': documents_done, 'finished': finished}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def _needs_training_buffer(self, retriever: LocalKnowledgeBaseRetriever) -> bool:
+        return retriever.index is None and resolve_index_params(retriever.index_config)['type'] in _TRAINED_INDEX_TYPES
+
+    def _is_buffering(self, retriever: LocalKnowledgeBaseRetriever) -> bool:
+        """Индекс еще не обучен и выборка меньше train_sample_size: эмбеддинги остаются в буфере."""
+        buffered = sum(len(p) for p, _ in self._pending[retriever.model_name])
+        return self._needs_training_buffer(retriever) and buffered < resolve_index_params(retriever.index_config)['train_sample_size']
+
+    def _add_chunk(self, retriever: LocalKnowledgeBaseRetriever, prepared: list, embeddings: np.ndarray, flush: bool = False):
+        pending = self._pending[retriever.model_name]
+        if prepared:
+            pending.append((prepared, embeddings))
+        if not pending or (self._is_buffering(retriever) and not flush):
+            return
+        all_prepared = [item for p, _ in pending for item in p]
+        retriever.add_embeddings(all_prepared, np.concatenate([e for _, e in pending]), write_stores=False)
+        pending.clear()
+
+    def _write_records(self):
+        """Записывает накопленные записи в хранилища метаданных и атрибутов (каждое общее хранилище - один раз)."""
+        if not self._pending_records:
+            return
+        written = set()
+        for retriever in self.retrievers:
+            for store in (retriever.shared_meta_store, retriever.attributes):
+                if id(store) not in written:
+                    store.upsert(self._pending_records)
+                    written.add(id(store))
+        self._pending_records.clear()
+
+    def _checkpoint(self, fingerprint: dict, documents_done: int, finished: bool = False):
+        # Промежуточный чекпоинт не обучает индекс на неполной выборке: буфер переносится на следующие чекпоинты
+        for retriever in self.retrievers:
+            self._add_chunk(retriever, [], None, flush=finished)
+        if not any(self._is_buffering(retriever) and self._pending[retriever.model_name] for retriever in self.retrievers):
+            self._indexed_done = documents_done
+        # Хранилища пишутся до индексов: индекс на диске не ссылается на отсутствующие записи
+        self._write_records()
+        for retriever in self.retrievers:
+            if retriever.index is not None:
+                retriever.save_index_and_meta()
+        self._save_progress(fingerprint, self._indexed_done, finished)
+        logger.info("Чекпоинт: обработано %d документов, в индексах %d.", documents_done, self._indexed_done)
+
+    def run(self, source_path: str, restart: bool = False) -> int:
+        """
+        Индексирует источник, продолжая с последнего чекпоинта (если restart=False).
+        :return: Общее количество обработанных документов источника.
+        """
+        fingerprint = self._source_fingerprint(source_path)
+        documents_done = 0 if restart else self._load_progress(fingerprint)
+        # Старые позиционные индексы строятся заново с начала источника
+        if any([retriever.discard_legacy_index() for retriever in self.retrievers]):
+            documents_done = 0
+        self._indexed_done = documents_done
+        if documents_done:
+            logger.info("Продолжаем индексацию '%s' с документа %d.", source_path, documents_done)
+
+        documents = iter_documents(source_path)
+        lexical_builder = LexicalIndexBuilder() if self.lexical_index is not None else None
+        for _ in range(documents_done):
+            doc = next(documents, None)
+            # Пропущенные при продолжении документы тоже входят в лексический индекс
+            if lexical_builder is not None and doc is not None:
+                lexical_builder.add(doc)
+
+        primary = self.retrievers[0]
+        model_names = [r.model_name for r in self.retrievers]
+        executor = None
+        if self.workers > 0:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(model_names,))
+
+        def encode(texts):
+            if executor is not None:
+                return executor.submit(_encode_in_worker, texts)
+            return {r.model_name: r.indexing_model.encode(texts) for r in self.retrievers}
+
+        # Очередь чанков в работе: не более 2 * workers, чтобы память не росла с размером источника
+        in_flight: deque = deque()
+        max_in_flight = max(1, 2 * self.workers)
+        since_checkpoint = 0
+        try:
+            for chunk in _chunks(documents, self.chunk_size):
+                if lexical_builder is not None:
+                    for doc in chunk:
+                        lexical_builder.add(doc)
+                prepared = primary.prepare_documents(chunk)
+                texts = [text for _, text, _, _ in prepared]
+                in_flight.append((len(chunk), prepared, encode(texts) if texts else {}))
+                while len(in_flight) >= max_in_flight or (executor is None and in_flight):
+                    documents_done, since_checkpoint = self._consume(in_flight.popleft(), documents_done, since_checkpoint, fingerprint)
+            while in_flight:
+                documents_done, since_checkpoint = self._consume(in_flight.popleft(), documents_done, since_checkpoint, fingerprint)
+            self._checkpoint(fingerprint, documents_done, finished=True)
+            if lexical_builder is not None:
+                lexical_builder.finish(self.lexical_index)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        logger.info("Индексация завершена: %d документов, модели: %s.", documents_done, ', '.join(model_names))
+        return documents_done
+
+    def _consume(self, item, documents_done: int, since_checkpoint: int, fingerprint: dict) -> tuple[int, int]:
+        chunk_length, prepared, result = item
+        embeddings_by_model = result.result() if hasattr(result, 'result') else result
+        if prepared:
+            self._pending_records.update((label, record) for label, _, _, record in prepared)
+            for retriever in self.retrievers:
+                self._add_chunk(retriever, prepared, embeddings_by_model[retriever.model_name])
+        documents_done += chunk_length
+        since_checkpoint += chunk_length
+        if since_checkpoint >= self.checkpoint_every:
+            self._checkpoint(fingerprint, documents_done)
+            since_checkpoint = 0
+        return documents_done, since_checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая индексация экспорта каталога для нескольких моделей за один проход.")
+    parser.add_argument('--source', default=KNOWLEDGE_BASE_JSON_PATH, help="Путь к экспорту (.json или .jsonl)")
+    parser.add_argument('--models', nargs='+', default=[MAIN_RETRIEVER_MODEL, SECONDARY_RETRIEVER_MODEL])
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS, help="Количество процессов кодирования (0 - в текущем процессе)")
+    parser.add_argument('--chunk-size', type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument('--checkpoint-every', type=int, default=INGEST_CHECKPOINT_EVERY)
+    parser.add_argument('--restart', action='store_true', help="Игнорировать сохраненный прогресс и начать с начала")
+    args = parser.parse_args()
+    configure_logging()
+
+    knowledge_base_manager = KnowledgeBaseManager(EmbeddingModelManager())
+    retrievers = [knowledge_base_manager.get_retriever(model_name) for model_name in args.models]
+    pipeline = IngestionPipeline(retrievers, args.chunk_size, args.checkpoint_every, args.workers,
+                                 lexical_index=knowledge_base_manager.lexical_index)
+    pipeline.run(args.source, restart=args.restart)
+
+if __name__ == '__main__':
+    main()
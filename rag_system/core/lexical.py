@@ -0,0 +1,184 @@
+# core/lexical.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Iterable
+
+import numpy as np
+
+from rag_system.config import LEXICAL_FIELDS, LEXICAL_SKU_FIELD, BM25_K1, BM25_B
+from rag_system.core.attributes import contains_labels
+from rag_system.core.documents import document_label
+from rag_system.core.meta_store import load_npy, save_npy_atomic
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text: str) -> list[str]:
+    """Токенизация для BM25: нижний регистр, буквенно-цифровые последовательности (SKU разбивается по '-')."""
+    return _TOKEN_RE.findall(text.casefold())
+
+def normalize_sku(value: str) -> str:
+    return ' '.join(value.casefold().split())
+
+class LexicalIndex:
+    """
+    Предвычисленный инвертированный индекс BM25 по полям экспорта (LEXICAL_FIELDS) и точный словарь SKU.
+    Постинги хранятся в .npy файлах (открываются через mmap), словарь терминов и SKU - в JSON.
+    """
+    VOCAB_FILE = 'vocab.json'
+    SKU_FILE = 'sku.json'
+    META_FILE = 'meta.json'
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.vocab: dict[str, int] = {}
+        self.sku_labels: dict[str, list[int]] = {}
+        self.fingerprint: str | None = None
+        self.avg_doc_length = 0.0
+        self.term_offsets = np.zeros(1, dtype='int64')   # Постинги термина t: [term_offsets[t], term_offsets[t + 1])
+        self.postings_docs = np.empty(0, dtype='int32')  # Номер документа
+        self.postings_tf = np.empty(0, dtype='float32')  # Частота термина в документе
+        self.doc_labels = np.empty(0, dtype='int64')     # Номер документа -> метка (ID товара)
+        self.doc_lengths = np.empty(0, dtype='float32')
+        if os.path.exists(os.path.join(index_dir, self.META_FILE)):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.doc_labels)
+
+    def _load(self):
+        with open(os.path.join(self.index_dir, self.META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(self.index_dir, self.VOCAB_FILE), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(self.index_dir, self.SKU_FILE), 'r', encoding='utf-8') as f:
+            self.sku_labels = json.load(f)
+        self.fingerprint = meta['fingerprint']
+        self.avg_doc_length = meta['avg_doc_length']
+        for name in ('term_offsets', 'postings_docs', 'postings_tf', 'doc_labels', 'doc_lengths'):
+            setattr(self, name, load_npy(os.path.join(self.index_dir, f"{name}.npy")))
+        logger.info("Лексический индекс загружен из '%s': %d документов, %d терминов.", self.index_dir, len(self), len(self.vocab))
+
+    @staticmethod
+    def compute_fingerprint(documents: Iterable[dict]) -> str:
+        """Хэш индексируемых полей всех документов: индекс перестраивается, только если он изменился."""
+        digest = hashlib.blake2b(digest_size=16)
+        for doc in documents:
+            digest.update(repr((document_label(doc), [doc.get(field) for field in LEXICAL_FIELDS])).encode('utf-8'))
+        return digest.hexdigest()
+
+    def build(self, documents: Iterable[dict]):
+        """Строит инвертированный индекс и словарь SKU по документам экспорта и сохраняет их на диск."""
+        builder = LexicalIndexBuilder()
+        for doc in documents:
+            builder.add(doc)
+        builder.finish(self)
+
+    def _save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        for name in ('term_offsets', 'postings_docs', 'postings_tf', 'doc_labels', 'doc_lengths'):
+            save_npy_atomic(os.path.join(self.index_dir, f"{name}.npy"), getattr(self, name))
+        for file_name, payload in ((self.VOCAB_FILE, self.vocab), (self.SKU_FILE, self.sku_labels),
+                                   (self.META_FILE, {'fingerprint': self.fingerprint, 'avg_doc_length': self.avg_doc_length})):
+            path = os.path.join(self.index_dir, file_name)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+
+    def sync(self, documents: list[dict]) -> bool:
+        """Перестраивает индекс, если индексируемые поля экспорта изменились. :return: True, если индекс перестроен."""
+        if self.fingerprint == self.compute_fingerprint(documents):
+            logger.info("Лексический индекс уже соответствует экспорту.")
+            return False
+        self.build(documents)
+        return True
+
+    def lookup_sku(self, query_text: str) -> list[int]:
+        """Метки товаров с точно совпадающим артикулом (без учета регистра и лишних пробелов)."""
+        return self.sku_labels.get(normalize_sku(query_text), [])
+
+    def search(self, query_text: str, top_k: int, allowed_labels: np.ndarray | None = None) -> list[tuple[int, float]]:
+        """
+        BM25 поиск.
+        :param allowed_labels: Отсортированный массив разрешенных меток (фильтр по атрибутам); None - без фильтра.
+        :return: Список (метка, оценка) по убыванию оценки.
+        """
+        term_ids = [self.vocab[token] for token in set(tokenize(query_text)) if token in self.vocab]
+        if not term_ids or not len(self):
+            return []
+        n_docs = len(self)
+        avg_doc_length = self.avg_doc_length or 1.0 # Все документы без токенов
+        docs_parts, score_parts = [], []
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            idf = np.log(1.0 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths[docs] / avg_doc_length)
+            docs_parts.append(docs)
+            score_parts.append(idf * tf * (BM25_K1 + 1.0) / (tf + norm))
+        # Суммируем вклады терминов по документам только среди встретившихся постингов (без плотного массива на весь каталог)
+        unique_docs, inverse = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        if allowed_labels is not None:
+            keep = contains_labels(allowed_labels, self.doc_labels[unique_docs])
+            unique_docs, scores = unique_docs[keep], scores[keep]
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(self.doc_labels[unique_docs[i]]), float(scores[i])) for i in top]
+
+class LexicalIndexBuilder:
+    """
+    Накопитель постингов LexicalIndex: документы добавляются по одному, поэтому индекс можно построить
+    за тот же проход по экспорту, что и векторные индексы (см. ingest.IngestionPipeline).
+    Отпечаток совпадает с LexicalIndex.compute_fingerprint тех же документов.
+    """
+    def __init__(self):
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.doc_labels: list[int] = []
+        self.doc_lengths: list[int] = []
+        self.sku_labels: dict[str, list[int]] = {}
+        self._digest = hashlib.blake2b(digest_size=16)
+
+    def add(self, doc: dict):
+        label = document_label(doc)
+        self._digest.update(repr((label, [doc.get(field) for field in LEXICAL_FIELDS])).encode('utf-8'))
+        if label is None:
+            return
+        doc_number = len(self.doc_labels)
+        tokens = [token for field in LEXICAL_FIELDS if doc.get(field) for token in tokenize(str(doc[field]))]
+        counts: dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            self.postings.setdefault(token, []).append((doc_number, count))
+        self.doc_labels.append(label)
+        self.doc_lengths.append(len(tokens))
+        sku = doc.get(LEXICAL_SKU_FIELD)
+        if sku:
+            self.sku_labels.setdefault(normalize_sku(str(sku)), []).append(label)
+
+    def finish(self, index: LexicalIndex):
+        """Заполняет index накопленными постингами и сохраняет его на диск."""
+        postings = self.postings
+        terms = sorted(postings)
+        lengths = np.array([len(postings[term]) for term in terms], dtype='int64')
+        index.vocab = {term: i for i, term in enumerate(terms)}
+        index.term_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype('int64')
+        index.postings_docs = np.array([doc for term in terms for doc, _ in postings[term]], dtype='int32')
+        index.postings_tf = np.array([count for term in terms for _, count in postings[term]], dtype='float32')
+        index.doc_labels = np.array(self.doc_labels, dtype='int64')
+        index.doc_lengths = np.array(self.doc_lengths, dtype='float32')
+        index.avg_doc_length = float(index.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        index.sku_labels = self.sku_labels
+        index.fingerprint = self._digest.hexdigest()
+        index._save()
+        logger.info("Лексический индекс построен: %d документов, %d терминов, %d SKU.", len(index), len(index.vocab), len(index.sku_labels))
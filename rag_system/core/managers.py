@@ -1,35 +1,131 @@
 # core/managers.py
 
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 from rag_system.models.embeddings import IEmbeddingModel, SentenceTransformerEmbeddingModel # Импортируем конкретную модель
+from rag_system.models.cached_embeddings import CachedEmbeddingModel
+from rag_system.models.lazy_embeddings import LazyEmbeddingModel
+from rag_system.models.onnx_embeddings import OnnxEmbeddingModel
+from rag_system.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_TTL_SECONDS,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_BATCH_SIZE,
+    ONNX_QUANTIZE,
+    DOCUMENT_STORE_DIR,
+    LEXICAL_INDEX_DIR,
+    ASYNC_EXECUTOR_WORKERS,
+    ASYNC_MAX_PENDING_REQUESTS,
+    ASYNC_REQUEST_TIMEOUT_SECONDS,
+    LAZY_MODEL_LOADING,
+    WARMUP_MODELS,
+    WARMUP_BATCH_SIZE
+)
 from rag_system.core.retriever import LocalKnowledgeBaseRetriever                      # Импортируем ретривер
+from rag_system.core.meta_store import DocumentMetaStore
+from rag_system.core.attributes import AttributeStore
+from rag_system.core.lexical import LexicalIndex
+from rag_system.core.hybrid import HybridRetriever
+from rag_system.core.batching import MicroBatchingRetriever
+from rag_system.core.metrics import metrics
+from rag_system.core.router import QueryRouter, RouteDecision, merge_results
+
+logger = logging.getLogger(__name__)
+
+class ServiceOverloadedError(RuntimeError):
+    """Запрос отклонен: превышено ASYNC_MAX_PENDING_REQUESTS одновременных запросов."""
 
 class EmbeddingModelManager:
     def __init__(self):
         self._models: dict[str, IEmbeddingModel] = {} # Словарь для хранения загруженных моделей
 
-    def load_model(self, model_name: str) -> IEmbeddingModel:
+    def load_model(self, model_name: str, use_cache: bool = EMBEDDING_CACHE_ENABLED,
+                   lazy: bool = LAZY_MODEL_LOADING) -> IEmbeddingModel:
         """
         Загружает модель эмбеддингов по имени. Если модель уже загружена, возвращает её.
         :param model_name: Имя модели для загрузки/получения.
+        :param use_cache: Обернуть модель в кэш эмбеддингов запросов (не нужен, например, для индексации).
+        :param lazy: Отложить загрузку весов до первого encode/get_dimension (см. LazyEmbeddingModel).
         :return: Экземпляр IEmbeddingModel.
         """
         if model_name not in self._models:
-            # Здесь мы можем добавить логику для разных типов моделей,
-            # но пока используем только SentenceTransformer
+            # Бэкенд (PyTorch SentenceTransformer или onnxruntime) выбирается через EMBEDDING_BACKEND в config.py
             if model_name.startswith("paraphrase-") or "MiniLM-L" in model_name: # Более общее условие
-                self._models[model_name] = SentenceTransformerEmbeddingModel(model_name)
+                if EMBEDDING_BACKEND == 'onnx':
+                    factory = lambda: OnnxEmbeddingModel(model_name)
+                else:
+                    factory = lambda: SentenceTransformerEmbeddingModel(model_name)
             else:
                 # В будущем можно добавить поддержку других типов моделей
                 raise ValueError(f"Неизвестный тип модели: {model_name}. Добавьте реализацию.")
-        
-        # Проверка, успешно ли загрузилась модель
-        if self._models[model_name].get_dimension() == 0:
-            print(f"Предупреждение: Модель '{model_name}' не смогла быть загружена.")
+            self._models[model_name] = LazyEmbeddingModel(model_name, factory) if lazy else factory()
+
+        # Проверка, успешно ли загрузилась модель (отложенная модель проверяется при первом использовании)
+        if (not lazy or self.is_loaded(model_name)) and self._models[model_name].get_dimension() == 0:
+            logger.warning("Модель '%s' не смогла быть загружена.", model_name)
             del self._models[model_name] # Удаляем неудачно загруженную модель
             raise RuntimeError(f"Модель '{model_name}' не загружена, проверьте логи.")
-            
+
+        if use_cache and not isinstance(self._models[model_name], CachedEmbeddingModel):
+            self._models[model_name] = self._wrap_with_cache(self._models[model_name])
+
         return self._models[model_name]
 
+    def _wrap_with_cache(self, model: IEmbeddingModel) -> CachedEmbeddingModel:
+        """Оборачивает модель в LRU/TTL кэш эмбеддингов запросов согласно config.py."""
+        persist_path = None
+        if EMBEDDING_CACHE_DIR:
+            safe_model_name = model.get_name().replace('/', '_').replace('-', '_')
+            # Эмбеддинги разных бэкендов (и int8/fp32 вариантов ONNX) немного отличаются, поэтому кэши у них раздельные
+            backend = EMBEDDING_BACKEND
+            if EMBEDDING_BACKEND == 'onnx':
+                backend += '_int8' if ONNX_QUANTIZE else '_fp32'
+            persist_path = os.path.join(EMBEDDING_CACHE_DIR, f"{safe_model_name}_{backend}.npz")
+        return CachedEmbeddingModel(
+            model,
+            max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+            persist_path=persist_path,
+            max_batch_size=EMBEDDING_CACHE_MAX_BATCH_SIZE
+        )
+
+    def is_loaded(self, model_name: str) -> bool:
+        """True, если веса модели уже загружены (для отложенной модели - был хотя бы один encode/get_dimension)."""
+        model = self._models.get(model_name)
+        if isinstance(model, CachedEmbeddingModel):
+            model = model.wrapped_model
+        return model is not None and (not isinstance(model, LazyEmbeddingModel) or model.is_loaded)
+
+    def get_load_times(self) -> dict[str, float]:
+        """Время загрузки (в секундах) отложенных моделей, которые уже были загружены."""
+        load_times = {}
+        for name, model in self._models.items():
+            if isinstance(model, CachedEmbeddingModel):
+                model = model.wrapped_model
+            if isinstance(model, LazyEmbeddingModel) and model.load_seconds is not None:
+                load_times[name] = model.load_seconds
+        return load_times
+
+    def save_caches(self):
+        """Сохраняет на диск кэши эмбеддингов всех загруженных моделей (если включено сохранение)."""
+        for name, model in self._models.items():
+            # Кэш модели, которая так и не понадобилась, не менялся
+            if isinstance(model, CachedEmbeddingModel) and self.is_loaded(name):
+                model.save()
+
+    def get_cache_stats(self) -> dict[str, dict]:
+        """Возвращает счетчики попаданий/промахов кэша по каждой загруженной модели."""
+        return {name: model.get_stats() for name, model in self._models.items() if isinstance(model, CachedEmbeddingModel)}
+
     def get_model(self, model_name: str) -> IEmbeddingModel:
         """
         Возвращает загруженную модель по имени. Вызывает ошибку, если модель не загружена.
@@ -42,16 +138,208 @@ class KnowledgeBaseManager:
     def __init__(self, embedding_model_manager: EmbeddingModelManager):
         self.embedding_model_manager = embedding_model_manager
         self._retrievers: dict[str, LocalKnowledgeBaseRetriever] = {}
+        # RLock: свойства meta_store/attribute_store/lexical_index создаются в том числе внутри get_retriever
+        self._retrievers_lock = threading.RLock()
+        # Хранилище метаданных и лексический индекс открываются при первом обращении (см. свойства ниже)
+        self._meta_store: DocumentMetaStore | None = None
+        self._attribute_store: AttributeStore | None = None
+        self._lexical_index: LexicalIndex | None = None
+        self._hybrid_retrievers: dict[str, HybridRetriever] = {}
+        # Микро-батчеры асинхронного API: параллельные запросы к одной модели объединяются в один encode + поиск
+        self._batchers: dict[str, MicroBatchingRetriever] = {}
+        # Выбор модели для запроса (письменность + классификатор по журналу запросов)
+        self.router = QueryRouter()
+        # Ограниченный пул потоков для открытия ретриверов в aretrieve (создается при первом асинхронном запросе)
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending_requests = 0
+
+    @property
+    def meta_store(self) -> DocumentMetaStore:
+        """Одно хранилище метаданных документов на все ретриверы (записи не дублируются по моделям)."""
+        with self._retrievers_lock:
+            if self._meta_store is None:
+                self._meta_store = DocumentMetaStore(DOCUMENT_STORE_DIR)
+            return self._meta_store
+
+    @property
+    def attribute_store(self) -> AttributeStore:
+        """Одно колоночное хранилище атрибутов для фильтрации (цена, тип) на все ретриверы."""
+        with self._retrievers_lock:
+            if self._attribute_store is None:
+                self._attribute_store = AttributeStore(DOCUMENT_STORE_DIR)
+            return self._attribute_store
+
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        """Один лексический индекс (BM25 + артикулы) на все модели."""
+        with self._retrievers_lock:
+            if self._lexical_index is None:
+                self._lexical_index = LexicalIndex(LEXICAL_INDEX_DIR)
+            return self._lexical_index
 
     def get_retriever(self, model_name: str) -> LocalKnowledgeBaseRetriever:
         """
         Возвращает ретривер для указанной модели.
         Если ретривер еще не создан, он будет инициализирован и загружен.
+        При LAZY_MODEL_LOADING открывается только индекс; веса модели загружаются при первом encode.
+        """
+        # Блокировка нужна, чтобы параллельные запросы из пула потоков не загрузили модель дважды
+        with self._retrievers_lock:
+            if model_name not in self._retrievers:
+                logger.info("Инициализация ретривера для модели: %s...", model_name)
+                # Получаем модель эмбеддингов из менеджера
+                embedding_model_instance = self.embedding_model_manager.load_model(model_name)
+                # Передаем загруженную модель ретриверу
+                with metrics.timer('index_load', model=model_name):
+                    self._retrievers[model_name] = LocalKnowledgeBaseRetriever(
+                        embedding_model_instance, meta_store=self.meta_store, attribute_store=self.attribute_store)
+            return self._retrievers[model_name]
+
+    def warm_up(self, model_names: list[str] | None = None, batch_size: int = WARMUP_BATCH_SIZE) -> dict[str, float]:
+        """
+        Прогрев: загружает модели и индексы и прогоняет пробный батч (encode + index.search),
+        чтобы первый реальный запрос не платил за загрузку весов, инициализацию потоков и холодные страницы индекса.
+        Пробные тексты кодируются мимо кэша эмбеддингов, чтобы не засорять его и его статистику.
+        :param model_names: Модели для прогрева (по умолчанию WARMUP_MODELS).
+        :param batch_size: Размер пробного батча.
+        :return: Словарь {имя модели: время прогрева в секундах}.
+        """
+        timings = {}
+        for model_name in model_names if model_names is not None else WARMUP_MODELS:
+            start = time.perf_counter()
+            retriever = self.get_retriever(model_name)
+            model = retriever.indexing_model
+            if model.get_dimension() == 0:
+                logger.warning("Модель '%s' не загружена, прогрев пропущен.", model_name)
+                continue
+            # Тексты разной длины, чтобы прогреть и короткие запросы, и длинные последовательности
+            texts = [' '.join(['прогрев'] * (4 * (i + 1))) for i in range(batch_size)]
+            embeddings = model.encode(texts)
+            if retriever.index is not None and retriever.index.ntotal:
+                retriever.index.search(embeddings, min(10, retriever.index.ntotal))
+            timings[model_name] = time.perf_counter() - start
+            metrics.observe('warm_up_seconds', timings[model_name], model=model_name)
+            logger.info("Модель '%s' прогрета за %.2f с.", model_name, timings[model_name])
+        return timings
+
+    def get_hybrid_retriever(self, model_name: str) -> HybridRetriever:
+        """
+        Возвращает гибридный (BM25 + векторный) ретривер для указанной модели.
+        Точные артикулы находятся без вызова модели эмбеддингов.
+        """
+        retriever = self.get_retriever(model_name)
+        with self._retrievers_lock:
+            if model_name not in self._hybrid_retrievers:
+                self._hybrid_retrievers[model_name] = HybridRetriever(retriever, self.lexical_index)
+            return self._hybrid_retrievers[model_name]
+
+    def get_batcher(self, model_name: str) -> MicroBatchingRetriever:
+        """
+        Возвращает микро-батчер гибридного ретривера модели (один фоновый поток на модель), через который идет aretrieve.
+        Ранжирование то же, что у retrieve_routed с настройками по умолчанию (BM25 + векторный поиск, точные артикулы).
+        """
+        retriever = self.get_hybrid_retriever(model_name)
+        with self._retrievers_lock:
+            if model_name not in self._batchers:
+                self._batchers[model_name] = MicroBatchingRetriever(retriever)
+            return self._batchers[model_name]
+
+    def retrieve_routed(self, query_text: str, top_k: int = 3, hybrid: bool = True,
+                        filters: dict | None = None) -> tuple[list[dict], RouteDecision]:
+        """
+        Поиск с автоматическим выбором модели: запрос кодируется одной моделью, выбранной маршрутизатором.
+        При fan-out (низкая уверенность, ROUTER_FANOUT) запрос ищется всеми выбранными моделями,
+        а результаты объединяются через reciprocal-rank fusion.
+        :param query_text: Текст запроса.
+        :param top_k: Количество документов.
+        :param hybrid: Использовать гибридные (BM25 + векторные) ретриверы.
+        :param filters: Фильтры по атрибутам, например {'price_max': 10000} (см. attributes.validate_filters).
+        :return: (список документов 'id', 'text', 'score'; решение маршрутизатора).
+        """
+        decision = self.router.route(query_text)
+        get_retriever = self.get_hybrid_retriever if hybrid else self.get_retriever
+        if len(decision.model_names) == 1:
+            return get_retriever(decision.model_name).retrieve(query_text, top_k, filters), decision
+        results = [get_retriever(model_name).retrieve(query_text, top_k, filters) for model_name in decision.model_names]
+        return merge_results(results, top_k), decision
+
+    def sync_lexical_index(self, documents: list[dict]) -> bool:
+        """Перестраивает лексический индекс, если индексируемые поля экспорта изменились."""
+        return self.lexical_index.sync(documents)
+
+    async def aretrieve(self, model_name: str | None, query_text: str, top_k: int = 3,
+                        timeout: float | None = ASYNC_REQUEST_TIMEOUT_SECONDS, filters: dict | None = None) -> list[dict]:
+        """
+        Асинхронный поиск через микро-батчер модели: параллельные запросы объединяются в один encode
+        и один index.search, а event loop не блокируется ни кодированием, ни поиском.
+        Открытие ретривера (первый запрос к модели) выполняется в ограниченном пуле потоков.
+        :param model_name: Имя модели ретривера (None - модель выбирает маршрутизатор, см. retrieve_routed).
+        :param query_text: Текст запроса.
+        :param top_k: Количество документов.
+        :param timeout: Таймаут запроса в секундах (None - без таймаута).
+        :param filters: Фильтры по атрибутам (см. attributes.validate_filters).
+        :return: Список документов ('id', 'text', 'score').
+        :raises ServiceOverloadedError: Если в обработке уже ASYNC_MAX_PENDING_REQUESTS запросов.
+        :raises TimeoutError: Если запрос не уложился в timeout.
+        """
+        return (await self.aretrieve_routed(query_text, top_k, timeout, filters, model_name))[0]
+
+    async def aretrieve_routed(self, query_text: str, top_k: int = 3, timeout: float | None = ASYNC_REQUEST_TIMEOUT_SECONDS,
+                               filters: dict | None = None, model_name: str | None = None) -> tuple[list[dict], RouteDecision]:
+        """
+        То же, что aretrieve, но возвращает и решение маршрутизатора: модели, которые фактически обработали запрос.
+        :return: (список документов 'id', 'text', 'score'; решение маршрутизатора, для явной модели - reason 'explicit').
+        """
+        if self._pending_requests >= ASYNC_MAX_PENDING_REQUESTS:
+            # Отказ происходит до маршрутизации: запросы без явной модели помечаются 'auto'
+            metrics.inc('requests_rejected_total', model=model_name or 'auto')
+            raise ServiceOverloadedError(f"Слишком много одновременных запросов ({self._pending_requests}). Повторите позже.")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=ASYNC_EXECUTOR_WORKERS, thread_name_prefix='retrieval')
+
+        # Маршрутизация дешевая (подсчет символов и n-грамм) и выполняется прямо в event loop
+        decision = RouteDecision([model_name], 1.0, 'explicit') if model_name is not None else self.router.route(query_text)
+        self._pending_requests += 1
+        try:
+            try:
+                return await asyncio.wait_for(self._retrieve_batched(decision, query_text, top_k, filters), timeout), decision
+            except asyncio.TimeoutError:
+                metrics.inc('request_timeouts_total', model=decision.model_name)
+                # Поток пула доработает запрос в фоне, но вызывающий получает ошибку сразу
+                raise TimeoutError(f"Запрос к модели '{decision.model_name}' не уложился в {timeout} с.") from None
+        finally:
+            self._pending_requests -= 1
+
+    async def _retrieve_batched(self, decision: RouteDecision, query_text: str, top_k: int, filters: dict | None) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        batchers = await loop.run_in_executor(self._executor, lambda: [self.get_batcher(name) for name in decision.model_names])
+        # Отмена по таймауту отменяет и Future в очереди батчера: такие запросы батчер пропускает
+        results = await asyncio.gather(*(asyncio.wrap_future(batcher.submit(query_text, top_k, filters)) for batcher in batchers))
+        return results[0] if len(results) == 1 else merge_results(list(results), top_k)
+
+    def close(self):
+        """Останавливает микро-батчеры и пул потоков асинхронного API."""
+        with self._retrievers_lock:
+            batchers, self._batchers = list(self._batchers.values()), {}
+        for batcher in batchers:
+            batcher.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def prune_meta_store(self) -> int:
+        """
+        Удаляет из общих хранилищ метаданных и атрибутов записи, на которые не ссылается ни один загруженный ретривер
+        (например, товары, удаленные из каталога после синхронизации всех моделей).
+        :return: Количество удаленных записей.
         """
-        if model_name not in self._retrievers:
-            print(f"Инициализация ретривера для модели: {model_name}...")
-            # Получаем модель эмбеддингов из менеджера
-            embedding_model_instance = self.embedding_model_manager.load_model(model_name)
-            # Передаем загруженную модель ретриверу
-            self._retrievers[model_name] = LocalKnowledgeBaseRetriever(embedding_model_instance)
-        return self._retrievers[model_name]
\ No newline at end of file
+        referenced = [retriever.indexed_labels() for retriever in self._retrievers.values()
+                      if retriever.documents_meta is self.meta_store]
+        if not referenced:
+            return 0
+        stale = np.setdiff1d(self.meta_store.labels(), np.concatenate(referenced))
+        removed = self.meta_store.remove(stale)
+        self.attribute_store.remove(np.setdiff1d(self.attribute_store.labels(), np.concatenate(referenced)))
+        if removed:
+            logger.info("Из хранилища метаданных удалено %d записей удаленных товаров.", removed)
+        return removed
@@ -0,0 +1,207 @@
+# core/meta_store.py
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import threading
+
+import numpy as np
+
+from rag_system.core.documents import content_hash
+from rag_system.core.metrics import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Запись индекса: метка FAISS, смещение и длина записи в records.bin, хэш содержимого записи
+INDEX_DTYPE = np.dtype([('label', '<i8'), ('offset', '<i8'), ('length', '<i4'), ('hash', '<i8')])
+
+# Компактизация records.bin, если мертвых байт больше, чем живых, и больше этого порога
+_COMPACT_MIN_DEAD_BYTES = 1 << 20
+
+def load_npy(path: str) -> np.ndarray:
+    """Открывает .npy файл через mmap (пустые массивы mmap не поддерживают - читаются обычным образом)."""
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
+
+def save_npy_atomic(path: str, array: np.ndarray):
+    """Сохраняет массив во временный файл и атомарно заменяет им path."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+class DocumentMetaStore:
+    """
+    Компактное хранилище метаданных документов на диске, общее для ретриверов всех моделей.
+    records.bin - записи (компактный JSON в UTF-8) подряд; records_index.npy - отсортированный по метке
+    индекс смещений. Оба файла открываются через mmap: старт не зависит от размера каталога,
+    страницы разделяются между процессами, а декодируются только запрошенные записи (top_k хитов).
+    """
+    RECORDS_FILE = 'records.bin'
+    INDEX_FILE = 'records_index.npy'
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.records_path = os.path.join(store_dir, self.RECORDS_FILE)
+        self.index_path = os.path.join(store_dir, self.INDEX_FILE)
+        self._write_lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        index = load_npy(self.index_path) if os.path.exists(self.index_path) else np.empty(0, dtype=INDEX_DTYPE)
+        records = b''
+        if os.path.exists(self.records_path) and os.path.getsize(self.records_path) > 0:
+            with open(self.records_path, 'rb') as f:
+                records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Читатели берут снимок (index, records) одним присваиванием, поэтому обновления не требуют блокировки чтения
+        self._snapshot = (index, records)
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+    def __contains__(self, label: int) -> bool:
+        return self._position(self._snapshot[0], label) is not None
+
+    @staticmethod
+    def _position(index: np.ndarray, label: int) -> int | None:
+        position = int(np.searchsorted(index['label'], label))
+        if position < len(index) and index['label'][position] == label:
+            return position
+        return None
+
+    def labels(self) -> np.ndarray:
+        """Отсортированный массив меток всех записей."""
+        return self._snapshot[0]['label']
+
+    def get(self, label: int) -> dict | None:
+        """Декодирует и возвращает запись по метке или None, если записи нет."""
+        return self.get_many([label])[0]
+
+    def get_many(self, labels) -> list[dict | None]:
+        """Декодирует записи для списка меток (только их), сохраняя порядок; отсутствующие - None."""
+        index, records = self._snapshot
+        labels = np.asarray(labels, dtype='int64')
+        if not len(index) or not len(labels):
+            return [None] * len(labels)
+        positions = np.minimum(np.searchsorted(index['label'], labels), len(index) - 1)
+        found = index['label'][positions] == labels
+        result = []
+        for position, is_found in zip(positions, found):
+            if not is_found:
+                result.append(None)
+                continue
+            entry = index[position]
+            offset, length = int(entry['offset']), int(entry['length'])
+            result.append(json.loads(records[offset:offset + length].decode('utf-8')))
+        return result
+
+    def upsert(self, records: dict[int, dict]) -> int:
+        """
+        Добавляет или обновляет записи. Неизменные (по хэшу) записи не переписываются.
+        :param records: Словарь {метка: запись}.
+        :return: Количество записанных записей.
+        """
+        if not records:
+            return 0
+        with self._write_lock:
+            index, _ = self._snapshot
+            labels = np.fromiter(records.keys(), dtype='int64', count=len(records))
+            payloads = [json.dumps(record, ensure_ascii=False, separators=(',', ':')) for record in records.values()]
+            hashes = np.fromiter((content_hash(payload) for payload in payloads), dtype='int64', count=len(payloads))
+
+            changed = np.ones(len(labels), dtype=bool)
+            if len(index):
+                positions = np.minimum(np.searchsorted(index['label'], labels), len(index) - 1)
+                changed = ~((index['label'][positions] == labels) & (index['hash'][positions] == hashes))
+            if not changed.any():
+                return 0
+
+            new_entries = np.empty(int(changed.sum()), dtype=INDEX_DTYPE)
+            offset = os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+            with open(self.records_path, 'ab') as f:
+                for i, row in enumerate(np.flatnonzero(changed)):
+                    data = payloads[row].encode('utf-8')
+                    f.write(data)
+                    new_entries[i] = (labels[row], offset, len(data), hashes[row])
+                    offset += len(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            kept = index[~np.isin(index['label'], new_entries['label'])]
+            merged = np.concatenate([kept, new_entries])
+            self._replace_index(merged[np.argsort(merged['label'], kind='stable')])
+            return len(new_entries)
+
+    def remove(self, labels) -> int:
+        """Удаляет записи с указанными метками. :return: Количество удаленных записей."""
+        labels = np.asarray(list(labels), dtype='int64')
+        if not len(labels):
+            return 0
+        with self._write_lock:
+            index, _ = self._snapshot
+            drop = np.isin(index['label'], labels)
+            if not drop.any():
+                return 0
+            self._replace_index(index[~drop])
+            return int(drop.sum())
+
+    def _replace_index(self, new_index: np.ndarray):
+        save_npy_atomic(self.index_path, new_index)
+        self._open()
+        live_bytes = int(new_index['length'].sum()) if len(new_index) else 0
+        dead_bytes = os.path.getsize(self.records_path) - live_bytes if os.path.exists(self.records_path) else 0
+        if dead_bytes > max(live_bytes, _COMPACT_MIN_DEAD_BYTES):
+            self._compact()
+
+    def _compact(self):
+        """Переписывает records.bin без мертвых записей (старые mmap у читателей остаются валидны)."""
+        index, records = self._snapshot
+        new_index = index.copy()
+        tmp_path = self.records_path + '.tmp'
+        offset = 0
+        with open(tmp_path, 'wb') as f:
+            for i, entry in enumerate(index):
+                start, length = int(entry['offset']), int(entry['length'])
+                f.write(records[start:start + length])
+                new_index[i]['offset'] = offset
+                offset += length
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.records_path)
+        save_npy_atomic(self.index_path, new_index)
+        self._open()
+        logger.info("Хранилище метаданных '%s' компактизировано: %d записей, %d байт.", self.store_dir, len(new_index), offset)
+
+def convert_json_meta(json_path: str, store: DocumentMetaStore, positional: bool = False) -> dict[int, int]:
+    """
+    Конвертирует старый documents_meta.json в DocumentMetaStore.
+    :param json_path: Путь к documents_meta.json (список словарей {'id', 'desc', ['hash']}).
+    :param store: Хранилище, в которое записываются записи.
+    :param positional: True для старых индексов без IDMap, где меткой FAISS служит позиция документа.
+    :return: Словарь {метка FAISS: хэш текста} для состояния индекса модели.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        documents_meta = json.load(f)
+    records, hashes = {}, {}
+    for position, meta in enumerate(documents_meta):
+        label = position if positional else int(meta['id'])
+        records[label] = {'id': meta['id'], 'desc': meta['desc']}
+        hashes[label] = meta.get('hash', content_hash(meta['desc']))
+    store.upsert(records)
+    logger.info("Метаданные из '%s' сконвертированы в '%s' (%d записей).", json_path, store.store_dir, len(records))
+    return hashes
+
+if __name__ == '__main__':
+    # Пример: python -m rag_system.core.meta_store faiss_indexes/<model>/documents_meta.json faiss_indexes/<model>/documents --positional
+    parser = argparse.ArgumentParser(description="Конвертация documents_meta.json в бинарное хранилище метаданных.")
+    parser.add_argument('json_path', help="Путь к documents_meta.json")
+    parser.add_argument('store_dir', help="Каталог хранилища DocumentMetaStore")
+    parser.add_argument('--positional', action='store_true', help="Метки FAISS - позиции документов (старые индексы без IDMap)")
+    args = parser.parse_args()
+    configure_logging()
+    convert_json_meta(args.json_path, DocumentMetaStore(args.store_dir), positional=args.positional)
@@ -0,0 +1,196 @@
+# core/metrics.py
+#
+# Легковесная инструментация горячего пути: счетчики и гистограммы длительности этапов
+# (encode, search, metadata_lookup, save, ...) с метками (модель, этап).
+# Метрики отдаются в текстовом формате Prometheus (GET /metrics в http_server.py)
+# или передаются подписчикам через add_listener (например, в StatsD/OpenTelemetry).
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from rag_system.config import LOG_LEVEL, METRICS_ENABLED, METRICS_LATENCY_BUCKETS
+
+# Подписчик: callback(тип метрики 'counter'/'histogram', имя, метки, значение)
+MetricsListener = Callable[[str, str, dict, float], None]
+
+# Описания метрик для # HELP в выводе Prometheus
+METRIC_DESCRIPTIONS = {
+    'stage_seconds': "Длительность этапов обработки (encode, search, metadata_lookup, save, ...)",
+    'queries_total': "Количество обработанных запросов поиска",
+    'documents_indexed_total': "Количество документов, добавленных в индексы",
+    'embedding_cache_hits_total': "Попадания в кэш эмбеддингов запросов",
+    'embedding_cache_misses_total': "Промахи кэша эмбеддингов запросов",
+    'requests_rejected_total': "Запросы, отклоненные из-за перегрузки (backpressure)",
+    'request_timeouts_total': "Запросы, не уложившиеся в таймаут",
+    'warm_up_seconds': "Длительность прогрева моделей",
+    'startup_seconds': "Длительность этапов запуска",
+    'router_decisions_total': "Решения маршрутизатора запросов по моделям и причинам",
+}
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'sum', 'count')
+
+    def __init__(self, n_buckets: int):
+        self.bucket_counts = [0] * (n_buckets + 1) # Последний бакет - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+class _Timer:
+    """Контекстный менеджер, записывающий длительность блока в гистограмму stage_seconds."""
+    __slots__ = ('_registry', '_labels', '_start')
+
+    def __init__(self, registry: 'MetricsRegistry', labels: dict):
+        self._registry = registry
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._registry.observe('stage_seconds', time.perf_counter() - self._start, **self._labels)
+        return False
+
+class _NullTimer:
+    """Заглушка таймера при выключенных метриках (без вызовов perf_counter и блокировок)."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class MetricsRegistry:
+    """
+    Потокобезопасный реестр счетчиков и гистограмм.
+    При enabled=False все операции - no-op, поэтому инструментация не стоит ничего на горячем пути.
+    """
+    def __init__(self, enabled: bool = True, buckets: tuple[float, ...] = METRICS_LATENCY_BUCKETS, prefix: str = 'rag_'):
+        """
+        :param enabled: Собирать ли метрики.
+        :param buckets: Верхние границы бакетов гистограмм (в секундах, по возрастанию).
+        :param prefix: Префикс имен метрик в выводе Prometheus.
+        """
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, _Histogram]] = {}
+        self._listeners: list[MetricsListener] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: MetricsListener):
+        """Подписывает callback на каждое изменение метрик (вызывается синхронно, должен быть быстрым)."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: MetricsListener):
+        self._listeners.remove(listener)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличивает счетчик name с метками labels на value."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        for listener in self._listeners:
+            listener('counter', name, labels, value)
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавляет наблюдение value в гистограмму name с метками labels."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(self.buckets))
+            histogram.bucket_counts[bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+        for listener in self._listeners:
+            listener('histogram', name, labels, value)
+
+    def timer(self, stage: str, **labels):
+        """
+        Контекстный менеджер для замера этапа: with metrics.timer('encode', model=name): ...
+        Длительность записывается в гистограмму stage_seconds с меткой stage.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, dict(labels, stage=stage))
+
+    def snapshot(self) -> dict:
+        """
+        Снимок метрик для программного использования.
+        :return: {'counters': {имя: {метки: значение}}, 'histograms': {имя: {метки: {'count', 'sum', 'buckets'}}}};
+                 метки - строки вида 'model=...,stage=...'.
+        """
+        def format_key(key):
+            return ','.join(f"{k}={v}" for k, v in key)
+
+        with self._lock:
+            return {
+                'counters': {name: {format_key(key): value for key, value in series.items()}
+                             for name, series in self._counters.items()},
+                'histograms': {name: {format_key(key): {'count': h.count, 'sum': h.sum, 'buckets': list(h.bucket_counts)}
+                                      for key, h in series.items()}
+                               for name, series in self._histograms.items()}
+            }
+
+    def render_prometheus(self) -> str:
+        """Сериализует метрики в текстовый формат Prometheus (version 0.0.4)."""
+        def series_order(item):
+            # Значения меток сравниваются как строки: None или число в метке не ломает сортировку серий
+            return tuple((k, str(v)) for k, v in item[0])
+
+        def format_labels(key, extra=()):
+            pairs = [*key, *extra]
+            if not pairs:
+                return ''
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full_name = self.prefix + name
+                if name in METRIC_DESCRIPTIONS:
+                    lines.append(f"# HELP {full_name} {METRIC_DESCRIPTIONS[name]}")
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(series.items(), key=series_order):
+                    lines.append(f"{full_name}{format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                full_name = self.prefix + name
+                if name in METRIC_DESCRIPTIONS:
+                    lines.append(f"# HELP {full_name} {METRIC_DESCRIPTIONS[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, histogram in sorted(series.items(), key=series_order):
+                    cumulative = 0
+                    for bound, count in zip((*self.buckets, '+Inf'), histogram.bucket_counts):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{format_labels(key, (('le', bound),))} {cumulative}")
+                    lines.append(f"{full_name}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{full_name}_count{format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+def configure_logging(level: str | int = LOG_LEVEL):
+    """Настраивает корневой логгер для точек входа (main.py, CLI модулей). Библиотечный код только пишет в логгеры."""
+    logging.basicConfig(level=level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+# Реестр процесса, используемый ретриверами, менеджерами и HTTP эндпоинтом
+metrics = MetricsRegistry(METRICS_ENABLED)
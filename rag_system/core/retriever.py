@@ -1,150 +1,530 @@
 # rag_system/core/retriever.py
 
-import json
+import logging
 import os
+import threading
+from collections import OrderedDict
+
 import faiss
 import numpy as np
 
 from rag_system.models.embeddings import IEmbeddingModel # Импортируем интерфейс модели
-from rag_system.config import BASE_INDEX_DIR             # Импортируем константу из config.py
+from rag_system.models.cached_embeddings import CachedEmbeddingModel
+from rag_system.config import (  # Импортируем константы из config.py
+    INDEX_CONFIGS, DOCUMENT_STORE_DIR, FAISS_INDEX_MMAP, FILTER_EXACT_MAX_CANDIDATES, FILTER_CACHE_SIZE
+)
+from rag_system.core.index_factory import (
+    get_model_index_dir, build_index, read_index, apply_search_params, compare_with_flat,
+    search_with_labels, exact_search_labels, label_selector
+)
+from rag_system.core.attributes import AttributeStore, filters_key
+from rag_system.core.documents import TEXT_KEYS_PRIORITY, extract_text, document_label, content_hash, build_record
+from rag_system.core.meta_store import DocumentMetaStore, convert_json_meta, load_npy, save_npy_atomic
+from rag_system.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Состояние индекса модели: метка FAISS и хэш текста, по которому был посчитан эмбеддинг
+STATE_DTYPE = np.dtype([('label', '<i8'), ('hash', '<i8')])
 
 class LocalKnowledgeBaseRetriever:
-    def __init__(self, embedding_model: IEmbeddingModel): # Принимает уже загруженную модель
+    def __init__(self, embedding_model: IEmbeddingModel, index_config: dict | None = None,
+                 meta_store: DocumentMetaStore | None = None, use_mmap: bool = FAISS_INDEX_MMAP,
+                 attribute_store: AttributeStore | None = None, index_dir: str | None = None): # Принимает уже загруженную модель
         self.embedding_model = embedding_model
         self.model_name = self.embedding_model.get_name()
-        
+        # Тексты документов кодируются мимо кэша эмбеддингов запросов: иначе небольшие синхронизации
+        # (ниже порога размера батча кэша) вытесняли бы из него горячие запросы
+        self.indexing_model = embedding_model.wrapped_model if isinstance(embedding_model, CachedEmbeddingModel) else embedding_model
+        # Конфигурация типа индекса (Flat/HNSW/IVF/PQ) для этой модели
+        self.index_config = index_config if index_config is not None else INDEX_CONFIGS.get(self.model_name, {'type': 'flat'})
+        # Общее для всех моделей хранилище метаданных документов (метки - ID товаров)
+        self.shared_meta_store = meta_store if meta_store is not None else DocumentMetaStore(DOCUMENT_STORE_DIR)
+        # Общее колоночное хранилище атрибутов для фильтрации (цена, тип товара)
+        self.attributes = attribute_store if attribute_store is not None else AttributeStore(DOCUMENT_STORE_DIR)
+
         # Пути к файлам индекса и метаданных для этой конкретной модели
-        # Заменяем символы, которые могут быть проблемой в именах файлов
-        safe_model_name = self.model_name.replace('/', '_').replace('-', '_')
-        self.model_index_dir = os.path.join(BASE_INDEX_DIR, safe_model_name)
+        # (index_dir - другой каталог, например временный для бенчмарка)
+        self.model_index_dir = index_dir if index_dir is not None else get_model_index_dir(self.model_name)
         self.faiss_index_path = os.path.join(self.model_index_dir, 'faiss_index.bin')
+        self.index_state_path = os.path.join(self.model_index_dir, 'index_state.npy')
+        # Старый формат метаданных (конвертируется в DocumentMetaStore при первой загрузке)
         self.documents_meta_path = os.path.join(self.model_index_dir, 'documents_meta.json')
-        
+        # Хранилище для старых индексов без IDMap, где меткой служит позиция документа
+        self.legacy_meta_store_dir = os.path.join(self.model_index_dir, 'documents')
+
         self.index = None
-        self.documents_meta = []
-        
+        self.use_mmap = use_mmap
+        self._index_mmapped = False # Индекс отображен через mmap только для чтения
+        self.documents_meta = self.shared_meta_store # Хранилище, в котором ищутся метаданные хитов этого индекса
+        self._state = np.empty(0, dtype=STATE_DTYPE)
+        # Планы фильтрованного поиска по нормализованным фильтрам (см. _filter_plan) и кэш проверки
+        # совпадения меток индекса с хранилищем атрибутов: (состояние индекса, версия атрибутов, результат)
+        self._filter_plans: OrderedDict[tuple, list] = OrderedDict()
+        self._filter_plans_lock = threading.Lock()
+        self._alignment = None
+
         # Убедимся, что директория для индекса существует
         os.makedirs(self.model_index_dir, exist_ok=True)
 
         # Попытка загрузить существующий индекс и метаданные
-        if os.path.exists(self.faiss_index_path) and os.path.exists(self.documents_meta_path):
-            print(f"Обнаружены существующие файлы индекса и метаданных для '{self.model_name}'. Попытка загрузки...")
+        has_meta = os.path.exists(self.index_state_path) or os.path.exists(self.documents_meta_path)
+        if os.path.exists(self.faiss_index_path) and has_meta:
+            logger.info("Обнаружены существующие файлы индекса и метаданных для '%s'. Попытка загрузки...", self.model_name)
             try:
-                self.index = faiss.read_index(self.faiss_index_path)
-                with open(self.documents_meta_path, 'r', encoding='utf-8') as f:
-                    self.documents_meta = json.load(f)
-                print(f"Индекс FAISS и метаданные для '{self.model_name}' успешно загружены. Документов: {len(self.documents_meta)}")
+                self.index, self._index_mmapped = read_index(self.faiss_index_path, self.use_mmap)
+                apply_search_params(self.index, self.index_config)
+                if not self._is_id_mapped():
+                    self.documents_meta = DocumentMetaStore(self.legacy_meta_store_dir)
+                if os.path.exists(self.index_state_path):
+                    self._state = load_npy(self.index_state_path)
+                else:
+                    self._convert_json_meta()
+                if self.index.ntotal != len(self._state):
+                    raise ValueError(f"размер индекса ({self.index.ntotal}) не совпадает с количеством метаданных ({len(self._state)})")
+                logger.info("Индекс FAISS и метаданные для '%s' успешно загружены. Документов: %d", self.model_name, len(self._state))
             except Exception as e:
-                print(f"Ошибка при загрузке индекса/метаданных для '{self.model_name}': {e}. Будет создан новый индекс.")
+                logger.error("Ошибка при загрузке индекса/метаданных для '%s': %s. Будет создан новый индекс.", self.model_name, e)
                 self.index = None
-                self.documents_meta = []
+                self._index_mmapped = False
+                self.documents_meta = self.shared_meta_store
+                self._state = np.empty(0, dtype=STATE_DTYPE)
         else:
-            print(f"Существующие файлы индекса/метаданных для '{self.model_name}' не найдены. Будет создан новый индекс.")
+            logger.info("Существующие файлы индекса/метаданных для '%s' не найдены. Будет создан новый индекс.", self.model_name)
+
+    def _convert_json_meta(self):
+        """Конвертирует documents_meta.json старого формата в DocumentMetaStore и index_state.npy."""
+        hashes = convert_json_meta(self.documents_meta_path, self.documents_meta, positional=not self._is_id_mapped())
+        self._state = self._make_state(list(hashes.keys()), list(hashes.values()))
+        save_npy_atomic(self.index_state_path, self._state)
+
+    @staticmethod
+    def _make_state(labels, hashes) -> np.ndarray:
+        state = np.empty(len(labels), dtype=STATE_DTYPE)
+        state['label'] = labels
+        state['hash'] = hashes
+        return state[np.argsort(state['label'], kind='stable')]
+
+    @property
+    def document_count(self) -> int:
+        """Количество документов в индексе этой модели."""
+        return len(self._state)
+
+    def indexed_labels(self) -> np.ndarray:
+        """Отсортированный массив меток документов в индексе этой модели."""
+        return self._state['label']
 
     def add_documents_to_index(self, documents: list[dict]):
         """
-        Добавляет новые документы в индекс.
-        documents: список словарей, где каждый словарь {'id': int, 'text': str}
+        Добавляет новые документы в индекс (документы с уже существующим ID заменяются).
+        documents: список словарей товаров экспорта ('ID', 'desc', 'desc_short', 'name', ...)
         """
-        text_keys_priority = ['desc', 'desc_short', 'description', 'paragraph_text'] # Добавьте сюда возможные ключи в порядке приоритета
-        new_texts = []
-
-        for doc in documents:
-            found_text = False
-            for key in text_keys_priority:
-                if key in doc:
-                    new_texts.append(doc[key])
-                    found_text = True
-                    break
-            if not found_text:
-                print(f"Предупреждение: Документ ID {doc.get('id', 'N/A')} не содержит ни одного из ожидаемых текстовых ключей ({', '.join(text_keys_priority)}). Документ пропущен.")
-                # Можно также добавить пустую строку, если хотите, чтобы документ все равно был в индексе, но без текста:
-                # new_texts.append("") 
-        
-        if not new_texts:
-            print("Не удалось извлечь текст ни из одного документа. Индекс не будет построен.")
+        prepared = self.prepare_documents(documents)
+        if not prepared:
+            logger.warning("Не удалось извлечь текст ни из одного документа. Индекс не будет построен.")
             return
 
         if self.embedding_model.get_dimension() == 0:
-            print("Модель эмбеддингов не загружена, невозможно добавить документы.")
+            logger.error("Модель эмбеддингов не загружена, невозможно добавить документы.")
             return
 
-        print(f"Добавление {len(documents)} документов в индекс для модели '{self.model_name}'...")
-        new_texts = [doc['desc'] for doc in documents]
-        
+        logger.info("Добавление %d документов в индекс для модели '%s'...", len(prepared), self.model_name)
+
         try:
-            new_embeddings = self.embedding_model.encode(new_texts)
+            with metrics.timer('index_encode', model=self.model_name):
+                new_embeddings = self.indexing_model.encode([text for _, text, _, _ in prepared])
         except RuntimeError as e:
-            print(f"Ошибка при генерации эмбеддингов: {e}")
+            logger.error("Ошибка при генерации эмбеддингов: %s", e)
             return
 
         if not new_embeddings.size:
-            print("Не удалось сгенерировать эмбеддинги для новых документов.")
+            logger.error("Не удалось сгенерировать эмбеддинги для новых документов.")
             return
 
+        self.add_embeddings(prepared, new_embeddings)
+
+        logger.info("Документы добавлены. Общее количество документов в индексе: %d", self.document_count)
+        self.save_index_and_meta()
+
+    def sync_documents(self, documents: list[dict]) -> dict:
+        """
+        Идемпотентно синхронизирует индекс с новым экспортом каталога по ID товара.
+        Пересчитываются эмбеддинги только новых и измененных (по хэшу текста) товаров,
+        удаленные из экспорта товары удаляются из индекса. Стоимость пропорциональна размеру изменений.
+        :param documents: Полный список товаров нового экспорта.
+        :return: Статистика синхронизации ('added', 'updated', 'removed', 'unchanged').
+        """
+        desired: dict[int, tuple[str, int, dict]] = {}
+        for label, text, text_hash, record in self.prepare_documents(documents):
+            if label in desired:
+                logger.warning("ID %s встречается в экспорте несколько раз, используется последняя запись.", label)
+            desired[label] = (text, text_hash, record)
+
+        if self.index is not None and not self._is_id_mapped():
+            self._migrate_legacy_index(desired)
+
+        current = dict(zip(self._state['label'].tolist(), self._state['hash'].tolist()))
+        removed = [label for label in current if label not in desired]
+        changed = [label for label, (_, text_hash, _) in desired.items() if label in current and current[label] != text_hash]
+        added = [label for label in desired if label not in current]
+        stats = {'added': len(added), 'updated': len(changed), 'removed': len(removed),
+                 'unchanged': len(desired) - len(added) - len(changed)}
+
+        # Метаданные (название, описание) могут измениться без изменения текста эмбеддинга;
+        # неизменные записи хранилище пропускает по хэшу. Записи удаленных товаров хранилище
+        # не удаляет сразу: оно общее для всех моделей (см. KnowledgeBaseManager.prune_meta_store)
+        self.documents_meta.upsert({label: record for label, (_, _, record) in desired.items()})
+        self.attributes.upsert({label: record for label, (_, _, record) in desired.items()})
+
+        if not (removed or changed or added):
+            logger.info("Индекс для '%s' уже синхронизирован с экспортом (%d документов).", self.model_name, len(desired))
+            return stats
+
+        logger.info("Синхронизация индекса для '%s': добавлено %d, изменено %d, удалено %d.",
+                    self.model_name, len(added), len(changed), len(removed))
+        self._remove_labels(removed + changed)
+
+        to_embed = [(label, *desired[label]) for label in changed + added]
+        if to_embed:
+            if self.embedding_model.get_dimension() == 0:
+                raise RuntimeError("Модель эмбеддингов не загружена, невозможно синхронизировать документы.")
+            with metrics.timer('index_encode', model=self.model_name):
+                new_embeddings = self.indexing_model.encode([text for _, text, _, _ in to_embed])
+            self.add_embeddings(to_embed, new_embeddings)
+
+        self.save_index_and_meta()
+        return stats
+
+    def prepare_documents(self, documents: list[dict]) -> list[tuple[int, str, int, dict]]:
+        """Извлекает из документов экспорта четверки (метка FAISS, текст, хэш текста, запись метаданных)."""
+        next_label = int(self._state['label'].max()) + 1 if len(self._state) else 0
+        prepared = []
+        for doc in documents:
+            text = extract_text(doc)
+            if text is None:
+                logger.warning("Документ ID %s не содержит ни одного из ожидаемых текстовых ключей (%s). Документ пропущен.",
+                               doc.get('ID', doc.get('id', 'N/A')), ', '.join(TEXT_KEYS_PRIORITY))
+                continue
+            label = document_label(doc)
+            if label is None:
+                label = next_label
+                next_label += 1
+            prepared.append((label, text, content_hash(text), build_record(doc, label, text)))
+        return prepared
+
+    def _is_id_mapped(self) -> bool:
+        """True, если индекс хранит метки товаров (IndexIDMap2), а не позиции документов."""
+        return isinstance(self.index, faiss.IndexIDMap)
+
+    def _new_index(self, train_embeddings: np.ndarray) -> faiss.Index:
+        """Создает пустой индекс с метками товаров (IndexIDMap2 поверх индекса из index_factory)."""
+        dimension = self.embedding_model.get_dimension()
+        index = faiss.IndexIDMap2(build_index(dimension, self.index_config, train_embeddings))
+        logger.info("Новый индекс FAISS (%s) инициализирован для '%s' с размерностью %d.",
+                    self.index_config.get('type', 'flat'), self.model_name, dimension)
+        return index
+
+    def _ensure_writable_index(self):
+        """Индекс, отображенный через mmap, доступен только для чтения: перед изменением перечитываем его в память."""
+        if self._index_mmapped:
+            logger.info("Индекс '%s' открыт через mmap, перечитываем его в память для изменения...", self.model_name)
+            self.index, self._index_mmapped = read_index(self.faiss_index_path, use_mmap=False)
+            apply_search_params(self.index, self.index_config)
+
+    def add_embeddings(self, prepared: list[tuple[int, str, int, dict]], embeddings: np.ndarray, write_stores: bool = True):
+        """
+        Добавляет готовые эмбеддинги в индекс, состояние и хранилище, заменяя документы с теми же метками.
+        :param write_stores: False - записи хранилищ метаданных и атрибутов пишет вызывающий код (потоковая индексация
+                             копит их и записывает один раз на чекпоинт). Старый индекс без IDMap пишет их всегда.
+        """
+        self._ensure_writable_index()
         if self.index is None:
-            dimension = self.embedding_model.get_dimension()
-            self.index = faiss.IndexFlatIP(dimension)
-            print(f"Новый индекс FAISS инициализирован для '{self.model_name}' с размерностью {dimension}.")
-        
-        self.index.add(new_embeddings)
-        
-        start_id = len(self.documents_meta)
-        for i, doc in enumerate(documents):
-            if 'id' not in doc or doc['id'] is None:
-                doc['id'] = start_id + i 
-            self.documents_meta.append({'id': doc['id'], 'desc': doc['desc']})
-        
-        print(f"Документы добавлены. Общее количество документов в индексе: {len(self.documents_meta)}")
-        self._save_index_and_meta()
-
-    def _save_index_and_meta(self):
-        """Сохраняет FAISS индекс и метаданные документов на диск для текущей модели."""
+            self.index = self._new_index(embeddings)
+            self.documents_meta = self.shared_meta_store
+
+        labels = np.array([label for label, _, _, _ in prepared], dtype='int64')
+        if self._is_id_mapped():
+            self._remove_labels(labels[np.isin(labels, self._state['label'])].tolist())
+            self.index.add_with_ids(embeddings, labels)
+        else:
+            # Старый индекс без IDMap: метки - позиции, запись хранилища по-прежнему содержит ID товара
+            labels = np.arange(self.index.ntotal, self.index.ntotal + len(prepared), dtype='int64')
+            self.index.add(embeddings)
+
+        if write_stores or not self._is_id_mapped():
+            self.documents_meta.upsert({int(label): record for label, (_, _, _, record) in zip(labels, prepared)})
+        if write_stores and self._is_id_mapped():
+            self.attributes.upsert({int(label): record for label, (_, _, _, record) in zip(labels, prepared)})
+        metrics.inc('documents_indexed_total', len(prepared), model=self.model_name)
+        self._state = self._make_state(
+            np.concatenate([self._state['label'], labels]),
+            np.concatenate([self._state['hash'], np.array([text_hash for _, _, text_hash, _ in prepared], dtype='int64')])
+        )
+
+    def _remove_labels(self, labels: list[int]):
+        """
+        Удаляет документы с указанными метками из индекса и состояния (записи хранилища не трогаются).
+        HNSW не поддерживает удаление: индекс перестраивается из сохраненных векторов, что стоит O(размер каталога)
+        независимо от числа удаляемых документов. Поэтому sync_documents удаляет все измененные и удаленные
+        товары одним вызовом (одна перестройка на синхронизацию); для каталогов с частыми изменениями
+        выгоднее IVF-индексы, где удаление дешевое.
+        """
+        if not labels:
+            return
+        self._ensure_writable_index()
+        drop = np.isin(self._state['label'], np.array(labels, dtype='int64'))
+        try:
+            self.index.remove_ids(np.array(sorted(set(labels)), dtype='int64'))
+        except RuntimeError:
+            # Некоторые индексы (HNSW) не поддерживают удаление - перестраиваем из сохраненных векторов
+            kept = np.ascontiguousarray(self._state['label'][~drop])
+            logger.warning("Индекс '%s' не поддерживает удаление: перестройка из %d векторов ради удаления %d документов.",
+                           self.model_name, len(kept), int(drop.sum()))
+            vectors = self.index.reconstruct_batch(kept) if len(kept) else None
+            self.index = self._new_index(vectors)
+            if len(kept):
+                self.index.add_with_ids(vectors, kept)
+        self._state = self._state[~drop]
+
+    def _migrate_legacy_index(self, desired: dict[int, tuple[str, int, dict]]):
+        """
+        Переводит старый индекс (позиции без ID) в IndexIDMap2 с метками товаров и общим хранилищем.
+        Векторы документов с неизменным текстом переиспользуются без повторного кодирования.
+        """
+        logger.info("Перевод индекса '%s' на метки ID товаров...", self.model_name)
+        position_by_hash = dict(zip(self._state['hash'].tolist(), self._state['label'].tolist()))
+        reused = [(label, *value) for label, value in desired.items() if value[1] in position_by_hash]
+        vectors = None
+        if reused:
+            try:
+                vectors = self.index.reconstruct_batch(np.array([position_by_hash[h] for _, _, h, _ in reused], dtype='int64'))
+            except RuntimeError:
+                logger.warning("Индекс не поддерживает восстановление векторов, все документы будут закодированы заново.")
+
+        self.index = None
+        self._index_mmapped = False
+        self.documents_meta = self.shared_meta_store
+        self._state = np.empty(0, dtype=STATE_DTYPE)
+        if vectors is not None:
+            self.add_embeddings(reused, vectors)
+        logger.info("Переиспользовано %d векторов из старого индекса.", self.document_count)
+
+    def discard_legacy_index(self) -> bool:
+        """
+        Сбрасывает старый индекс без IDMap (метки - позиции документов) перед потоковой индексацией:
+        она кодирует весь экспорт заново и добавляет документы по ID товаров, поэтому смешивать их
+        со старыми позиционными векторами нельзя (каждый товар оказался бы в индексе дважды).
+        :return: True, если индекс был сброшен.
+        """
+        if self.index is None or self._is_id_mapped():
+            return False
+        logger.warning("Индекс '%s' в старом формате (без ID товаров) будет построен заново.", self.model_name)
+        self.index = None
+        self._index_mmapped = False
+        self.documents_meta = self.shared_meta_store
+        self._state = np.empty(0, dtype=STATE_DTYPE)
+        return True
+
+    def set_search_params(self, nprobe: int | None = None, ef_search: int | None = None):
+        """
+        Меняет параметры поиска во время работы (компромисс точность/латентность).
+        :param nprobe: Количество просматриваемых кластеров для IVF-индексов.
+        :param ef_search: Ширина поиска для HNSW-индексов.
+        """
+        if nprobe is not None:
+            self.index_config = dict(self.index_config, nprobe=nprobe)
+        if ef_search is not None:
+            self.index_config = dict(self.index_config, ef_search=ef_search)
         if self.index is not None:
-            faiss.write_index(self.index, self.faiss_index_path)
-            print(f"Индекс FAISS для '{self.model_name}' сохранен в '{self.faiss_index_path}'")
-        
-        with open(self.documents_meta_path, 'w', encoding='utf-8') as f:
-            json.dump(self.documents_meta, f, ensure_ascii=False, indent=4)
-        print(f"Метаданные документов для '{self.model_name}' сохранены в '{self.documents_meta_path}'")
+            apply_search_params(self.index, self.index_config)
+
+    def recall_report(self, document_texts: list[str], queries: list[str], top_k: int = 10,
+                      index_configs: dict[str, dict] | None = None) -> list[dict]:
+        """
+        Сравнивает recall@k и латентность заданных конфигураций индекса с точным поиском (Flat)
+        на эмбеддингах этой модели.
+        :param document_texts: Тексты документов для построения индексов.
+        :param queries: Тексты запросов.
+        :param top_k: Глубина поиска.
+        :param index_configs: Словарь {название: конфигурация}; по умолчанию - текущая конфигурация ретривера.
+        :return: Строки отчета (см. index_factory.compare_with_flat).
+        """
+        base_embeddings = self.indexing_model.encode(document_texts)
+        query_embeddings = self.embedding_model.encode(queries)
+        return compare_with_flat(base_embeddings, query_embeddings, index_configs or {'current': self.index_config}, top_k)
+
+    def save_index_and_meta(self):
+        """
+        Сохраняет FAISS индекс и состояние индекса (метки и хэши текстов) на диск для текущей модели.
+        Каждый файл сначала пишется во временный и затем атомарно заменяет старый (os.replace),
+        поэтому сбой во время записи не оставляет поврежденных файлов.
+        """
+        with metrics.timer('save', model=self.model_name):
+            if self.index is not None:
+                tmp_index_path = self.faiss_index_path + '.tmp'
+                faiss.write_index(self.index, tmp_index_path)
+                os.replace(tmp_index_path, self.faiss_index_path)
+                logger.info("Индекс FAISS для '%s' сохранен в '%s'", self.model_name, self.faiss_index_path)
+
+            # Записи метаданных уже сохранены в DocumentMetaStore при upsert; здесь - только состояние индекса модели
+            save_npy_atomic(self.index_state_path, self._state)
+        logger.info("Состояние индекса для '%s' сохранено в '%s'", self.model_name, self.index_state_path)
 
-    def retrieve(self, query_text: str, top_k: int = 3) -> list[dict]:
+    def retrieve(self, query_text: str, top_k: int = 3, filters: dict | None = None) -> list[dict]:
         """
         Выполняет поиск релевантных документов по запросу.
         :param query_text: Текст запроса пользователя (может быть на любом поддерживаемом языке).
         :param top_k: Количество наиболее релевантных документов для возврата.
+        :param filters: Фильтры по атрибутам, например {'price_max': 10000, 'type': 'simple'} (см. attributes.validate_filters).
         :return: Список словарей с найденными документами ('id', 'text', 'score').
         """
-        if self.index is None or not self.documents_meta or self.embedding_model.get_dimension() == 0:
-            print("Индекс не инициализирован, база знаний пуста или модель эмбеддингов не загружена. Невозможно выполнить поиск.")
+        logger.debug("Поиск релевантных документов для запроса: '%s' (Модель: %s)", query_text, self.model_name)
+
+        retrieved_documents = self.retrieve_batch([query_text], top_k, filters)[0]
+        # Строки по каждому хиту формируются только при включенном DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            for doc in retrieved_documents:
+                logger.debug("  - Найден документ (Score: %.4f): '%s...'", doc['score'], doc['text'][:100])
+
+        return retrieved_documents
+
+    def retrieve_batch(self, queries: list[str], top_k: int = 3, filters: dict | None = None) -> list[list[dict]]:
+        """
+        Пакетный поиск: все запросы кодируются одним вызовом encode и ищутся одним матричным index.search.
+        :param queries: Список текстов запросов.
+        :param top_k: Количество наиболее релевантных документов для каждого запроса.
+        :param filters: Фильтры по атрибутам, общие для всех запросов; применяются внутри поиска FAISS.
+        :return: Список результатов (по одному списку словарей 'id', 'text', 'score' на запрос, в порядке queries).
+        :raises ValueError: При некорректных фильтрах или фильтрах для старого индекса без меток товаров.
+        """
+        if not queries:
             return []
 
-        print(f"Поиск релевантных документов для запроса: '{query_text}' (Модель: {self.model_name})")
-        
+        found = self.search_labels(queries, top_k, filters)
+        if found is None:
+            return [[] for _ in queries]
+        D, I = found
+        with metrics.timer('metadata_lookup', model=self.model_name):
+            return [self._collect_results(D[row], I[row]) for row in range(len(queries))]
+
+    def search_labels(self, queries: list[str], top_k: int, filters: dict | None = None,
+                      allowed: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Векторный поиск без декодирования метаданных (для гибридного поиска, который объединяет результаты по меткам).
+        :param allowed: Уже вычисленный attributes.select(filters) (гибридный поиск отбирает метки один раз для всех источников).
+        :return: (оценки, метки FAISS) формы (len(queries), top_k), недостающие позиции - метка -1;
+                 None, если поиск невозможен (индекс пуст или модель не загружена).
+        :raises ValueError: При некорректных фильтрах или фильтрах для старого индекса без меток товаров.
+        """
+        if allowed is None:
+            with metrics.timer('filter', model=self.model_name):
+                allowed = self.attributes.select(filters)
+        if allowed is not None and self.index is not None and not self._is_id_mapped():
+            raise ValueError(f"Индекс '{self.model_name}' не хранит ID товаров: фильтрация недоступна до синхронизации с экспортом.")
+
+        if self.index is None or self.index.ntotal == 0 or self.embedding_model.get_dimension() == 0:
+            logger.warning("Индекс не инициализирован, база знаний пуста или модель эмбеддингов не загружена. Невозможно выполнить поиск.")
+            return None
+
+        metrics.inc('queries_total', len(queries), model=self.model_name)
         try:
-            query_embedding = self.embedding_model.encode([query_text])
+            with metrics.timer('encode', model=self.model_name):
+                query_embeddings = self.embedding_model.encode(list(queries))
         except RuntimeError as e:
-            print(f"Ошибка при генерации эмбеддинга для запроса: {e}")
-            return []
+            logger.error("Ошибка при генерации эмбеддингов для запросов: %s", e)
+            return None
 
-        if not query_embedding.size:
-             print("Не удалось сгенерировать эмбеддинг для запроса.")
-             return []
+        if not query_embeddings.size:
+            logger.error("Не удалось сгенерировать эмбеддинги для запросов.")
+            return None
 
-        D, I = self.index.search(query_embedding, top_k)
-        
-        retrieved_documents = []
-        for i, idx in enumerate(I[0]):
-            if idx != -1 and idx < len(self.documents_meta):
-                doc_score = D[0][i] 
-                doc_text = self.documents_meta[idx]['desc']
-                doc_id = self.documents_meta[idx]['id'] 
+        with metrics.timer('search', model=self.model_name):
+            if allowed is None:
+                return self.index.search(query_embeddings, top_k)
+            return self._search_filtered(query_embeddings, top_k, filters_key(filters), allowed)
 
+    def _aligned_with_attributes(self, state: np.ndarray) -> bool:
+        """
+        Совпадают ли метки индекса с метками хранилища атрибутов (обычное состояние после синхронизации всех моделей).
+        Проверка стоит O(размер каталога) и повторяется только после изменения индекса или атрибутов.
+        """
+        version = self.attributes.version
+        cached = self._alignment
+        if cached is not None and cached[0] is state and cached[1] == version:
+            return cached[2]
+        attribute_labels = self.attributes.labels()
+        aligned = len(attribute_labels) == len(state) and np.array_equal(attribute_labels, np.sort(state['label']))
+        self._alignment = (state, version, aligned)
+        return aligned
+
+    def _filter_plan(self, key: tuple, allowed: np.ndarray) -> list:
+        """
+        План фильтрованного поиска: [отбор атрибутов, состояние индекса, метки для поиска, селектор FAISS или None].
+        Кэшируется по нормализованным фильтрам, пока не изменились отбор (атрибуты) или индекс. Если метки индекса
+        совпадают с хранилищем атрибутов, отбор используется как есть, иначе пересекается с метками индекса.
+        """
+        state = self._state
+        with self._filter_plans_lock:
+            plan = self._filter_plans.get(key)
+            if plan is not None and plan[0] is allowed and plan[1] is state:
+                self._filter_plans.move_to_end(key)
+                return plan
+        labels = allowed if self._aligned_with_attributes(state) else np.intersect1d(allowed, state['label'], assume_unique=True)
+        plan = [allowed, state, labels, None]
+        with self._filter_plans_lock:
+            self._filter_plans[key] = plan
+            while len(self._filter_plans) > FILTER_CACHE_SIZE:
+                self._filter_plans.popitem(last=False)
+        return plan
+
+    def _search_filtered(self, query_embeddings: np.ndarray, top_k: int, key: tuple,
+                         allowed: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Поиск только среди документов с разрешенными метками.
+        Небольшое подмножество сравнивается с запросами напрямую, остальные - через селектор FAISS;
+        если приближенный поиск вернул меньше min(top_k, подходящих документов) результатов,
+        строка повторяется полным просмотром IVF или точным поиском по подмножеству (HNSW).
+        Метки и селектор для повторяющихся фильтров берутся из кэша (_filter_plan), поэтому стоимость
+        пропорциональна числу подходящих документов, а не размеру каталога.
+        """
+        plan = self._filter_plan(key, allowed)
+        allowed = plan[2]
+        if len(allowed) == len(self._state):
+            return self.index.search(query_embeddings, top_k)
+        if not len(allowed):
+            return (np.full((len(query_embeddings), top_k), -np.inf, dtype='float32'),
+                    np.full((len(query_embeddings), top_k), -1, dtype='int64'))
+
+        if len(allowed) <= FILTER_EXACT_MAX_CANDIDATES:
+            try:
+                return exact_search_labels(self.index, query_embeddings, top_k, allowed)
+            except RuntimeError:
+                pass # Индекс не восстанавливает векторы (IVF без direct map) - ищем с селектором
+
+        if plan[3] is None:
+            plan[3] = label_selector(self.index, allowed)
+        selector = plan[3]
+        D, I = search_with_labels(self.index, query_embeddings, top_k, allowed, self.index_config, selector=selector)
+        short = (I != -1).sum(axis=1) < min(top_k, len(allowed))
+        if short.any():
+            logger.debug("Фильтрованный поиск '%s' вернул неполный результат для %d запросов, повтор с полным просмотром.",
+                         self.model_name, int(short.sum()))
+            if faiss.try_extract_index_ivf(self.index) is not None:
+                D[short], I[short] = search_with_labels(self.index, query_embeddings[short], top_k, allowed,
+                                                        self.index_config, exhaustive=True, selector=selector)
+            else:
+                D[short], I[short] = exact_search_labels(self.index, query_embeddings[short], top_k, allowed)
+        return D, I
+
+    def _collect_results(self, scores: np.ndarray, labels: np.ndarray) -> list[dict]:
+        """Превращает одну строку результатов index.search в список документов (декодируются только хиты)."""
+        valid = labels != -1
+        retrieved_documents = []
+        for doc_score, meta in zip(scores[valid], self.documents_meta.get_many(labels[valid])):
+            if meta is not None:
                 retrieved_documents.append({
-                    'id': doc_id,
-                    'text': doc_text,
+                    'id': meta['id'],
+                    'text': meta['desc'],
                     'score': float(doc_score)
                 })
-                print(f"  - Найден документ (Score: {doc_score:.4f}): '{doc_text[:100]}...'") 
-
-        return retrieved_documents
\ No newline at end of file
+        return retrieved_documents
@@ -0,0 +1,246 @@
+# core/router.py
+#
+# Маршрутизация запроса к одной модели ретривера вместо кодирования каждой моделью:
+#  1. письменность запроса (кириллица/латиница) отсекает модели, которые ее не понимают
+#     (англоязычная paraphrase-MiniLM-L6-v2 не подходит для кириллицы);
+#  2. среди оставшихся моделей выбирает наивный байесовский классификатор по символьным n-граммам,
+#     обученный на журнале запросов (JSONL: {"query": "...", "model": "..."});
+#  3. при низкой уверенности классификатора запрос (опционально) отправляется в несколько моделей,
+#     а результаты объединяются через reciprocal-rank fusion.
+#
+# Обучение: python -m rag_system.core.router --log query_log.jsonl
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable
+
+from rag_system.config import (
+    ROUTER_DEFAULT_MODEL,
+    ROUTER_MODEL_SCRIPTS,
+    ROUTER_SCRIPT_DEFAULTS,
+    ROUTER_MODEL_PATH,
+    ROUTER_CONFIDENCE_THRESHOLD,
+    ROUTER_FANOUT,
+    ROUTER_NGRAM_RANGE,
+    RRF_K
+)
+from rag_system.core.metrics import metrics, configure_logging
+
+logger = logging.getLogger(__name__)
+
+_CYRILLIC_RE = re.compile(r'[Ѐ-ӿ]')
+_LATIN_RE = re.compile(r'[A-Za-zÀ-ɏ]')
+
+def detect_scripts(text: str) -> dict[str, int]:
+    """Количество букв каждой письменности в тексте ({'cyrillic': n, 'latin': m}, нулевые не включаются)."""
+    counts = {'cyrillic': len(_CYRILLIC_RE.findall(text)), 'latin': len(_LATIN_RE.findall(text))}
+    return {script: count for script, count in counts.items() if count}
+
+def char_ngrams(text: str, ngram_range: tuple[int, int] = ROUTER_NGRAM_RANGE) -> list[str]:
+    """Символьные n-граммы нормализованного текста (с пробелами на границах слов)."""
+    normalized = f" {' '.join(text.casefold().split())} "
+    low, high = ngram_range
+    return [normalized[i:i + n] for n in range(low, high + 1) for i in range(len(normalized) - n + 1)]
+
+class NgramNaiveBayes:
+    """Мультиномиальный наивный Байес по символьным n-граммам со сглаживанием Лапласа."""
+    def __init__(self, ngram_range: tuple[int, int] = ROUTER_NGRAM_RANGE, alpha: float = 1.0):
+        self.ngram_range = tuple(ngram_range)
+        self.alpha = alpha
+        self.class_counts: dict[str, int] = {}             # метка -> количество примеров
+        self.feature_counts: dict[str, dict[str, int]] = {} # метка -> n-грамма -> количество
+        self.feature_totals: dict[str, int] = {}            # метка -> сумма количеств n-грамм
+        self.vocabulary_size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return bool(self.class_counts)
+
+    def fit(self, texts: Iterable[str], labels: Iterable[str]) -> 'NgramNaiveBayes':
+        vocabulary = set()
+        for text, label in zip(texts, labels):
+            self.class_counts[label] = self.class_counts.get(label, 0) + 1
+            counts = self.feature_counts.setdefault(label, {})
+            for ngram in char_ngrams(text, self.ngram_range):
+                counts[ngram] = counts.get(ngram, 0) + 1
+                vocabulary.add(ngram)
+        self.feature_totals = {label: sum(counts.values()) for label, counts in self.feature_counts.items()}
+        self.vocabulary_size = len(vocabulary)
+        return self
+
+    def predict_proba(self, text: str, labels: Iterable[str] | None = None) -> dict[str, float]:
+        """
+        Апостериорные вероятности меток для текста.
+        :param labels: Ограничить выбор этими метками (вероятности нормируются среди них); неизвестные метки пропускаются.
+        """
+        candidates = [label for label in (labels if labels is not None else self.class_counts) if label in self.class_counts]
+        if not candidates:
+            return {}
+        ngrams = char_ngrams(text, self.ngram_range)
+        total_examples = sum(self.class_counts.values())
+        log_scores = {}
+        for label in candidates:
+            counts = self.feature_counts[label]
+            denominator = math.log(self.feature_totals[label] + self.alpha * (self.vocabulary_size + 1))
+            score = math.log(self.class_counts[label] / total_examples)
+            for ngram in ngrams:
+                score += math.log(counts.get(ngram, 0) + self.alpha) - denominator
+            log_scores[label] = score
+        best = max(log_scores.values())
+        exp_scores = {label: math.exp(score - best) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+    def to_dict(self) -> dict:
+        return {'ngram_range': list(self.ngram_range), 'alpha': self.alpha, 'class_counts': self.class_counts,
+                'feature_counts': self.feature_counts, 'vocabulary_size': self.vocabulary_size}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'NgramNaiveBayes':
+        classifier = cls(tuple(data['ngram_range']), data['alpha'])
+        classifier.class_counts = data['class_counts']
+        classifier.feature_counts = data['feature_counts']
+        classifier.feature_totals = {label: sum(counts.values()) for label, counts in classifier.feature_counts.items()}
+        classifier.vocabulary_size = data['vocabulary_size']
+        return classifier
+
+@dataclass
+class RouteDecision:
+    """Решение маршрутизатора: модели в порядке предпочтения (больше одной - fan-out), уверенность и причина."""
+    model_names: list[str]
+    confidence: float
+    reason: str # 'script', 'classifier', 'fanout', 'default' или 'explicit' (модель указана вызывающим)
+
+    @property
+    def model_name(self) -> str:
+        return self.model_names[0]
+
+class QueryRouter:
+    """Выбирает модель ретривера для запроса по письменности и классификатору, обученному на журнале запросов."""
+    def __init__(self, model_scripts: dict[str, tuple[str, ...]] = ROUTER_MODEL_SCRIPTS,
+                 script_defaults: dict[str, str] = ROUTER_SCRIPT_DEFAULTS, default_model: str = ROUTER_DEFAULT_MODEL,
+                 classifier_path: str | None = ROUTER_MODEL_PATH,
+                 confidence_threshold: float = ROUTER_CONFIDENCE_THRESHOLD, fanout: bool = ROUTER_FANOUT):
+        """
+        :param model_scripts: Письменности, которые понимает каждая модель.
+        :param script_defaults: Модель по умолчанию для преобладающей письменности (пока классификатор не обучен).
+        :param default_model: Модель для запросов без букв (артикулы, числа) и без подходящих моделей.
+        :param classifier_path: JSON-файл обученного классификатора (загружается, если существует).
+        :param confidence_threshold: Порог уверенности классификатора, ниже которого возможен fan-out.
+        :param fanout: Отправлять неуверенно классифицированные запросы во все подходящие модели.
+        """
+        self.model_scripts = model_scripts
+        self.script_defaults = script_defaults
+        self.default_model = default_model
+        self.classifier_path = classifier_path
+        self.confidence_threshold = confidence_threshold
+        self.fanout = fanout
+        self.classifier = NgramNaiveBayes()
+        if classifier_path and os.path.exists(classifier_path):
+            with open(classifier_path, 'r', encoding='utf-8') as f:
+                self.classifier = NgramNaiveBayes.from_dict(json.load(f))
+            logger.info("Классификатор маршрутизатора загружен из '%s' (%d примеров).",
+                        classifier_path, sum(self.classifier.class_counts.values()))
+
+    def route(self, query_text: str) -> RouteDecision:
+        """Выбирает модель (или модели при fan-out) для запроса. Стоимость - подсчет символов и n-грамм, без модели эмбеддингов."""
+        decision = self._decide(query_text)
+        for model_name in decision.model_names:
+            metrics.inc('router_decisions_total', model=model_name, reason=decision.reason)
+        return decision
+
+    def _decide(self, query_text: str) -> RouteDecision:
+        scripts = detect_scripts(query_text)
+        if not scripts:
+            return RouteDecision([self.default_model], 1.0, 'default')
+
+        candidates = [model for model, supported in self.model_scripts.items() if set(scripts) <= set(supported)]
+        if not candidates:
+            return RouteDecision([self.default_model], 1.0, 'default')
+        if len(candidates) == 1:
+            return RouteDecision(candidates, 1.0, 'script')
+
+        probabilities = self.classifier.predict_proba(query_text, candidates) if self.classifier.is_trained else {}
+        if not probabilities:
+            dominant = max(scripts, key=scripts.get)
+            model = self.script_defaults.get(dominant, self.default_model)
+            model = model if model in candidates else candidates[0]
+            return RouteDecision([model], scripts[dominant] / sum(scripts.values()), 'script')
+
+        ranked = sorted(probabilities, key=probabilities.get, reverse=True)
+        confidence = probabilities[ranked[0]]
+        if self.fanout and confidence < self.confidence_threshold:
+            return RouteDecision(ranked, confidence, 'fanout')
+        return RouteDecision([ranked[0]], confidence, 'classifier')
+
+    def train(self, queries: list[str], model_names: list[str], save: bool = True):
+        """
+        Обучает классификатор на журнале запросов.
+        :param queries: Тексты запросов.
+        :param model_names: Модель, давшая лучший (принятый пользователем) результат для каждого запроса.
+        :param save: Сохранить классификатор в classifier_path.
+        """
+        self.classifier = NgramNaiveBayes(self.classifier.ngram_range, self.classifier.alpha).fit(queries, model_names)
+        if save and self.classifier_path:
+            os.makedirs(os.path.dirname(self.classifier_path) or '.', exist_ok=True)
+            tmp_path = self.classifier_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.classifier.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.classifier_path)
+            logger.info("Классификатор маршрутизатора сохранен в '%s'.", self.classifier_path)
+
+def load_query_log(path: str) -> tuple[list[str], list[str]]:
+    """Читает журнал запросов JSONL ({"query": ..., "model": ...} на строку); строки без обоих полей пропускаются."""
+    queries, model_names = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('query') and record.get('model'):
+                queries.append(record['query'])
+                model_names.append(record['model'])
+    return queries, model_names
+
+def merge_results(result_lists: list[list[dict]], top_k: int, rrf_k: int = RRF_K) -> list[dict]:
+    """
+    Объединяет результаты разных моделей через reciprocal-rank fusion
+    (оценки разных моделей несопоставимы, поэтому учитываются только ранги).
+    """
+    fused: dict = {}
+    texts: dict = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            fused[doc['id']] = fused.get(doc['id'], 0.0) + 1.0 / (rrf_k + rank + 1)
+            texts.setdefault(doc['id'], doc['text'])
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [{'id': doc_id, 'text': texts[doc_id], 'score': score} for doc_id, score in ranked]
+
+def main():
+    parser = argparse.ArgumentParser(description="Обучение классификатора маршрутизатора запросов на журнале запросов.")
+    parser.add_argument('--log', required=True, help="JSONL-журнал запросов: {\"query\": ..., \"model\": ...}")
+    parser.add_argument('--output', default=ROUTER_MODEL_PATH, help="Путь для сохранения классификатора")
+    parser.add_argument('--holdout', type=float, default=0.2, help="Доля журнала для оценки точности")
+    args = parser.parse_args()
+    configure_logging()
+
+    queries, model_names = load_query_log(args.log)
+    if not queries:
+        logger.error("В журнале '%s' нет размеченных запросов.", args.log)
+        return
+    split = int(len(queries) * (1 - args.holdout))
+    if 0 < split < len(queries):
+        classifier = NgramNaiveBayes().fit(queries[:split], model_names[:split])
+        predictions = [max(p, key=p.get) for p in map(classifier.predict_proba, queries[split:])]
+        accuracy = sum(p == m for p, m in zip(predictions, model_names[split:])) / len(predictions)
+        logger.info("Точность на отложенной выборке (%d запросов): %.3f", len(predictions), accuracy)
+
+    QueryRouter(classifier_path=args.output).train(queries, model_names)
+
+if __name__ == '__main__':
+    main()
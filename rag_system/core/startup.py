@@ -0,0 +1,51 @@
+# core/startup.py
+
+import time
+from contextlib import contextmanager
+
+from rag_system.core.metrics import metrics
+
+class StartupProfiler:
+    """
+    Разбивка времени запуска по этапам (импорты, загрузка экспорта, открытие индексов, синхронизация, прогрев).
+    Каждый этап также записывается в гистограмму startup_seconds реестра метрик.
+    """
+    def __init__(self, started_at: float | None = None):
+        """
+        :param started_at: Момент начала запуска по time.perf_counter() (по умолчанию - создание профайлера).
+                           Позволяет учесть время импортов, выполненных до создания профайлера.
+        """
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замеряет этап запуска: with profiler.phase('sync'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        """Добавляет уже измеренный этап."""
+        self.phases.append((name, seconds))
+        metrics.observe('startup_seconds', seconds, phase=name)
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def as_dict(self) -> dict:
+        return {'total_seconds': self.total_seconds, 'phases': [{'phase': name, 'seconds': seconds} for name, seconds in self.phases]}
+
+    def report(self) -> str:
+        """Текстовая таблица этапов с долей от общего времени запуска."""
+        total = self.total_seconds
+        width = max([len(name) for name, _ in self.phases] + [len('итого')])
+        lines = [f"{'этап':<{width}}  {'секунды':>8}  {'доля':>6}"]
+        for name, seconds in self.phases:
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f"{name:<{width}}  {seconds:>8.3f}  {share:>5.1f}%")
+        lines.append(f"{'итого':<{width}}  {total:>8.3f}  {100.0:>5.1f}%")
+        return '\n'.join(lines)
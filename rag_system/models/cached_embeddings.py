@@ -0,0 +1,176 @@
+# rag_system/models/cached_embeddings.py
+
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from rag_system.models.embeddings import IEmbeddingModel
+from rag_system.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def normalize_query_text(text: str) -> str:
+    """
+    Нормализует текст запроса для ключа кэша: Unicode NFC, обрезка и схлопывание пробелов.
+    Регистр не меняется, так как часть моделей (например, multilingual MiniLM) чувствительна к регистру.
+    """
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+class CachedEmbeddingModel(IEmbeddingModel):
+    """
+    Декоратор над любой IEmbeddingModel, кэширующий эмбеддинги запросов.
+    Ключ кэша - (имя модели, нормализованный текст). Вытеснение - LRU по max_entries
+    и (опционально) TTL в секундах. Кэш может сохраняться на диск и загружаться при старте.
+    """
+    def __init__(self, model: IEmbeddingModel, max_entries: int = 10000, ttl_seconds: float | None = None,
+                 persist_path: str | None = None, max_batch_size: int = 64):
+        """
+        :param model: Оборачиваемая модель эмбеддингов.
+        :param max_entries: Максимальное количество эмбеддингов в кэше.
+        :param ttl_seconds: Время жизни записи в секундах (None - без ограничения).
+        :param persist_path: Путь к .npz файлу для сохранения кэша между перезапусками (None - только в памяти).
+        :param max_batch_size: Батчи больше этого размера (индексация документов) идут мимо кэша,
+                               чтобы не вытеснять из него горячие запросы.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries должен быть не меньше 1.")
+        self._model = model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.max_batch_size = max_batch_size
+        # (model_name, text) -> (embedding, время добавления)
+        self._entries: OrderedDict[tuple[str, str], tuple[np.ndarray, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.persist_path and os.path.exists(self.persist_path):
+            self.load()
+
+    @property
+    def wrapped_model(self) -> IEmbeddingModel:
+        return self._model
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if len(texts) > self.max_batch_size:
+            return self._model.encode(texts)
+
+        model_name = self._model.get_name()
+        keys = [(model_name, normalize_query_text(text)) for text in texts]
+        now = time.time()
+        found: dict[tuple[str, str], np.ndarray] = {}
+        missing: dict[tuple[str, str], None] = {} # упорядоченное множество промахов
+
+        with self._lock:
+            for key in keys:
+                if key in found or key in missing:
+                    continue
+                entry = self._entries.get(key)
+                if entry is not None and self._is_expired(entry[1], now):
+                    del self._entries[key]
+                    self.evictions += 1
+                    entry = None
+                if entry is None:
+                    missing[key] = None
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+            # Повторы одного текста в батче кодируются один раз, поэтому промахом считается только первое вхождение
+            missing_count = len(missing)
+            self.hits += len(keys) - missing_count
+            self.misses += missing_count
+        metrics.inc('embedding_cache_hits_total', len(keys) - missing_count, model=model_name)
+        metrics.inc('embedding_cache_misses_total', missing_count, model=model_name)
+
+        if missing:
+            # Кодируем уже нормализованный текст, чтобы результат не зависел от того, какой вариант запроса пришел первым
+            new_embeddings = self._model.encode([text for _, text in missing])
+            with self._lock:
+                for key, embedding in zip(missing, new_embeddings):
+                    # Копия строки: представление держало бы в памяти весь массив батча
+                    embedding = embedding.copy()
+                    found[key] = embedding
+                    self._entries[key] = (embedding, now)
+                    self._entries.move_to_end(key)
+                self._evict_overflow()
+
+        if not keys:
+            return np.empty((0, self.get_dimension()), dtype='float32')
+        return np.stack([found[key] for key in keys]).astype('float32', copy=False)
+
+    def get_dimension(self) -> int:
+        return self._model.get_dimension()
+
+    def get_name(self) -> str:
+        return self._model.get_name()
+
+    def get_stats(self) -> dict:
+        """Возвращает счетчики кэша: попадания, промахи, вытеснения и текущий размер."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self):
+        """Сохраняет непросроченные записи кэша в persist_path (атомарно, через временный файл)."""
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            items = [(key, entry) for key, entry in self._entries.items() if not self._is_expired(entry[1], now)]
+        os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+        tmp_path = self.persist_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                texts=np.array([key[1] for key, _ in items], dtype=str),
+                model_names=np.array([key[0] for key, _ in items], dtype=str),
+                embeddings=np.stack([entry[0] for _, entry in items]) if items else np.empty((0, self.get_dimension()), dtype='float32'),
+                created_at=np.array([entry[1] for _, entry in items], dtype='float64')
+            )
+        os.replace(tmp_path, self.persist_path)
+        logger.info("Кэш эмбеддингов для '%s' сохранен в '%s' (%d записей).", self.get_name(), self.persist_path, len(items))
+
+    def load(self):
+        """Загружает кэш из persist_path, пропуская просроченные записи и записи другой модели."""
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                texts, model_names = data['texts'], data['model_names']
+                embeddings, created_at = data['embeddings'], data['created_at']
+        except Exception as e:
+            logger.error("Ошибка при загрузке кэша эмбеддингов из '%s': %s. Кэш будет пустым.", self.persist_path, e)
+            return
+
+        model_name = self._model.get_name()
+        now = time.time()
+        with self._lock:
+            for text, name, embedding, created in zip(texts, model_names, embeddings, created_at):
+                if str(name) != model_name or self._is_expired(float(created), now):
+                    continue
+                self._entries[(model_name, str(text))] = (embedding.astype('float32'), float(created))
+            self._evict_overflow()
+        logger.info("Кэш эмбеддингов для '%s' загружен из '%s' (%d записей).", model_name, self.persist_path, len(self._entries))
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
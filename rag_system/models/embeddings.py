@@ -1,8 +1,10 @@
 # rag_system/models/embeddings.py
 
+import logging
 from abc import ABC, abstractmethod
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
 
 class IEmbeddingModel(ABC):
     """
@@ -37,14 +39,16 @@ class IEmbeddingModel(ABC):
 class SentenceTransformerEmbeddingModel(IEmbeddingModel):
     def __init__(self, model_name: str):
         self._model_name = model_name
-        print(f"Загрузка SentenceTransformer модели: {self._model_name}...")
+        logger.info("Загрузка SentenceTransformer модели: %s...", self._model_name)
         try:
+            # Импорт sentence_transformers (и torch) - только при создании модели, а не при импорте модуля
+            from sentence_transformers import SentenceTransformer
             self._model = SentenceTransformer(self._model_name)
             self._dimension = self._model.get_sentence_embedding_dimension()
-            print(f"Модель '{self._model_name}' успешно загружена. Размерность: {self._dimension}.")
+            logger.info("Модель '%s' успешно загружена. Размерность: %d.", self._model_name, self._dimension)
         except Exception as e:
-            print(f"Ошибка при загрузке SentenceTransformer модели '{self._model_name}': {e}")
-            print("Пожалуйста, убедитесь, что у вас есть подключение к интернету для первой загрузки.")
+            logger.error("Ошибка при загрузке SentenceTransformer модели '%s': %s", self._model_name, e)
+            logger.error("Пожалуйста, убедитесь, что у вас есть подключение к интернету для первой загрузки.")
             self._model = None
             self._dimension = 0
 
@@ -0,0 +1,61 @@
+# rag_system/models/lazy_embeddings.py
+
+import logging
+import threading
+import time
+from typing import Callable
+
+import numpy as np
+
+from rag_system.models.embeddings import IEmbeddingModel
+from rag_system.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class LazyEmbeddingModel(IEmbeddingModel):
+    """
+    Отложенная загрузка модели эмбеддингов: тяжелые импорты (torch, transformers, onnxruntime)
+    и загрузка весов выполняются при первом вызове encode/get_dimension, а не при создании.
+    get_name не загружает модель, поэтому ретривер может открыть индекс и синхронизировать
+    неизменный экспорт, вообще не загружая модель.
+    """
+    def __init__(self, model_name: str, factory: Callable[[], IEmbeddingModel]):
+        """
+        :param model_name: Имя модели (должно совпадать с get_name() создаваемой модели).
+        :param factory: Функция, создающая и загружающая модель.
+        """
+        self._model_name = model_name
+        self._factory = factory
+        self._model: IEmbeddingModel | None = None
+        self._lock = threading.Lock()
+        self.load_seconds: float | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def wrapped_model(self) -> IEmbeddingModel:
+        return self.load()
+
+    def load(self) -> IEmbeddingModel:
+        """Загружает модель (один раз, потокобезопасно) и возвращает ее."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    with metrics.timer('model_load', model=self._model_name):
+                        model = self._factory()
+                    self.load_seconds = time.perf_counter() - start
+                    logger.info("Модель '%s' загружена по требованию за %.2f с.", self._model_name, self.load_seconds)
+                    self._model = model
+        return self._model
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        return self.load().encode(texts)
+
+    def get_dimension(self) -> int:
+        return self.load().get_dimension()
+
+    def get_name(self) -> str:
+        return self._model_name
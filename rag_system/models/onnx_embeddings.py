@@ -0,0 +1,147 @@
+# rag_system/models/onnx_embeddings.py
+
+import inspect
+import json
+import logging
+import os
+
+import numpy as np
+
+from rag_system.models.embeddings import IEmbeddingModel
+from rag_system.config import ONNX_MODELS_DIR, ONNX_QUANTIZE, ONNX_INTRA_OP_THREADS, ONNX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_FP32_FILE = 'model.onnx'
+_INT8_FILE = 'model.int8.onnx'
+_CONFIG_FILE = 'onnx_config.json'
+
+def get_onnx_model_dir(model_name: str, onnx_dir: str = ONNX_MODELS_DIR) -> str:
+    safe_model_name = model_name.replace('/', '_').replace('-', '_')
+    return os.path.join(onnx_dir, safe_model_name)
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = ONNX_QUANTIZE) -> str:
+    """
+    Экспортирует трансформер SentenceTransformer-модели в ONNX (и, при quantize, в int8 с динамической квантизацией).
+    Пулинг (среднее по токенам) и нормализация выполняются в OnnxEmbeddingModel.encode.
+    :return: Путь к файлу модели, который следует загружать.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    logger.info("Экспорт модели '%s' в ONNX (%s)...", model_name, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["пример запроса", "example query"], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+    class _TransformerOutput(torch.nn.Module):
+        # Передает входы по именам (порядок позиционных аргументов forward отличается между версиями transformers)
+        def __init__(self):
+            super().__init__()
+            self.model = auto_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    fp32_path = os.path.join(output_dir, _FP32_FILE)
+    # Новые версии torch по умолчанию используют dynamo-экспортер (требует onnxscript); используем классический
+    export_kwargs = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            _TransformerOutput(),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs
+        )
+
+    with open(os.path.join(output_dir, _CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'dimension': st_model.get_sentence_embedding_dimension(),
+            'max_seq_length': st_model.max_seq_length,
+            'input_names': input_names
+        }, f)
+
+    if not quantize:
+        return fp32_path
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8_path = os.path.join(output_dir, _INT8_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    logger.info("Модель квантизована в int8: '%s'", int8_path)
+    return int8_path
+
+class OnnxEmbeddingModel(IEmbeddingModel):
+    """
+    Модель эмбеддингов на onnxruntime (CPU) с опциональной int8 динамической квантизацией.
+    Модель экспортируется из SentenceTransformer при первой загрузке и далее берется из ONNX_MODELS_DIR.
+    """
+    def __init__(self, model_name: str, onnx_dir: str = ONNX_MODELS_DIR, quantize: bool = ONNX_QUANTIZE,
+                 intra_op_threads: int = ONNX_INTRA_OP_THREADS, batch_size: int = ONNX_BATCH_SIZE):
+        self._model_name = model_name
+        self._batch_size = batch_size
+        model_dir = get_onnx_model_dir(model_name, onnx_dir)
+        model_path = os.path.join(model_dir, _INT8_FILE if quantize else _FP32_FILE)
+        logger.info("Загрузка ONNX модели: %s (%s)...", self._model_name, 'int8' if quantize else 'fp32')
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+
+            if not os.path.exists(model_path) or not os.path.exists(os.path.join(model_dir, _CONFIG_FILE)):
+                model_path = export_onnx_model(model_name, model_dir, quantize)
+            with open(os.path.join(model_dir, _CONFIG_FILE), 'r', encoding='utf-8') as f:
+                config = json.load(f)
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self._session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+            self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+            self._input_names = config['input_names']
+            self._max_seq_length = config['max_seq_length']
+            self._dimension = config['dimension']
+            logger.info("ONNX модель '%s' успешно загружена. Размерность: %d.", self._model_name, self._dimension)
+        except Exception as e:
+            logger.error("Ошибка при загрузке ONNX модели '%s': %s", self._model_name, e)
+            self._session = None
+            self._dimension = 0
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if self._session is None:
+            raise RuntimeError("ONNX модель не загружена. Невозможно сгенерировать эмбеддинги.")
+        if not texts:
+            return np.empty((0, self._dimension), dtype='float32')
+
+        # Сортируем по длине, чтобы батчи паддились до близкой длины, затем восстанавливаем порядок
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), self._dimension), dtype='float32')
+        for start in range(0, len(texts), self._batch_size):
+            rows = order[start:start + self._batch_size]
+            encoded = self._tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                      max_length=self._max_seq_length, return_tensors='np')
+            inputs = {name: encoded[name].astype('int64') for name in self._input_names}
+            token_embeddings = self._session.run(None, inputs)[0]
+            # Mean pooling по реальным (не паддинговым) токенам и L2-нормализация, как в SentenceTransformer
+            mask = encoded['attention_mask'][..., None].astype('float32')
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings[rows] = pooled
+        return embeddings
+
+    def get_dimension(self) -> int:
+        return self._dimension
+
+    def get_name(self) -> str:
+        return self._model_name
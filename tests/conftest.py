@@ -0,0 +1,61 @@
+# tests/conftest.py
+#
+# Общие фикстуры: детерминированная модель эмбеддингов без весов и ретривер во временном каталоге.
+
+import zlib
+
+import numpy as np
+import pytest
+
+from rag_system.core.attributes import AttributeStore
+from rag_system.core.meta_store import DocumentMetaStore
+from rag_system.core.retriever import LocalKnowledgeBaseRetriever
+from rag_system.models.embeddings import IEmbeddingModel
+
+class FakeEmbeddingModel(IEmbeddingModel):
+    """
+    Модель эмбеддингов для тестов: сумма случайных векторов слов (зерно - crc32 слова), нормированная к 1.
+    Тексты с общими словами близки, одинаковые тексты дают одинаковые векторы; вызовы encode записываются.
+    """
+    def __init__(self, name: str = 'fake-model', dimension: int = 32):
+        self.name = name
+        self.dimension = dimension
+        self.calls: list[list[str]] = []
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        self.calls.append(list(texts))
+        embeddings = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in text.lower().split() or ['']:
+                embeddings[row] += np.random.default_rng(zlib.crc32(word.encode('utf-8'))).standard_normal(self.dimension)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def get_dimension(self) -> int:
+        return self.dimension
+
+    def get_name(self) -> str:
+        return self.name
+
+    @property
+    def encoded_texts(self) -> list[str]:
+        return [text for call in self.calls for text in call]
+
+def make_documents(count: int) -> list[dict]:
+    """Товары экспорта с разными текстами, ценами и типами."""
+    types = ['simple', 'variable', 'variation']
+    return [{'ID': i + 1, 'name': f'товар {i}', 'desc': f'описание товара номер {i} категория {i % 5}',
+             'price': str(100 * (i + 1)), 'Тип': types[i % 3], 'Артикул': f'SKU-{i:04d}'} for i in range(count)]
+
+@pytest.fixture
+def fake_model():
+    return FakeEmbeddingModel()
+
+@pytest.fixture
+def make_retriever(tmp_path, fake_model):
+    """Создает ретривер (новый экземпляр - как после перезапуска) над одним и тем же временным каталогом."""
+    def make(model: IEmbeddingModel = fake_model, index_config: dict | None = None) -> LocalKnowledgeBaseRetriever:
+        store_dir = str(tmp_path / 'store')
+        return LocalKnowledgeBaseRetriever(model, index_config or {'type': 'flat'}, meta_store=DocumentMetaStore(store_dir),
+                                           use_mmap=False, attribute_store=AttributeStore(store_dir),
+                                           index_dir=str(tmp_path / 'index'))
+    return make
@@ -0,0 +1,55 @@
+# tests/test_attributes.py
+
+import pytest
+
+from rag_system.core.attributes import AttributeStore, validate_filters, filters_key
+
+RECORDS = {
+    1: {'price': 100.0, 'type': 'simple'},
+    2: {'price': 250.5, 'type': 'variable'},
+    3: {'price': None, 'type': 'simple'},
+    4: {'price': 0.1 + 0.2, 'type': 'variation'},
+    5: {'price': 1000.0, 'type': None},
+}
+
+@pytest.fixture
+def store(tmp_path):
+    store = AttributeStore(str(tmp_path))
+    store.upsert(RECORDS)
+    return store
+
+def test_select_by_price_and_type(store):
+    assert store.select(None) is None
+    assert store.select({'price_min': 100, 'price_max': 250.5}).tolist() == [1, 2]
+    assert store.select({'price_max': 0.30000000000000004}).tolist() == [4]
+    assert store.select({'type': 'simple'}).tolist() == [1, 3]
+    assert store.select({'type': ['simple', 'variation'], 'price_min': 0}).tolist() == [1, 4]
+    # Документ без цены не проходит ценовой фильтр
+    assert 3 not in store.select({'price_min': 0}).tolist()
+
+def test_selection_cache_is_reset_on_write(store):
+    first = store.select({'type': 'simple'})
+    assert store.select({'type': 'simple'}) is first
+    version = store.version
+    store.upsert({6: {'price': 5.0, 'type': 'simple'}})
+    assert store.version == version + 1
+    assert store.select({'type': 'simple'}).tolist() == [1, 3, 6]
+    assert store.upsert({6: {'price': 5.0, 'type': 'simple'}}) == 0
+
+def test_remove_and_reopen(store, tmp_path):
+    assert store.remove([2, 99]) == 1
+    reopened = AttributeStore(str(tmp_path))
+    assert reopened.labels().tolist() == [1, 3, 4, 5]
+    assert reopened.select({'price_min': 1000}).tolist() == [5]
+
+@pytest.mark.parametrize('filters', [
+    {'color': 'red'}, {'price_min': 'дешево'}, {'type': 'unknown'}, {'type': []}, {'type': 5}, ['price_min'],
+])
+def test_invalid_filters_raise(filters):
+    with pytest.raises(ValueError):
+        validate_filters(filters)
+
+def test_filters_key_normalizes():
+    assert filters_key({}) is None
+    assert filters_key({'type': 'simple', 'price_max': '1 000'}) == filters_key({'price_max': 1000, 'type': ['simple']})
+    assert validate_filters({'price_min': '1,5'}) == {'price_min': 1.5}
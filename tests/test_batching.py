@@ -0,0 +1,97 @@
+# tests/test_batching.py
+
+import threading
+
+import pytest
+
+from rag_system.core.batching import MicroBatchingRetriever
+from tests.conftest import make_documents
+
+class RecordingRetriever:
+    """Ретривер-заглушка: запоминает вызовы retrieve_batch и возвращает top_k документов с текстом запроса."""
+    model_name = 'recording'
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def retrieve_batch(self, queries, top_k, filters=None):
+        self.started.set()
+        self.release.wait()
+        self.calls.append((list(queries), top_k, filters))
+        if any(query == 'ошибка' for query in queries):
+            raise RuntimeError("сбой поиска")
+        return [[{'id': i, 'text': query, 'score': 1.0} for i in range(top_k)] for query in queries]
+
+def test_concurrent_queries_share_one_batch():
+    retriever = RecordingRetriever()
+    batcher = MicroBatchingRetriever(retriever, max_batch_size=4, max_wait_ms=5000)
+    try:
+        futures = [batcher.submit(f'запрос {i}', top_k=i + 1) for i in range(4)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.close()
+    assert retriever.calls == [([f'запрос {i}' for i in range(4)], 4, None)]
+    # Каждый вызывающий получает свой top_k
+    assert [len(result) for result in results] == [1, 2, 3, 4]
+    assert results[2][0]['text'] == 'запрос 2'
+
+def test_queries_are_grouped_by_filters():
+    retriever = RecordingRetriever()
+    batcher = MicroBatchingRetriever(retriever, max_batch_size=3, max_wait_ms=5000)
+    try:
+        futures = [batcher.submit('a', 2, {'type': 'simple'}), batcher.submit('b', 2),
+                   batcher.submit('c', 1, {'type': ['simple']})]
+        for future in futures:
+            future.result(timeout=5)
+    finally:
+        batcher.close()
+    assert sorted(retriever.calls, key=lambda call: call[0]) == [
+        (['a', 'c'], 2, {'type': ('simple',)}), (['b'], 2, None)]
+
+def test_errors_reach_the_callers_of_their_group():
+    retriever = RecordingRetriever()
+    batcher = MicroBatchingRetriever(retriever, max_batch_size=2, max_wait_ms=5000)
+    try:
+        failing = batcher.submit('ошибка', 1, {'type': 'simple'})
+        ok = batcher.submit('нормальный', 1)
+        with pytest.raises(RuntimeError, match='сбой поиска'):
+            failing.result(timeout=5)
+        assert ok.result(timeout=5)[0]['text'] == 'нормальный'
+        with pytest.raises(ValueError):
+            batcher.submit('запрос', 1, {'type': 'unknown'})
+    finally:
+        batcher.close()
+
+def test_close_finishes_queued_queries_and_rejects_new():
+    retriever = RecordingRetriever()
+    retriever.release.clear()
+    batcher = MicroBatchingRetriever(retriever, max_batch_size=1, max_wait_ms=0)
+    first = batcher.submit('первый')
+    # Пока первый батч выполняется, второй запрос остается в очереди
+    assert retriever.started.wait(timeout=5)
+    pending = batcher.submit('второй')
+    closer = threading.Thread(target=batcher.close)
+    closer.start()
+    retriever.release.set()
+    closer.join(timeout=5)
+    assert first.result(timeout=5)[0]['text'] == 'первый'
+    assert pending.result(timeout=0)[0]['text'] == 'второй'
+    with pytest.raises(RuntimeError):
+        batcher.submit('третий')
+
+def test_batched_results_match_direct_retrieve(make_retriever):
+    documents = make_documents(20)
+    retriever = make_retriever()
+    retriever.sync_documents(documents)
+    queries = [doc['desc'] for doc in documents[:6]]
+    batcher = MicroBatchingRetriever(retriever, max_batch_size=6, max_wait_ms=5000)
+    try:
+        futures = [batcher.submit(query, 3) for query in queries]
+        batched = [future.result(timeout=5) for future in futures]
+    finally:
+        batcher.close()
+    assert batched == [retriever.retrieve(query, 3) for query in queries]
+    assert [result[0]['id'] for result in batched] == [1, 2, 3, 4, 5, 6]
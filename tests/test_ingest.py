@@ -0,0 +1,35 @@
+# tests/test_ingest.py
+
+import io
+import json
+
+import pytest
+
+from rag_system.core.ingest import IngestionPipeline, _iter_json_array
+from rag_system.core.lexical import LexicalIndex
+from tests.conftest import make_documents
+
+@pytest.mark.parametrize('read_size', [1, 7, 1 << 16])
+def test_iter_json_array_matches_documents_key(read_size):
+    documents = make_documents(5)
+    wrapper = {'name': 'documents', 'tags': ['documents'], 'count': 12345, 'documents': documents}
+    assert list(_iter_json_array(io.StringIO(json.dumps(wrapper, ensure_ascii=False)), read_size)) == documents
+    assert list(_iter_json_array(io.StringIO(json.dumps(documents)), read_size)) == documents
+    with pytest.raises(ValueError):
+        list(_iter_json_array(io.StringIO('{"name": "documents"}'), read_size))
+
+def test_pipeline_builds_vector_and_lexical_indexes(tmp_path, make_retriever, fake_model):
+    documents = make_documents(25)
+    source = tmp_path / 'export.jsonl'
+    source.write_text('\n'.join(json.dumps(doc, ensure_ascii=False) for doc in documents), encoding='utf-8')
+    lexical_index = LexicalIndex(str(tmp_path / 'lexical'))
+    retriever = make_retriever()
+    pipeline = IngestionPipeline([retriever], chunk_size=4, checkpoint_every=10, workers=0,
+                                 progress_path=str(tmp_path / 'progress.json'), lexical_index=lexical_index)
+    assert pipeline.run(str(source)) == 25
+
+    assert retriever.document_count == 25
+    assert [doc['id'] for doc in make_retriever().retrieve(documents[3]['desc'], 1)] == [4]
+    assert lexical_index.fingerprint == LexicalIndex.compute_fingerprint(documents)
+    assert lexical_index.lookup_sku('sku-0007') == [8]
+    assert json.loads((tmp_path / 'progress.json').read_text())['finished']
@@ -0,0 +1,61 @@
+# tests/test_lexical.py
+
+import numpy as np
+
+from rag_system.core.lexical import LexicalIndex, LexicalIndexBuilder, normalize_sku, tokenize
+
+DOCUMENTS = [
+    {'ID': 1, 'name': 'Гантель разборная 20 кг', 'Артикул': 'GR-20', 'desc': 'Гантель с хромированным грифом.'},
+    {'ID': 2, 'name': 'Коврик для йоги', 'Артикул': 'YM-6', 'desc': 'Коврик 6 мм, нескользящий.'},
+    {'ID': 3, 'name': 'Скакалка скоростная', 'Артикул': 'jr 1', 'desc': 'Скакалка со стальным тросом.'},
+    {'name': 'Документ без ID'},
+]
+
+def test_tokenize_and_normalize_sku():
+    assert tokenize('Гантель GR-20, 20 КГ') == ['гантель', 'gr', '20', '20', 'кг']
+    assert normalize_sku('  GR-20 ') == normalize_sku('gr-20')
+    assert normalize_sku('jr  1') == 'jr 1'
+
+def test_bm25_ranking_and_filter(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.build(DOCUMENTS)
+    assert len(index) == 3
+    assert [label for label, _ in index.search('коврик для йоги', 3)] == [2]
+    assert index.search('скакалка гантель', 3)[0][0] in (1, 3)
+    assert index.search('скакалка гантель', 3, allowed_labels=np.array([3], dtype='int64'))[0][0] == 3
+    assert index.search('неизвестное слово', 3) == []
+
+def test_sku_lookup(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.build(DOCUMENTS)
+    assert index.lookup_sku('gr-20') == [1]
+    assert index.lookup_sku(' JR  1 ') == [3]
+    assert index.lookup_sku('гантель') == []
+
+def test_sync_rebuilds_only_on_change_and_persists(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    assert index.sync(DOCUMENTS)
+    assert not index.sync(DOCUMENTS)
+    changed = DOCUMENTS[:2] + [dict(DOCUMENTS[2], name='Скакалка обычная')]
+    assert index.sync(changed)
+
+    reloaded = LexicalIndex(str(tmp_path))
+    assert reloaded.fingerprint == LexicalIndex.compute_fingerprint(changed)
+    assert [label for label, _ in reloaded.search('обычная', 3)] == [3]
+
+def test_builder_matches_build(tmp_path):
+    builder = LexicalIndexBuilder()
+    for doc in DOCUMENTS:
+        builder.add(doc)
+    streamed = LexicalIndex(str(tmp_path / 'streamed'))
+    builder.finish(streamed)
+    built = LexicalIndex(str(tmp_path / 'built'))
+    built.build(DOCUMENTS)
+    assert streamed.fingerprint == built.fingerprint
+    assert streamed.search('гантель коврик', 3) == built.search('гантель коврик', 3)
+
+def test_documents_without_tokens(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.build([{'ID': 1, 'price': '100'}])
+    assert len(index) == 1 and index.avg_doc_length == 0.0
+    assert index.search('гантель', 3) == []
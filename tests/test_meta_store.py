@@ -0,0 +1,39 @@
+# tests/test_meta_store.py
+
+from rag_system.core.meta_store import DocumentMetaStore, convert_json_meta
+
+def test_upsert_get_and_reopen(tmp_path):
+    store = DocumentMetaStore(str(tmp_path))
+    assert store.upsert({5: {'id': 5, 'desc': 'пять'}, 1: {'id': 'a-1', 'desc': 'один'}}) == 2
+    assert len(store) == 2 and 5 in store and 2 not in store
+    assert store.labels().tolist() == [1, 5]
+    assert store.get_many([5, 2, 1]) == [{'id': 5, 'desc': 'пять'}, None, {'id': 'a-1', 'desc': 'один'}]
+
+    reopened = DocumentMetaStore(str(tmp_path))
+    assert reopened.get(1) == {'id': 'a-1', 'desc': 'один'}
+
+def test_upsert_skips_unchanged_and_replaces_changed(tmp_path):
+    store = DocumentMetaStore(str(tmp_path))
+    store.upsert({1: {'id': 1, 'desc': 'старый'}, 2: {'id': 2, 'desc': 'другой'}})
+    assert store.upsert({1: {'id': 1, 'desc': 'старый'}, 2: {'id': 2, 'desc': 'другой'}}) == 0
+    assert store.upsert({1: {'id': 1, 'desc': 'новый'}, 2: {'id': 2, 'desc': 'другой'}}) == 1
+    assert store.get(1)['desc'] == 'новый'
+    assert len(store) == 2
+
+def test_remove_and_compaction_keep_live_records(tmp_path):
+    store = DocumentMetaStore(str(tmp_path))
+    store.upsert({label: {'id': label, 'desc': 'x' * 1000} for label in range(100)})
+    for version in range(3):
+        store.upsert({label: {'id': label, 'desc': f'{version}' * 1000} for label in range(100)})
+    assert store.remove([0, 1, 500]) == 2
+    assert len(store) == 98 and store.get(0) is None
+    assert store.get(50) == {'id': 50, 'desc': '2' * 1000}
+    assert DocumentMetaStore(str(tmp_path)).get(99) == {'id': 99, 'desc': '2' * 1000}
+
+def test_convert_json_meta_positional(tmp_path):
+    json_path = tmp_path / 'documents_meta.json'
+    json_path.write_text('[{"id": 10, "desc": "первый"}, {"id": 7, "desc": "второй", "hash": 42}]', encoding='utf-8')
+    store = DocumentMetaStore(str(tmp_path / 'store'))
+    hashes = convert_json_meta(str(json_path), store, positional=True)
+    assert list(hashes) == [0, 1] and hashes[1] == 42
+    assert store.get(0) == {'id': 10, 'desc': 'первый'}
@@ -0,0 +1,40 @@
+# tests/test_onnx_parity.py
+#
+# Паритет ONNX бэкенда с SentenceTransformer на небольшом наборе текстов (индекс FAISS строится в памяти).
+# Пропускается без onnxruntime/sentence-transformers или если модель недоступна (нет сети и локального кэша).
+
+import pytest
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('sentence_transformers')
+
+from rag_system.benchmarks.onnx_parity import compare_embeddings
+from rag_system.config import SECONDARY_RETRIEVER_MODEL, ONNX_QUANTIZE
+from rag_system.models.embeddings import SentenceTransformerEmbeddingModel
+from rag_system.models.onnx_embeddings import OnnxEmbeddingModel
+
+CORPUS = [
+    "Гимнастические кольца (пара) без строп, внутренний диаметр 18 см.",
+    "Стойка для кроссфита на 12 человек, расширенная конфигурация.",
+    "Брусья для стойки, подходят к любой стойке для кроссфита.",
+    "Гантель разборная 20 кг с хромированным грифом.",
+    "Коврик для йоги 6 мм, нескользящее покрытие.",
+    "Скакалка скоростная со стальным тросом и подшипниками.",
+    "Турник настенный для дома, нагрузка до 150 кг.",
+    "Штанга олимпийская 20 кг, длина 220 см.",
+]
+QUERIES = ["гимнастические кольца", "стойка для кроссфита", "разборная гантель", "коврик для йоги",
+           "скакалка", "турник на стену", "олимпийская штанга", "брусья"]
+
+def test_onnx_matches_sentence_transformers(tmp_path):
+    reference = SentenceTransformerEmbeddingModel(SECONDARY_RETRIEVER_MODEL)
+    if reference.get_dimension() == 0:
+        pytest.skip(f"Модель '{SECONDARY_RETRIEVER_MODEL}' недоступна.")
+    # Экспорт ONNX во временный каталог: тест не трогает ONNX_MODELS_DIR
+    candidate = OnnxEmbeddingModel(SECONDARY_RETRIEVER_MODEL, onnx_dir=str(tmp_path), quantize=ONNX_QUANTIZE)
+    if candidate.get_dimension() == 0:
+        pytest.skip(f"Не удалось экспортировать '{SECONDARY_RETRIEVER_MODEL}' в ONNX.")
+
+    parity = compare_embeddings(reference, candidate, CORPUS, QUERIES, top_k=3)
+    assert parity['cosine_mean'] >= 0.98
+    assert parity['overlap'] >= 0.9
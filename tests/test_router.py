@@ -0,0 +1,48 @@
+# tests/test_router.py
+
+from rag_system.core.router import QueryRouter, detect_scripts, merge_results
+
+MULTI, ENGLISH = 'multilingual', 'english'
+MODEL_SCRIPTS = {MULTI: ('cyrillic', 'latin'), ENGLISH: ('latin',)}
+
+def make_router(tmp_path, **kwargs) -> QueryRouter:
+    return QueryRouter(MODEL_SCRIPTS, {'cyrillic': MULTI, 'latin': MULTI}, MULTI,
+                       classifier_path=str(tmp_path / 'router.json'), **kwargs)
+
+def test_detect_scripts():
+    assert detect_scripts('Гантель Torres 20 кг') == {'cyrillic': 9, 'latin': 6}
+    assert detect_scripts('12-345') == {}
+
+def test_routes_by_script_without_classifier(tmp_path):
+    router = make_router(tmp_path)
+    assert router.route('гантель').model_names == [MULTI]
+    assert router.route('dumbbell').model_names == [MULTI]
+    decision = router.route('SKU 123')
+    assert decision.model_name == MULTI and decision.reason == 'script'
+    assert router.route('12345').reason == 'default'
+
+def test_trained_classifier_is_saved_and_loaded(tmp_path):
+    router = make_router(tmp_path)
+    queries = ['yoga mat', 'yoga mat thick', 'jump rope', 'speed rope', 'гантель', 'гантели 10 кг']
+    models = [ENGLISH, ENGLISH, ENGLISH, ENGLISH, MULTI, MULTI]
+    router.train(queries, models)
+    decision = router.route('yoga rope')
+    assert decision.model_name == ENGLISH and decision.reason == 'classifier'
+    # Кириллицу понимает только многоязычная модель, классификатор не нужен
+    assert router.route('коврик').reason == 'script'
+
+    reloaded = make_router(tmp_path)
+    assert reloaded.classifier.is_trained
+    assert reloaded.route('yoga rope').model_name == ENGLISH
+
+def test_fanout_on_low_confidence(tmp_path):
+    router = make_router(tmp_path, confidence_threshold=0.99, fanout=True)
+    router.train(['mat', 'rope'], [ENGLISH, MULTI], save=False)
+    decision = router.route('weights')
+    assert decision.reason == 'fanout' and sorted(decision.model_names) == [ENGLISH, MULTI]
+
+def test_merge_results_rrf():
+    first = [{'id': 1, 'text': 'a', 'score': 0.9}, {'id': 2, 'text': 'b', 'score': 0.8}]
+    second = [{'id': 2, 'text': 'b', 'score': 0.7}, {'id': 3, 'text': 'c', 'score': 0.6}]
+    merged = merge_results([first, second], top_k=2)
+    assert [doc['id'] for doc in merged] == [2, 1]
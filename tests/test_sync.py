@@ -0,0 +1,85 @@
+# tests/test_sync.py
+
+import json
+
+import faiss
+import pytest
+
+from rag_system.core.documents import extract_text
+from rag_system.models.cached_embeddings import CachedEmbeddingModel
+from tests.conftest import make_documents
+
+def found_ids(results: list[dict]) -> list:
+    return [doc['id'] for doc in results]
+
+def test_sync_encodes_only_changes(make_retriever, fake_model):
+    documents = make_documents(30)
+    retriever = make_retriever()
+    assert retriever.sync_documents(documents) == {'added': 30, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    assert len(fake_model.encoded_texts) == 30
+    assert found_ids(retriever.retrieve(documents[7]['desc'], 1)) == [8]
+
+    fake_model.calls.clear()
+    assert retriever.sync_documents(documents) == {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 30}
+    assert fake_model.calls == []
+
+    changed = documents[1:]
+    changed[0] = dict(changed[0], desc='совершенно новое описание')
+    changed.append({'ID': 'new-1', 'desc': 'строковый идентификатор', 'price': '5', 'Тип': 'simple'})
+    assert retriever.sync_documents(changed) == {'added': 1, 'updated': 1, 'removed': 1, 'unchanged': 28}
+    assert sorted(fake_model.encoded_texts) == sorted(['совершенно новое описание', 'строковый идентификатор'])
+    assert retriever.document_count == 30
+    assert found_ids(retriever.retrieve('строковый идентификатор', 1)) == ['new-1']
+    assert 1 not in found_ids(retriever.retrieve(documents[0]['desc'], 30))
+
+def test_index_is_reloaded_after_restart(make_retriever, fake_model):
+    documents = make_documents(10)
+    make_retriever().sync_documents(documents)
+    fake_model.calls.clear()
+    restarted = make_retriever()
+    assert restarted.document_count == 10
+    assert restarted.sync_documents(documents)['unchanged'] == 10
+    assert fake_model.encoded_texts == []
+
+def test_documents_bypass_query_cache(make_retriever, fake_model):
+    cached = CachedEmbeddingModel(fake_model, max_entries=100, max_batch_size=64)
+    retriever = make_retriever(cached)
+    retriever.sync_documents(make_documents(5))
+    assert cached.get_stats()['size'] == 0
+    retriever.retrieve('описание товара', 1)
+    retriever.retrieve('описание товара', 1)
+    assert cached.get_stats()['size'] == 1 and cached.get_stats()['hits'] == 1
+
+def test_filtered_retrieve(make_retriever):
+    documents = make_documents(30)
+    retriever = make_retriever()
+    retriever.sync_documents(documents)
+    results = retriever.retrieve('описание товара', 30, {'type': 'variable', 'price_max': 1500})
+    assert sorted(found_ids(results)) == [2, 5, 8, 11, 14]
+    with pytest.raises(ValueError):
+        retriever.retrieve('описание товара', 3, {'type': []})
+
+def test_legacy_positional_index_is_migrated(tmp_path, make_retriever, fake_model):
+    documents = make_documents(12)
+    texts = [extract_text(doc) for doc in documents]
+    # Старый формат: индекс без IDMap (метка - позиция) и documents_meta.json
+    index_dir = tmp_path / 'index'
+    index_dir.mkdir()
+    legacy = faiss.IndexFlatIP(fake_model.get_dimension())
+    legacy.add(fake_model.encode(texts))
+    faiss.write_index(legacy, str(index_dir / 'faiss_index.bin'))
+    (index_dir / 'documents_meta.json').write_text(
+        json.dumps([{'id': doc['ID'], 'desc': text} for doc, text in zip(documents, texts)], ensure_ascii=False), encoding='utf-8')
+    fake_model.calls.clear()
+
+    retriever = make_retriever()
+    assert retriever.document_count == 12 and not retriever._is_id_mapped()
+    changed = documents[:-1]
+    changed[0] = dict(changed[0], desc='обновленное описание')
+    retriever.sync_documents(changed)
+
+    assert retriever._is_id_mapped()
+    assert sorted(retriever.indexed_labels().tolist()) == list(range(1, 12))
+    # Неизменные векторы переиспользуются, кодируется только измененный документ
+    assert fake_model.encoded_texts == ['обновленное описание']
+    assert found_ids(make_retriever().retrieve(texts[5], 1)) == [6]